@@ -0,0 +1,23 @@
+# 複数の都道府県のスパイダーを1つのプロセス (リアクター) で並行して実行する
+# 使い方 (crawler ディレクトリで実行):
+#   python -m crawler.crawl_all [スパイダー名 ...]
+# スパイダー名を省略した場合は、すべてのスパイダーを実行する
+import sys
+
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+
+def crawl_all(spider_names=None):
+    """
+    指定したスパイダーを同時に開始し、すべて終了するまで待ちます。
+    (リクエストの間隔はドメインごとに AutoThrottle で調整される)
+    """
+    process = CrawlerProcess(get_project_settings())
+    for name in spider_names or process.spider_loader.list():
+        process.crawl(name)
+    process.start()
+
+
+if __name__ == "__main__":
+    crawl_all(sys.argv[1:])
@@ -0,0 +1,111 @@
+import copy
+import threading
+
+import firebase_admin
+from firebase_admin import firestore
+
+# get_all() で一度に取得するドキュメント数
+GET_ALL_CHUNK_SIZE = 300
+
+
+def get_client(backend="firestore"):
+    """
+    エクスポーターが使用するデータベースのクライアントを取得します。
+    backend: firestore (Cloud Firestore), memory (テスト・ベンチマーク用のインメモリ実装)
+    """
+    if backend == "memory":
+        return InMemoryFirestore()
+    if backend != "firestore":
+        raise ValueError("未知のバックエンドです: {}".format(backend))
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app()
+    return firestore.client()
+
+
+def fetch_documents(db, paths, chunk_size=GET_ALL_CHUNK_SIZE):
+    """
+    paths のドキュメントを chunk_size 件ずつまとめて取得し、
+    {パス: ドキュメントの内容} の辞書を返します。(存在しないドキュメントは含まない)
+    """
+    paths = list(paths)
+    documents = {}
+    for start in range(0, len(paths), chunk_size):
+        chunk = paths[start : start + chunk_size]
+        refs = [db.document(path) for path in chunk]
+        for snapshot in db.get_all(refs):
+            if snapshot.exists:
+                documents[snapshot.reference.path] = snapshot.to_dict()
+    return documents
+
+
+class InMemoryDocumentSnapshot(object):
+    def __init__(self, reference, data):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class InMemoryDocumentReference(object):
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+
+    def get(self):
+        self._client.read_count += 1
+        return InMemoryDocumentSnapshot(
+            self, self._client.documents.get(self.path)
+        )
+
+    def set(self, document_data):
+        self._client.write_count += 1
+        self._client.documents[self.path] = copy.deepcopy(dict(document_data))
+
+
+class InMemoryWriteBatch(object):
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, document_data):
+        self._writes.append((reference, copy.deepcopy(dict(document_data))))
+
+    def commit(self):
+        with self._client.lock:
+            for reference, document_data in self._writes:
+                reference.set(document_data)
+            self._client.commit_count += 1
+        self._writes = []
+
+
+class InMemoryFirestore(object):
+    """
+    Firestore クライアントのうち、エクスポーターが使用する機能のみを
+    インメモリで実装したクライアント (テスト・ベンチマーク用)
+    """
+
+    def __init__(self, documents=None):
+        # {パス: ドキュメントの内容}
+        self.documents = dict(documents or {})
+        # 読み込み・書き込みドキュメント数とコミット回数
+        self.read_count = 0
+        self.write_count = 0
+        self.commit_count = 0
+        # バッチを並行してコミットする場合の排他制御
+        self.lock = threading.Lock()
+
+    def document(self, path):
+        return InMemoryDocumentReference(self, path)
+
+    def batch(self):
+        return InMemoryWriteBatch(self)
+
+    def get_all(self, references):
+        for reference in references:
+            yield reference.get()
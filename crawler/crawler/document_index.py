@@ -0,0 +1,79 @@
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+from w3lib.url import canonicalize_url
+
+# 索引に保存する項目
+INDEX_FIELDS = ["file_name", "pref_code", "pref_name", "label", "href"]
+
+
+def document_fingerprint(url):
+    """
+    報道資料の URL のフィンガープリントを取得します。(正規化した URL のハッシュ値)
+    """
+    return hashlib.sha1(canonicalize_url(url).encode("utf-8")).hexdigest()
+
+
+class DocumentIndex(object):
+    """
+    取得済みの報道資料のメタデータを URL のフィンガープリントごとに記録する索引
+    (クロールをまたいで同じ報道資料へのリクエストを省略するために使用する)
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents "
+            "(fingerprint TEXT PRIMARY KEY, file_name TEXT, "
+            "pref_code INTEGER, pref_name TEXT, label TEXT, href TEXT, "
+            "last_modified TEXT)"
+        )
+        self.conn.commit()
+
+    def get(self, fingerprint):
+        """
+        フィンガープリントに対応するメタデータを辞書で返します。(未登録の場合は None)
+        """
+        row = self.conn.execute(
+            "SELECT {}, last_modified FROM documents "
+            "WHERE fingerprint = ?".format(", ".join(INDEX_FIELDS)),
+            (fingerprint,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        record = dict(zip(INDEX_FIELDS, row[:-1]))
+        record["last_modified"] = None
+        if row[-1]:
+            record["last_modified"] = datetime.fromisoformat(row[-1])
+        return record
+
+    def update(self, items):
+        """
+        {フィンガープリント: 報道資料の項目} を記録します。
+        """
+        rows = []
+        for fingerprint, item in items.items():
+            last_modified = item.get("last_modified")
+            if last_modified:
+                last_modified = last_modified.isoformat()
+            rows.append(
+                (fingerprint,)
+                + tuple(item.get(field) for field in INDEX_FIELDS)
+                + (last_modified,)
+            )
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO documents "
+                "(fingerprint, {}, last_modified) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)".format(", ".join(INDEX_FIELDS)),
+                rows,
+            )
+
+    def close(self):
+        self.conn.close()
@@ -1,11 +1,51 @@
-from firebase_admin import firestore
+import heapq
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
 from scrapy.exporters import CsvItemExporter
 
+from crawler.database import fetch_documents
+from crawler.manifest import compute_hash
+from crawler.utils import merge_labels
+from crawler.writer import FirestoreBatchWriter
+
+# スピルファイルに書き出すまでにメモリに保持する項目数
+DEFAULT_SPILL_SIZE = 1000
+# Firestore への書き込みを待つスピルの上限
+#   (超えた場合は古いスピルの書き込みの完了を待ち、メモリの使用量を抑える)
+MAX_PENDING_SPILLS = 2
+
+
+class Covid19FirestoreExporter(CsvItemExporter):
+    """
+    CSV 出力と同時に、既存ドキュメントとの差分がある項目を Firestore に書き込む
+    エクスポーターの基底クラス
+    受け取った項目は spill_size 件ごとに並べ替えてスピルファイルに書き出し、
+    Firestore への書き込みはワーカースレッドに任せる
+    (リアクターのスレッドでネットワークの待ち合わせをしないため。
+    既存ドキュメントはまとめて取得する)
+    CSV は finish_exporting でスピルファイルをマージして出力する (外部マージソート)
+    manifest を指定した場合、前回書き込んだ内容から変化していない項目は
+    Firestore の読み込み・書き込みを省略する
+    """
 
-class Covid19PatientsExporter(CsvItemExporter):
     def __init__(
-        self, file, include_headers_line=True, join_multivalued=",", **kwargs
+        self,
+        file,
+        db=None,
+        manifest=None,
+        writer_options=None,
+        spill_size=DEFAULT_SPILL_SIZE,
+        include_headers_line=True,
+        join_multivalued=",",
+        **kwargs
     ):
+        self.db = db
+        self.manifest = manifest
+        # FirestoreBatchWriter のオプション (バッチサイズ・ワーカー数など)
+        self.writer_options = writer_options or {}
+        self.spill_size = spill_size
         super().__init__(
             file,
             include_headers_line=include_headers_line,
@@ -15,88 +55,177 @@ class Covid19PatientsExporter(CsvItemExporter):
 
     def start_exporting(self):
         self.items = []
+        # 並べ替え済みのスピルファイルのリスト
+        self.runs = []
+        on_commit = None
+        if self.manifest is not None:
+            on_commit = self.update_manifest
+        self.writer = FirestoreBatchWriter(
+            self.db, on_commit=on_commit, **self.writer_options
+        )
+        # スピルごとの Firestore への書き込みを順に実行するワーカー
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.spill_futures = []
 
     def export_item(self, item):
-        self.items.append(item)
-
-    def finish_exporting(self):
-        self.items.sort(key=lambda x: int(x["pref_patient_no"]))
-        db = firestore.client()
-        batch = db.batch()
-        batch_set_count = 0
+        self.items.append(self.prepare_item(dict(item)))
+        if len(self.items) >= self.spill_size:
+            self.spill()
+
+    def prepare_item(self, item):
+        return item
+
+    def sort_key(self, item):
+        raise NotImplementedError
+
+    def get_document_path(self, item):
+        raise NotImplementedError
+
+    def spill(self):
+        """
+        メモリ上の項目を並べ替えてスピルファイルに書き出し、
+        Firestore への書き込みをワーカーに登録します。
+        """
+        if not self.items:
+            return
+        self.items.sort(key=self.sort_key)
+        run = tempfile.TemporaryFile()
         for item in self.items:
-            super().export_item(item)
-
-            if batch_set_count >= 100:
-                batch.commit()
-                batch_set_count = 0
-
-            item = dict(item)
-            doc_ref = db.document(
-                "Covid19Challenge/Patients/{}/{:08}".format(
-                    item["pref_code"], int(item["pref_patient_no"])
-                )
-            )
-            doc = doc_ref.get().to_dict() or {}
-            if doc:
-                del doc["isChecked"]
-
-            if item.items() - doc.items():
-                # 差分がある場合
-                item["isChecked"] = False
-                batch.set(doc_ref, item)
-                batch_set_count += 1
-
-        if batch_set_count > 0:
-            batch.commit()
+            pickle.dump(item, run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self.runs.append(run)
 
-
-class Covid19DocumentsExporter(CsvItemExporter):
-    def __init__(
-        self, file, include_headers_line=True, join_multivalued=",", **kwargs
-    ):
-        super().__init__(
-            file,
-            include_headers_line=include_headers_line,
-            join_multivalued=join_multivalued,
-            **kwargs
+        self.spill_futures.append(
+            self.executor.submit(self.write_documents, self.items)
         )
-
-    def start_exporting(self):
         self.items = []
+        self.wait_spills(MAX_PENDING_SPILLS)
+
+    def wait_spills(self, limit):
+        """
+        書き込み中のスピルが limit 件以下になるまで待ちます。
+        (書き込みに失敗したスピルがある場合は例外を送出する)
+        """
+        while self.spill_futures and (
+            len(self.spill_futures) > limit or self.spill_futures[0].done()
+        ):
+            self.spill_futures.pop(0).result()
+
+    def write_documents(self, items):
+        # (ワーカースレッドで実行する)
+        # 同じドキュメントへの書き込みは最後の項目のみとする
+        targets = {}
+        for item in items:
+            targets[self.get_document_path(item)] = item
+        hashes = {path: compute_hash(item) for path, item in targets.items()}
+
+        # 以前のスピルから同じドキュメントへの書き込みがコミット中の場合は、
+        # 完了 (マニフェストの更新を含む) を待ってから差分を判定する
+        #   (ドキュメントごとの書き込み順序を保証する)
+        self.writer.wait(targets)
+
+        # 前回から内容が変化していない項目を除外
+        if self.manifest is not None:
+            known_hashes = self.manifest.get_hashes(list(targets))
+            targets = {
+                path: item
+                for path, item in targets.items()
+                if known_hashes.get(path) != hashes[path]
+            }
+        documents = fetch_documents(self.db, list(targets))
+
+        unchanged = {}
+        for path, item in targets.items():
+            doc = documents.get(path) or {}
+            doc.pop("isChecked", None)
 
-    def export_item(self, item):
-        self.items.append(item)
+            if item.items() - doc.items():
+                # 差分がある場合
+                #   (マニフェストはコミット後に update_manifest で更新する)
+                item = dict(item, isChecked=False)
+                self.writer.set(path, item, hashes[path])
+            else:
+                unchanged[path] = hashes[path]
+
+        # 書き込み不要と確認した項目はすぐにマニフェストを更新
+        if self.manifest is not None and unchanged:
+            self.manifest.update(unchanged)
+
+    def update_manifest(self, committed):
+        # コミットしたドキュメントのハッシュ値を記録
+        #   (書き込みのワーカースレッドから呼び出される)
+        self.manifest.update(dict(committed))
+
+    def _read_run(self, run):
+        while True:
+            try:
+                yield pickle.load(run)
+            except EOFError:
+                return
+
+    def merge_runs(self):
+        """
+        スピルファイルをマージして、並べ替え済みの項目を順に返します。
+        """
+        return heapq.merge(
+            *[self._read_run(run) for run in self.runs], key=self.sort_key
+        )
 
     def finish_exporting(self):
-        self.items.sort(key=lambda x: (x["last_modified"], x["file_name"]))
-
-        db = firestore.client()
-        batch = db.batch()
-        batch_set_count = 0
+        try:
+            self.spill()
+            self.wait_spills(0)
+        finally:
+            self.executor.shutdown()
+            self.writer.close()
+
+        try:
+            for item in self.merge_runs():
+                super().export_item(item)
+        finally:
+            for run in self.runs:
+                run.close()
+            self.runs = []
+
+
+class Covid19PatientsExporter(Covid19FirestoreExporter):
+    def sort_key(self, item):
+        return int(item["pref_patient_no"])
+
+    def get_document_path(self, item):
+        return "Covid19Challenge/Patients/{}/{:08}".format(
+            item["pref_code"], int(item["pref_patient_no"])
+        )
 
-        for item in self.items:
-            super().export_item(item)
-
-            if batch_set_count >= 100:
-                batch.commit()
-                batch_set_count = 0
-
-            item = dict(item)
-            doc_ref = db.document(
-                "Covid19Challenge/Documents/{}/{}".format(
-                    item["pref_code"], item["file_name"]
-                )
-            )
-            doc = doc_ref.get().to_dict() or {}
-            if doc:
-                del doc["isChecked"]
 
-            if item.items() - doc.items():
-                # 差分がある場合
-                item["isChecked"] = False
-                batch.set(doc_ref, item)
-                batch_set_count += 1
-
-        if batch_set_count > 0:
-            batch.commit()
+class Covid19DocumentsExporter(Covid19FirestoreExporter):
+    def start_exporting(self):
+        super().start_exporting()
+        # ドキュメントごとの統合済みのラベル {パス: ラベル}
+        self.labels = {}
+
+    def prepare_item(self, item):
+        # 同じファイル名 (同じドキュメント) の項目はラベルを統合する
+        #   (Firestore には統合済みのラベルで上書きし、CSV には1件のみ出力する)
+        path = self.get_document_path(item)
+        item["label"] = merge_labels(self.labels.get(path), item.get("label"))
+        self.labels[path] = item["label"]
+        return item
+
+    def merge_runs(self):
+        exported = set()
+        for item in super().merge_runs():
+            path = self.get_document_path(item)
+            if path in exported:
+                continue
+            exported.add(path)
+            item["label"] = self.labels[path]
+            yield item
+
+    def sort_key(self, item):
+        return (item["last_modified"], item["file_name"])
+
+    def get_document_path(self, item):
+        return "Covid19Challenge/Documents/{}/{}".format(
+            item["pref_code"], item["file_name"]
+        )
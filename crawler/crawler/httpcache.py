@@ -0,0 +1,199 @@
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from scrapy.utils.request import request_fingerprint
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+# 書き込みをまとめてコミットする件数
+COMMIT_INTERVAL = 100
+# 容量超過時に、上限のこの割合まで古いレスポンスを削除する
+EVICTION_TARGET_RATE = 0.9
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCacheStorage(object):
+    """
+    レスポンスを1つの SQLite ファイルに保存する HTTP キャッシュストレージ
+    - ヘッダと本文は zlib で圧縮して保存する
+    - リクエストのフィンガープリントを主キーとして検索する
+    - HTTPCACHE_SQLITE_MAX_BYTES を超えた場合、最終参照日時が古い順に削除する
+    - スパイダー終了時にヒット率などの統計情報を出力する
+    """
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"], createdir=True)
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.max_bytes = settings.getint("HTTPCACHE_SQLITE_MAX_BYTES")
+        self.compression_level = settings.getint(
+            "HTTPCACHE_SQLITE_COMPRESSION_LEVEL", 6
+        )
+
+    def open_spider(self, spider):
+        path = os.path.join(self.cachedir, "{}.sqlite".format(spider.name))
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "fingerprint TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "status INTEGER NOT NULL, headers BLOB NOT NULL, "
+            "body BLOB NOT NULL, size INTEGER NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+            "ON responses (accessed_at)"
+        )
+        self.conn.commit()
+
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.pending_writes = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+        self.crawler_stats = getattr(spider.crawler, "stats", None)
+
+        logger.debug("Using sqlite cache storage in %s", path)
+
+    def close_spider(self, spider):
+        self.conn.commit()
+        count = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        self.conn.close()
+
+        self.report(count[0])
+
+    def report(self, count):
+        """
+        キャッシュの統計情報をログとクローラーの統計に出力します。
+        """
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        logger.info(
+            "HTTP キャッシュ: %d 件, %.1f MB, ヒット率 %.1f%% "
+            "(ヒット %d, ミス %d, 期限切れ %d, 保存 %d, 削除 %d)",
+            count,
+            self.total_bytes / (1024 * 1024),
+            hit_rate * 100,
+            self.stats["hits"],
+            self.stats["misses"],
+            self.stats["expired"],
+            self.stats["stores"],
+            self.stats["evictions"],
+        )
+        if self.crawler_stats is not None:
+            for key, value in self.stats.items():
+                self.crawler_stats.set_value(
+                    "httpcache/sqlite/{}".format(key), value
+                )
+            self.crawler_stats.set_value("httpcache/sqlite/entries", count)
+            self.crawler_stats.set_value(
+                "httpcache/sqlite/bytes", self.total_bytes
+            )
+
+    def retrieve_response(self, spider, request):
+        fingerprint = request_fingerprint(request)
+        row = self.conn.execute(
+            "SELECT url, status, headers, body, stored_at FROM responses "
+            "WHERE fingerprint = ?",
+            (fingerprint,),
+        ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+
+        url, status, headers, body, stored_at = row
+        now = time.time()
+        if 0 < self.expiration_secs < now - stored_at:
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+
+        self.conn.execute(
+            "UPDATE responses SET accessed_at = ? WHERE fingerprint = ?",
+            (now, fingerprint),
+        )
+        self._count_write()
+        self.stats["hits"] += 1
+
+        headers = Headers(headers_raw_to_dict(zlib.decompress(headers)))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        fingerprint = request_fingerprint(request)
+        headers = zlib.compress(
+            headers_dict_to_raw(response.headers), self.compression_level
+        )
+        body = zlib.compress(response.body, self.compression_level)
+        size = len(headers) + len(body)
+        now = time.time()
+
+        old = self.conn.execute(
+            "SELECT size FROM responses WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        if old is not None:
+            self.total_bytes -= old[0]
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (fingerprint, url, status, "
+            "headers, body, size, stored_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                fingerprint,
+                response.url,
+                response.status,
+                headers,
+                body,
+                size,
+                now,
+                now,
+            ),
+        )
+        self.total_bytes += size
+        self.stats["stores"] += 1
+        self._count_write()
+
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        合計サイズが上限の EVICTION_TARGET_RATE 以下になるまで、
+        最終参照日時が古いレスポンスを削除します。
+        """
+        target = self.max_bytes * EVICTION_TARGET_RATE
+        rows = self.conn.execute(
+            "SELECT fingerprint, size FROM responses ORDER BY accessed_at"
+        )
+        evicted = []
+        for fingerprint, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((fingerprint,))
+            self.total_bytes -= size
+        rows.close()
+
+        self.conn.executemany(
+            "DELETE FROM responses WHERE fingerprint = ?", evicted
+        )
+        self.conn.commit()
+        self.pending_writes = 0
+        self.stats["evictions"] += len(evicted)
+
+    def _count_write(self):
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_INTERVAL:
+            self.conn.commit()
+            self.pending_writes = 0
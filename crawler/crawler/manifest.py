@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+# IN 句で一度に問い合わせるパス数 (SQLite の変数の上限未満)
+QUERY_CHUNK_SIZE = 500
+
+
+def compute_hash(item):
+    """
+    項目の内容のハッシュ値を取得します。(キーの順序に依存しない)
+    """
+    data = json.dumps(
+        dict(item), sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class ExportManifest(object):
+    """
+    最後に書き込んだ (または書き込み不要と確認した) 項目の内容のハッシュ値を
+    ドキュメントのパスごとに記録するローカルのマニフェスト
+    (ハッシュ値が一致する項目は Firestore の読み込み・書き込みを省略できる)
+    エクスポーターのワーカースレッドや書き込みのワーカースレッドから
+    参照・更新するため、接続はロックで排他する
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest "
+            "(path TEXT PRIMARY KEY, hash TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get_hashes(self, paths):
+        """
+        paths のうち記録済みのパスのハッシュ値を {パス: ハッシュ値} で返します。
+        """
+        paths = list(paths)
+        hashes = {}
+        for start in range(0, len(paths), QUERY_CHUNK_SIZE):
+            chunk = paths[start : start + QUERY_CHUNK_SIZE]
+            query = (
+                "SELECT path, hash FROM manifest WHERE path IN ({})".format(
+                    ",".join("?" * len(chunk))
+                )
+            )
+            with self.lock:
+                rows = self.conn.execute(query, chunk).fetchall()
+            hashes.update(rows)
+        return hashes
+
+    def update(self, hashes):
+        """
+        {パス: ハッシュ値} を記録します。
+        """
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO manifest (path, hash) VALUES (?, ?)",
+                hashes.items(),
+            )
+
+    def close(self):
+        self.conn.close()
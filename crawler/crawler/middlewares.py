@@ -5,7 +5,18 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import hashlib
+import os
+import sqlite3
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+
+from crawler.items import Covid19ChallengeDocumentItem, Covid19ChallengeItem
+from crawler.manifest import compute_hash
+
+# キャッシュを再検証する HTTP キャッシュのポリシー
+RFC2616_POLICY = "scrapy.extensions.httpcache.RFC2616Policy"
 
 
 class Covid19ChallengeSpiderMiddleware(object):
@@ -101,3 +112,192 @@ class Covid19ChallengeDownloaderMiddleware(object):
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class IncrementalCrawlMiddleware(object):
+    """
+    前回のクロールで処理したレスポンスの検証子 (ETag, Last-Modified または
+    本文のハッシュ値) を URL ごとに記録し、変化していないページの処理を省略する
+    ダウンローダーミドルウェア
+
+    - ネットワークへのリクエストには条件付きリクエストのヘッダを付与し、
+      304 Not Modified が返された場合はコールバックを実行しない
+    - キャッシュから返されたレスポンスなども、検証子が前回と一致する場合は
+      コールバックを実行しない
+    - 検証子はクロールが正常に終了した場合のみ保存する
+    - HTTP キャッシュと併用する場合は、キャッシュを再検証する
+      RFC2616Policy が必要 (DummyPolicy では常にキャッシュが返され、
+      すべてのページが「変化なし」となるため)
+    """
+
+    def __init__(self, path, stats):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS validators "
+            "(url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "validator TEXT NOT NULL)"
+        )
+        self.conn.commit()
+        self.stats = stats
+        # 今回のクロールで取得した検証子 {url: (etag, last_modified, 検証子)}
+        self.pending = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("INCREMENTAL_CRAWL_ENABLED"):
+            raise NotConfigured
+        policy = settings.get("HTTPCACHE_POLICY")
+        if settings.getbool("HTTPCACHE_ENABLED") and policy != RFC2616_POLICY:
+            raise ValueError(
+                "インクリメンタルクロールを HTTP キャッシュと併用する場合は "
+                "HTTPCACHE_POLICY = '{}' が必要です".format(RFC2616_POLICY)
+            )
+        s = cls(settings.get("INCREMENTAL_CRAWL_DB"), crawler.stats)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def _get_stored(self, url):
+        return self.conn.execute(
+            "SELECT etag, last_modified, validator FROM validators "
+            "WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+    def process_request(self, request, spider):
+        stored = self._get_stored(request.url)
+        if stored is None:
+            return None
+
+        etag, last_modified, _ = stored
+        if etag and b"If-None-Match" not in request.headers:
+            request.headers["If-None-Match"] = etag
+        if last_modified and b"If-Modified-Since" not in request.headers:
+            request.headers["If-Modified-Since"] = last_modified
+        return None
+
+    def process_response(self, request, response, spider):
+        if response.status == 304:
+            # 前回から変化していない
+            self.stats.inc_value("incremental/not_modified", spider=spider)
+            raise IgnoreRequest("Not modified: {}".format(request.url))
+        if not 200 <= response.status < 300:
+            return response
+
+        etag = self._get_header(response, "ETag")
+        last_modified = self._get_header(response, "Last-Modified")
+        validator = etag or last_modified
+        if not validator:
+            validator = hashlib.sha1(response.body).hexdigest()
+        validator = "{} {}".format(request.method, validator)
+
+        stored = self._get_stored(request.url)
+        if stored is not None and stored[2] == validator:
+            # キャッシュなどから前回と同じ内容のレスポンスが返された
+            self.stats.inc_value("incremental/unchanged", spider=spider)
+            raise IgnoreRequest("Unchanged: {}".format(request.url))
+
+        self.stats.inc_value("incremental/changed", spider=spider)
+        self.pending[request.url] = (etag, last_modified, validator)
+        return response
+
+    def _get_header(self, response, name):
+        value = response.headers.get(name)
+        if value is None:
+            return None
+        return value.decode("latin-1")
+
+    def spider_closed(self, spider, reason):
+        if reason == "finished":
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO validators "
+                    "(url, etag, last_modified, validator) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(url,) + values for url, values in self.pending.items()],
+                )
+        self.pending = {}
+        self.conn.close()
+
+
+class IncrementalItemMiddleware(object):
+    """
+    前回のクロールで出力した項目の内容のハッシュ値を項目のキー
+    (症例は都道府県コード・都道府県症例番号、報道資料は URL) ごとに記録し、
+    新規・変更分の項目のみを後段に渡すスパイダーミドルウェア
+
+    - 発生状況テーブルは 1 ページのため、新しい症例が 1 件でも追加されると
+      ページ単位の判定 (IncrementalCrawlMiddleware) ではすべての行が再度
+      出力される。項目単位で判定することで、差分の CSV には当日の新規・変更分
+      のみが出力される
+    - ハッシュ値はクロールが正常に終了した場合のみ保存する
+    """
+
+    def __init__(self, path, stats):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items "
+            "(key TEXT PRIMARY KEY, hash TEXT NOT NULL)"
+        )
+        self.conn.commit()
+        self.stats = stats
+        # 今回のクロールで出力した項目のハッシュ値 {キー: ハッシュ値}
+        self.pending = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("INCREMENTAL_CRAWL_ENABLED"):
+            raise NotConfigured
+        s = cls(settings.get("INCREMENTAL_CRAWL_DB"), crawler.stats)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def get_item_key(self, item):
+        if isinstance(item, Covid19ChallengeItem):
+            return "patients/{}/{}".format(
+                item.get("pref_code"), item.get("pref_patient_no")
+            )
+        if isinstance(item, Covid19ChallengeDocumentItem):
+            return "documents/{}/{}".format(
+                item.get("pref_code"), item.get("href")
+            )
+        return None
+
+    def process_spider_output(self, response, result, spider):
+        for i in result:
+            key = self.get_item_key(i)
+            if key is None:
+                yield i
+                continue
+
+            item_hash = compute_hash(i)
+            stored = self.conn.execute(
+                "SELECT hash FROM items WHERE key = ?", (key,)
+            ).fetchone()
+            self.pending[key] = item_hash
+            if stored is not None and stored[0] == item_hash:
+                # 前回と同じ内容の項目
+                self.stats.inc_value(
+                    "incremental/unchanged_items", spider=spider
+                )
+                continue
+
+            self.stats.inc_value("incremental/changed_items", spider=spider)
+            yield i
+
+    def spider_closed(self, spider, reason):
+        if reason == "finished":
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO items (key, hash) VALUES (?, ?)",
+                    self.pending.items(),
+                )
+        self.pending = {}
+        self.conn.close()
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+from crawler.utils import convert_age, convert_date_ja_to_ad
+
+# 症例の区切り (例: 県内第123例目, 123例目)
+CASE_PATTERN = re.compile(r"(?:県内)?第?\s*(\d+)\s*例目")
+# 和暦の日付 (確定日)
+DATE_PATTERN = re.compile(r"令和\d+年\d+月\d+日")
+AGE_PATTERN = re.compile(r"(10歳未満|\d+\s*歳代)")
+GENDER_PATTERN = re.compile(r"(男性|女性)")
+RESIDENCE_PATTERN = re.compile(r"居住地\s*[:：]?\s*(\S+)")
+OCCUPATION_PATTERN = re.compile(r"職業\s*[:：]?\s*(\S+)")
+
+
+def document_store_path(store_dir, item):
+    """
+    報道資料の本文の保存先のパスを取得します。
+    """
+    return os.path.join(store_dir, str(item["pref_code"]), item["file_name"])
+
+
+def file_hash(path):
+    """
+    ファイルの内容のハッシュ値を取得します。
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _search(pattern, text):
+    match = pattern.search(text)
+    return match.group(1) if match else None
+
+
+def parse_cases(text):
+    """
+    報道資料の本文から症例ごとのレコード (Covid19ChallengeItem と同じ項目) を
+    抽出します。
+    """
+    # 資料内の最初の日付を確定日とみなす
+    fixed_date = None
+    date_match = DATE_PATTERN.search(text)
+    if date_match:
+        fixed_date = datetime.strptime(
+            convert_date_ja_to_ad(date_match.group()), "%y/%m/%d"
+        ).strftime("%Y/%m/%d")
+
+    cases = []
+    matches = list(CASE_PATTERN.finditer(text))
+    for idx, match in enumerate(matches):
+        end = len(text)
+        if idx + 1 < len(matches):
+            end = matches[idx + 1].start()
+        body = text[match.end() : end]
+
+        cases.append(
+            {
+                "pref_patient_no": match.group(1),
+                "fixed_date": fixed_date,
+                "age": convert_age(_search(AGE_PATTERN, body)),
+                "gender": _search(GENDER_PATTERN, body) or "非公表",
+                "residence": _search(RESIDENCE_PATTERN, body),
+                "occupation": _search(OCCUPATION_PATTERN, body),
+            }
+        )
+    return cases
+
+
+def extract_cases(path, cache_dir):
+    """
+    PDF から症例のレコードを抽出します。(プロセスプールのワーカーで実行する)
+    抽出結果はファイルのハッシュ値をキーとして cache_dir にキャッシュし、
+    同じ内容の PDF は一度だけ解析します。
+    """
+    cache_path = os.path.join(cache_dir, "{}.json".format(file_hash(path)))
+    if os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    from pdfminer.high_level import extract_text
+
+    cases = parse_cases(extract_text(path))
+
+    # 書き込み途中のキャッシュを読まないよう、一時ファイルから置き換える
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cases, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+    return cases
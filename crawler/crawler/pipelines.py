@@ -5,17 +5,35 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 
-import firebase_admin
+from scrapy.exceptions import NotConfigured
+from scrapy.exporters import CsvItemExporter
 
+from crawler.database import get_client
 from crawler.exporter import Covid19DocumentsExporter, Covid19PatientsExporter
 from crawler.items import Covid19ChallengeDocumentItem, Covid19ChallengeItem
+from crawler.manifest import ExportManifest
+from crawler.pdf_extraction import document_store_path, extract_cases
 
 
 class Covid19ChallengePipeline(object):
     def __init__(self, settings={}):
         self.settings = settings
-        firebase_admin.initialize_app()
+        self.db = get_client(settings.get("FIRESTORE_BACKEND", "firestore"))
+
+        manifest_path = settings.get("FIRESTORE_MANIFEST_PATH")
+        self.manifest = None
+        if manifest_path:
+            self.manifest = ExportManifest(manifest_path)
+
+        self.writer_options = {
+            "batch_size": settings.get("FIRESTORE_WRITE_BATCH_SIZE", 500),
+            "workers": settings.get("FIRESTORE_WRITE_WORKERS", 4),
+            "max_retries": settings.get("FIRESTORE_WRITE_MAX_RETRIES", 3),
+        }
+        self.spill_size = settings.get("EXPORT_SPILL_SIZE", 1000)
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -28,14 +46,27 @@ class Covid19ChallengePipeline(object):
         export_dir = "output/{}_{}".format(pref_code, pref_name_en)
         os.makedirs(export_dir, exist_ok=True)
 
-        patients_file_path = "{}/patients.csv".format(export_dir)
+        # インクリメンタルクロールでは新規・変更分の項目のみが渡されるため、
+        # (IncrementalItemMiddleware が項目ごとに判定する)
+        # 前回までの CSV を上書きせず差分の CSV として出力する
+        suffix = ""
+        if self.settings.get("INCREMENTAL_CRAWL_ENABLED"):
+            suffix = "_delta_{}".format(
+                datetime.now().strftime("%Y%m%d_%H%M%S")
+            )
+
+        patients_file_path = "{}/patients{}.csv".format(export_dir, suffix)
         self.patients_file = open(patients_file_path, "wb")
 
-        documents_file_path = "{}/documents.csv".format(export_dir)
+        documents_file_path = "{}/documents{}.csv".format(export_dir, suffix)
         self.documents_file = open(documents_file_path, "wb")
 
         self.patients_exporter = Covid19PatientsExporter(
             self.patients_file,
+            db=self.db,
+            manifest=self.manifest,
+            writer_options=self.writer_options,
+            spill_size=self.spill_size,
             include_headers_line=True,
             join_multivalued=",",
             fields_to_export=self.settings["FEED_EXPORT_FIELDS_PATIENTS"],
@@ -43,6 +74,10 @@ class Covid19ChallengePipeline(object):
 
         self.documents_exporter = Covid19DocumentsExporter(
             self.documents_file,
+            db=self.db,
+            manifest=self.manifest,
+            writer_options=self.writer_options,
+            spill_size=self.spill_size,
             include_headers_line=True,
             join_multivalued=",",
             fields_to_export=self.settings["FEED_EXPORT_FIELDS_DOCUMENTS"],
@@ -58,6 +93,9 @@ class Covid19ChallengePipeline(object):
         self.documents_exporter.finish_exporting()
         self.documents_file.close()
 
+        if self.manifest is not None:
+            self.manifest.close()
+
     def process_item(self, item, spider):
 
         if type(item) is Covid19ChallengeItem:
@@ -66,3 +104,91 @@ class Covid19ChallengePipeline(object):
             self.documents_exporter.export_item(item)
 
         return item
+
+
+class PdfExtractionPipeline(object):
+    """
+    ダウンロードした報道資料 (PDF) から症例のレコードをプロセスプールで抽出し、
+    クロール終了時に extracted_cases.csv に出力するパイプライン
+    (抽出は別プロセスで行うため、クロール中のリアクターをブロックしない)
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.store_dir = settings.get("DOCUMENTS_STORE_DIR")
+        self.cache_dir = settings.get("PDF_EXTRACTION_CACHE_DIR")
+        self.workers = settings.get("PDF_EXTRACTION_WORKERS") or None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("PDF_EXTRACTION_ENABLED"):
+            raise NotConfigured
+        if settings.get("DOCUMENTS_FETCH_MODE") != "full":
+            raise NotConfigured(
+                "PDF の抽出には DOCUMENTS_FETCH_MODE = 'full' が必要です"
+            )
+        try:
+            import pdfminer  # noqa: F401
+        except ImportError:
+            raise NotConfigured("pdfminer.six がインストールされていません")
+        return cls(settings)
+
+    def open_spider(self, spider):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # 抽出中の報道資料 {PDF のパス: (項目, Future)}
+        self.futures = {}
+
+    def close_spider(self, spider):
+        records = []
+        try:
+            for path, (item, future) in self.futures.items():
+                try:
+                    cases = future.result()
+                except Exception:
+                    spider.logger.exception(
+                        "PDF の抽出に失敗しました: %s", path
+                    )
+                    continue
+                for case in cases:
+                    record = Covid19ChallengeItem(case)
+                    record["pref_code"] = item["pref_code"]
+                    record["pref_name"] = item["pref_name"]
+                    record["information_source"] = item["href"]
+                    records.append(record)
+        finally:
+            self.executor.shutdown()
+        records.sort(key=lambda x: int(x["pref_patient_no"]))
+
+        export_dir = "output/{}_{}".format(
+            spider.pref_code, spider.pref_name_en
+        )
+        os.makedirs(export_dir, exist_ok=True)
+        with open("{}/extracted_cases.csv".format(export_dir), "wb") as f:
+            exporter = CsvItemExporter(
+                f,
+                include_headers_line=True,
+                join_multivalued=",",
+                fields_to_export=self.settings["FEED_EXPORT_FIELDS_PATIENTS"]
+                + ["information_source"],
+            )
+            exporter.start_exporting()
+            for record in records:
+                exporter.export_item(record)
+            exporter.finish_exporting()
+        spider.logger.info(
+            "%d 件の PDF から %d 件の症例を抽出しました。",
+            len(self.futures),
+            len(records),
+        )
+
+    def process_item(self, item, spider):
+        if type(item) is Covid19ChallengeDocumentItem:
+            path = document_store_path(self.store_dir, item)
+            if path not in self.futures and os.path.exists(path):
+                future = self.executor.submit(
+                    extract_cases, path, self.cache_dir
+                )
+                self.futures[path] = (dict(item), future)
+
+        return item
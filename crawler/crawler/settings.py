@@ -23,14 +23,17 @@ NEWSPIDER_MODULE = "crawler.spiders"
 ROBOTSTXT_OBEY = False
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-# CONCURRENT_REQUESTS = 32
+# (crawl_all で複数の都道府県を並行してクロールするため、全体の上限を広げ、
+# ドメインごとの同時接続数と間隔で負荷を抑える)
+CONCURRENT_REQUESTS = 32
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
-DOWNLOAD_DELAY = 2
+# (ドメインごとの最小の間隔。実際の間隔は AutoThrottle で調整する)
+DOWNLOAD_DELAY = 1
 # The download delay setting will honor only one of:
-# CONCURRENT_REQUESTS_PER_DOMAIN = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 2
 # CONCURRENT_REQUESTS_PER_IP = 16
 
 # Disable cookies (enabled by default)
@@ -65,18 +68,21 @@ DOWNLOAD_DELAY = 2
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-ITEM_PIPELINES = {"crawler.pipelines.Covid19ChallengePipeline": 300}
+ITEM_PIPELINES = {
+    "crawler.pipelines.PdfExtractionPipeline": 200,
+    "crawler.pipelines.Covid19ChallengePipeline": 300,
+}
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-# AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_ENABLED = True
 # The initial download delay
-# AUTOTHROTTLE_START_DELAY = 5
+AUTOTHROTTLE_START_DELAY = 2
 # The maximum download delay to be set in case of high latencies
-# AUTOTHROTTLE_MAX_DELAY = 60
+AUTOTHROTTLE_MAX_DELAY = 30
 # The average number of requests Scrapy should be sending in parallel to
 # each remote server
-# AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
+AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
 # Enable showing throttling stats for every response received:
 # AUTOTHROTTLE_DEBUG = False
 
@@ -86,7 +92,10 @@ HTTPCACHE_ENABLED = True
 HTTPCACHE_EXPIRATION_SECS = 0
 HTTPCACHE_DIR = "httpcache"
 HTTPCACHE_IGNORE_HTTP_CODES = []
-HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+HTTPCACHE_STORAGE = "crawler.httpcache.SqliteCacheStorage"
+# SqliteCacheStorage の合計サイズの上限 (バイト, 0 で無制限) と圧縮レベル
+HTTPCACHE_SQLITE_MAX_BYTES = 2 * 1024 ** 3
+HTTPCACHE_SQLITE_COMPRESSION_LEVEL = 6
 
 FEED_EXPORT_FIELDS_PATIENTS = [
     "pref_patient_no",
@@ -106,3 +115,55 @@ FEED_EXPORT_FIELDS_DOCUMENTS = [
     "label",
     "href",
 ]
+
+# エクスポーターが書き込むデータベース
+# (firestore: Cloud Firestore, memory: テスト・ベンチマーク用のインメモリ実装)
+FIRESTORE_BACKEND = "firestore"
+
+# 前回書き込んだ項目のハッシュ値を記録するマニフェストのパス
+# (内容が変化していない項目は Firestore の読み込み・書き込みを省略する。None で無効)
+FIRESTORE_MANIFEST_PATH = "output/firestore_manifest.sqlite"
+
+# Firestore へのバッチ書き込みの設定
+# (1バッチの書き込み数 (上限 500)・並行してコミットするワーカー数・再試行回数)
+FIRESTORE_WRITE_BATCH_SIZE = 500
+FIRESTORE_WRITE_WORKERS = 4
+FIRESTORE_WRITE_MAX_RETRIES = 3
+
+# 報道資料 (PDF) の取得方法
+# (head: HEAD リクエストでメタデータのみ取得, full: 本文を含めて取得)
+DOCUMENTS_FETCH_MODE = "head"
+
+# インクリメンタルクロール
+# (前回のクロールから変化していないページのコールバックを省略し、新規・変更分の
+# 項目のみを差分の CSV (patients_delta_*.csv など) に出力する。変化したページの
+# 項目も、前回出力した内容と同じものは項目ごとに除外する)
+# HTTPCACHE_ENABLED と併用する場合は、キャッシュを再検証する RFC2616Policy が
+# 必要 (既定の DummyPolicy では2回目以降すべてのページがキャッシュから返され、
+# 何も出力されなくなる。-s で有効にする場合は HTTPCACHE_POLICY も指定する)
+INCREMENTAL_CRAWL_ENABLED = False
+INCREMENTAL_CRAWL_DB = "output/incremental.sqlite"
+DOWNLOADER_MIDDLEWARES = {
+    "crawler.middlewares.IncrementalCrawlMiddleware": 950,
+}
+SPIDER_MIDDLEWARES = {
+    "crawler.middlewares.IncrementalItemMiddleware": 950,
+}
+if INCREMENTAL_CRAWL_ENABLED:
+    HTTPCACHE_POLICY = "scrapy.extensions.httpcache.RFC2616Policy"
+
+# 取得済みの報道資料の索引のパス
+# (クロールをまたいで同じ報道資料へのリクエストを省略する。None で無効)
+DOCUMENTS_INDEX_PATH = "output/documents_index.sqlite"
+
+# 報道資料 (PDF) からの症例の抽出
+# (DOCUMENTS_FETCH_MODE = "full" で取得した PDF を DOCUMENTS_STORE_DIR に保存し、
+# プロセスプールで解析して extracted_cases.csv に出力する。pdfminer.six が必要)
+PDF_EXTRACTION_ENABLED = False
+PDF_EXTRACTION_WORKERS = None
+PDF_EXTRACTION_CACHE_DIR = "output/pdf_cache"
+DOCUMENTS_STORE_DIR = "output/documents"
+
+# エクスポーターがメモリに保持する項目数
+# (この件数ごとに並べ替えて一時ファイルに書き出し、Firestore に書き込む)
+EXPORT_SPILL_SIZE = 1000
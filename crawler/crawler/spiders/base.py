@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import os
+from datetime import datetime
+
+import scrapy
+
+from crawler.document_index import DocumentIndex, document_fingerprint
+from crawler.items import Covid19ChallengeItem
+from crawler.pdf_extraction import document_store_path
+from crawler.table_parser import TableParser
+from crawler.utils import convert_age, merge_labels, parse_month_day
+
+# HEAD リクエストに対応していないサーバーが返すステータスコード
+HEAD_UNSUPPORTED_STATUSES = [403, 405, 501]
+
+
+class PrefectureSpider(scrapy.Spider):
+    """
+    都道府県の発生状況テーブルと報道資料を取得するスパイダーの基底クラス
+    サブクラスでは都道府県の情報とテーブルの構造 (table_rows_xpath, columns) を
+    宣言し、必要に応じて follow_row_link, extra_requests を実装する
+    """
+
+    pref_code = None
+    pref_name = None
+    pref_name_en = None
+
+    # 発生状況テーブルの行を取得する XPath
+    table_rows_xpath = None
+    # テーブル先頭のヘッダ行の数
+    header_rows = 1
+    # 項目ごとの列の位置 {項目名: 列番号}
+    # (pref_patient_no, fixed_date, age, gender, residence, occupation)
+    columns = {}
+    # 確定日の年 (テーブルには月日のみ記載されている)
+    fixed_date_year = 2020
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.table_parser = TableParser(
+            self.table_rows_xpath, self.header_rows
+        )
+        # 今回のクロールで扱った報道資料の項目 {URL のフィンガープリント: 項目}
+        self.document_items = {}
+        # 取得済みの報道資料の索引 (get_document_index() で開く)
+        self.document_index = None
+
+    def start_requests(self):
+        yield from super().start_requests()
+        # 発生状況テーブルを経由せずに固定のページを辿る
+        #   (インクリメンタルクロールでテーブルが変化していない日も取得する)
+        yield from self.extra_requests()
+
+    def parse(self, response):
+        # 発生状況テーブルをループ
+        for cells, href in self.table_parser.parse(response):
+            yield self.build_patient_item(cells)
+
+            # 行内の報道資料へのリンクを辿る
+            if href is not None:
+                yield from self.follow_row_link(response, href)
+
+    def build_patient_item(self, cells):
+        """
+        発生状況テーブルの1行のセルから症例の項目を作成します。
+        """
+        item = Covid19ChallengeItem()
+        # 都道府県コード
+        item["pref_code"] = self.pref_code
+        # 都道府県名
+        item["pref_name"] = self.pref_name
+        for field, column in self.columns.items():
+            item[field] = cells[column]
+
+        # 確定日 (YYYY/MM/DD書式に変更)
+        item["fixed_date"] = parse_month_day(
+            item["fixed_date"], self.fixed_date_year
+        )
+        # 年代 (10歳代を 10 - 19 形式に変換)
+        item["age"] = convert_age(item["age"])
+        return item
+
+    def follow_row_link(self, response, href):
+        """
+        発生状況テーブルの行内のリンクに対するリクエストを返します。
+        (既定では何もしない)
+        """
+        return []
+
+    def extra_requests(self):
+        """
+        発生状況テーブルとは別に辿る固定のページへのリクエストを返します。
+        (開始時に start_urls と合わせて送信する。既定では何もしない)
+        """
+        return []
+
+    def get_document_index(self):
+        """
+        取得済みの報道資料の索引を取得します。(DOCUMENTS_INDEX_PATH 未設定時は None)
+        """
+        path = self.settings.get("DOCUMENTS_INDEX_PATH")
+        if self.document_index is None and path:
+            self.document_index = DocumentIndex(path)
+        return self.document_index
+
+    def follow_document(self, url, item):
+        """
+        報道資料の項目を取得するリクエスト (または項目) を返します。
+        - 今回のクロールで既にリンクされた報道資料はリクエストせず、既出の項目に
+          ラベルを統合する
+        - 過去のクロールで取得済みの報道資料はリクエストせず、索引から項目を作成する
+        """
+        fingerprint = document_fingerprint(url)
+        known = self.document_items.get(fingerprint)
+        if known is not None:
+            known["label"] = merge_labels(
+                known.get("label"), item.get("label")
+            )
+            self.crawler.stats.inc_value("documents/duplicate_links")
+            if known.get("file_name"):
+                # 出力済みの項目はラベルを統合して再度出力する
+                #   (エクスポーターが同じドキュメントとしてまとめる)
+                yield known
+            return
+        self.document_items[fingerprint] = item
+
+        index = self.get_document_index()
+        record = index.get(fingerprint) if index is not None else None
+        if record is not None and self.is_document_body_missing(record):
+            # 本文が保存されていない場合は索引を使わずに取得する
+            #   (head モードで索引に記録した報道資料を full モードで取得する場合)
+            self.crawler.stats.inc_value("documents/index_refetches")
+            record = None
+        if record is not None:
+            label = merge_labels(record.pop("label"), item.get("label"))
+            item.update(record)
+            item["label"] = label
+            self.crawler.stats.inc_value("documents/index_hits")
+            yield item
+            return
+
+        yield self.document_request(url, item)
+
+    def is_document_body_missing(self, record):
+        """
+        報道資料の本文を取得するモード (full) で、本文が保存されていないかを
+        判定します。
+        """
+        store_dir = self.settings.get("DOCUMENTS_STORE_DIR")
+        if (
+            self.settings.get("DOCUMENTS_FETCH_MODE", "head") != "full"
+            or not store_dir
+        ):
+            return False
+        return not os.path.exists(document_store_path(store_dir, record))
+
+    def closed(self, reason):
+        # 取得した報道資料を索引に記録
+        index = self.get_document_index()
+        if index is None:
+            return
+        index.update(
+            {
+                fingerprint: item
+                for fingerprint, item in self.document_items.items()
+                if item.get("file_name")
+            }
+        )
+        index.close()
+
+    def document_request(self, url, item):
+        """
+        報道資料のメタデータ (URL, Last-Modified) を取得するリクエストを作成します。
+        DOCUMENTS_FETCH_MODE が head の場合は HEAD リクエストで本文を取得せず、
+        full の場合は本文を含めて取得します。(後段で PDF を処理する場合など)
+        """
+        if self.settings.get("DOCUMENTS_FETCH_MODE", "head") == "full":
+            return scrapy.Request(
+                url, callback=self.parse_documents, meta={"item": item}
+            )
+
+        return scrapy.Request(
+            url,
+            method="HEAD",
+            callback=self.parse_documents,
+            errback=self.document_head_failed,
+            meta={
+                "item": item,
+                "handle_httpstatus_list": HEAD_UNSUPPORTED_STATUSES,
+            },
+        )
+
+    def document_range_request(self, url, item):
+        """
+        先頭 1 バイトのみを取得する GET リクエストを作成します。
+        (HEAD リクエストに対応していないサーバー向け)
+        リクエストのフィンガープリントは Range ヘッダを含まないため、
+        本文を取得する GET に 1 バイトのレスポンスが返されないよう
+        HTTP キャッシュには保存しない
+        """
+        return scrapy.Request(
+            url,
+            headers={"Range": "bytes=0-0"},
+            callback=self.parse_documents,
+            meta={"item": item, "dont_cache": True},
+            dont_filter=True,
+        )
+
+    def document_head_failed(self, failure):
+        # HEAD リクエストに失敗した場合は範囲指定の GET で再取得
+        request = failure.request
+        self.logger.debug(
+            "HEAD リクエストに失敗したため範囲指定で再取得します: %s", request.url
+        )
+        yield self.document_range_request(request.url, request.meta["item"])
+
+    def parse_documents(self, response):
+        item = response.meta["item"]
+        if (
+            response.request.method == "HEAD"
+            and response.status in HEAD_UNSUPPORTED_STATUSES
+        ):
+            # HEAD リクエストに対応していない場合は範囲指定の GET で再取得
+            yield self.document_range_request(response.url, item)
+            return
+        if (
+            response.status == 206
+            and "cached" in response.flags
+            and b"Range" not in response.request.headers
+        ):
+            # 以前キャッシュされた範囲指定の GET のレスポンスが返された場合は
+            # キャッシュを使わずに本文を再取得
+            request = response.request.replace(dont_filter=True)
+            request.meta["dont_cache"] = True
+            yield request
+            return
+
+        # ファイル名
+        item["file_name"] = response.url.split("/")[-1]
+        item["pref_code"] = self.pref_code
+        item["pref_name"] = self.pref_name
+        item["href"] = response.url
+        item["last_modified"] = response.headers.get("Last-Modified")
+
+        if item["last_modified"]:
+            # datetimeに変換
+            item["last_modified"] = datetime.strptime(
+                item["last_modified"].decode("utf-8"),
+                "%a, %d %b %Y %H:%M:%S %Z",
+            )
+
+        # 本文を取得した場合は後段の PDF 抽出のために保存
+        store_dir = self.settings.get("DOCUMENTS_STORE_DIR")
+        if (
+            store_dir
+            and response.request.method == "GET"
+            and response.status == 200
+        ):
+            path = document_store_path(store_dir, item)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(response.body)
+
+        yield item
@@ -0,0 +1,46 @@
+from lxml import etree
+
+# 行内のセルのテキスト (td 直下のテキストノード)
+CELL_TEXT_XPATH = etree.XPath("td/text()")
+# 行内の最初のリンク先
+ROW_LINK_XPATH = etree.XPath("(.//a/@href)[1]")
+
+
+def normalize_cells(texts):
+    """
+    セルのテキストのリストを、改行を含むテキスト (セル内の折り返し) を
+    1つ前のテキストに連結したリストに変換します。
+    """
+    cells = []
+    for text in texts:
+        if "\n" in text and cells:
+            cells[-1] = "{} {}".format(cells[-1], text.replace("\n", ""))
+        else:
+            cells.append(str(text))
+    return cells
+
+
+class TableParser(object):
+    """
+    発生状況テーブルを行ごとのセルのリストに変換するパーサー
+    (全スパイダーで共通の処理を使用する)
+    - XPath は生成時に一度だけコンパイルする
+    - 行・セルごとにセレクターを生成せず、lxml の要素を直接走査する
+    """
+
+    def __init__(self, rows_xpath, header_rows=1):
+        self.rows_xpath = etree.XPath(rows_xpath)
+        self.header_rows = header_rows
+
+    def parse(self, response):
+        """
+        テーブルの各行を (セルのテキストのリスト, リンク先) のリストで返します。
+        (リンクがない行のリンク先は None)
+        """
+        rows = self.rows_xpath(response.selector.root)[self.header_rows :]
+        parsed = []
+        for tr in rows:
+            links = ROW_LINK_XPATH(tr)
+            href = str(links[0]) if links else None
+            parsed.append((normalize_cells(CELL_TEXT_XPATH(tr)), href))
+        return parsed
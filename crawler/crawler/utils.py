@@ -1,5 +1,11 @@
 import re
 from datetime import datetime
+from functools import lru_cache
+
+import crawler.constants as constants
+
+# 末尾の曜日 (例: (水), （水）)
+WEEKDAY_PATTERN = re.compile(r"\s*[(（][^)）]*[)）]\s*$")
 
 
 def convert_date_ja_to_ad(date_ja_str):
@@ -15,3 +21,46 @@ def convert_date_ja_to_ad(date_ja_str):
     return datetime.strptime(
         "{}年{}".format(year_ad, date_ja), "%Y年%m月%d日"
     ).strftime("%y/%m/%d")
+
+
+def merge_labels(*labels, separator=" / "):
+    """
+    複数のリンク元から取得したラベルを重複を除いて連結します。
+    例： merge_labels("報道資料", "報道資料 / 第1報") → 報道資料 / 第1報
+    """
+    merged = []
+    for label in labels:
+        if not label:
+            continue
+        for part in label.split(separator):
+            if part and part not in merged:
+                merged.append(part)
+    return separator.join(merged)
+
+
+@lru_cache(maxsize=None)
+def parse_month_day(date_str, year):
+    """
+    月日の文字列を YYYY/MM/DD 書式の日付文字列へ変換します。(末尾の曜日は除去)
+    例： 4月1日(水) → 2020/04/01
+    ※同じ日付の症例が多いため変換結果をキャッシュする
+    """
+    date_str = WEEKDAY_PATTERN.sub("", date_str.strip())
+    return datetime.strptime(
+        "{}年{}".format(year, date_str), "%Y年%m月%d日"
+    ).strftime("%Y/%m/%d")
+
+
+@lru_cache(maxsize=None)
+def convert_age(age_str):
+    """
+    年代の文字列を AGE_LIST の形式に変換します。 例： 20歳代 → 20 - 29
+    """
+    if age_str is None:
+        return "非公表"
+    if "10歳未満" in age_str:
+        return constants.AGE_LIST[0]
+    match = re.match(r"\s*(\d+)", age_str)
+    if match is None:
+        return "非公表"
+    return constants.AGE_LIST[min(int(match.group(1)) // 10, 9)]
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Firestore の1回のバッチ書き込みで実行できる操作数の上限
+MAX_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class FirestoreBatchWriter(object):
+    """
+    ドキュメントの書き込みを最大サイズのバッチにまとめ、
+    ワーカースレッドから並行してコミットするライター
+    - コミットに失敗した場合は指数的に待ち時間を延ばしながら再試行する
+    - 同じドキュメントへの書き込みは、先行するバッチのコミットを待ってから
+      登録する (ドキュメントごとの書き込み順序を保証する)
+    - on_commit を指定した場合、バッチのコミット後にそのバッチの
+      [(パス, set() で指定した context), ...] を引数として
+      (ワーカースレッドから) 呼び出す
+    """
+
+    def __init__(
+        self,
+        db,
+        batch_size=MAX_BATCH_SIZE,
+        workers=4,
+        max_retries=3,
+        backoff=0.5,
+        on_commit=None,
+    ):
+        self.db = db
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.on_commit = on_commit
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+        # コミット待ちの書き込み [(パス, ドキュメントの内容, context), ...]
+        self.pending = []
+        # コミット中のバッチ {パス: Future}
+        self.inflight = {}
+
+        # 書き込みドキュメント数・バッチ数・再試行回数
+        self.document_count = 0
+        self.batch_count = 0
+        self.retry_count = 0
+        self.lock = threading.Lock()
+        self.started_at = time.perf_counter()
+
+    def set(self, path, document_data, context=None):
+        """
+        path のドキュメントの書き込みを登録します。
+        (バッチの上限に達した時点でコミットを開始する)
+        """
+        with self.lock:
+            future = self.inflight.get(path)
+        if future is not None:
+            # 同じドキュメントへの先行する書き込みのコミットを待つ
+            future.result()
+        self.pending.append((path, document_data, context))
+        if len(self.pending) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        writes, self.pending = self.pending, []
+        future = self.executor.submit(self._commit, writes)
+        with self.lock:
+            for path, _, _ in writes:
+                self.inflight[path] = future
+        future.add_done_callback(
+            lambda f: self._release([path for path, _, _ in writes], f)
+        )
+        self.futures.append(future)
+        self._collect(wait=False)
+
+    def _collect(self, wait):
+        # 完了したバッチの件数を集計 (wait の場合はすべての完了を待つ)
+        futures = []
+        for future in self.futures:
+            if wait or future.done():
+                self.document_count += future.result()
+                self.batch_count += 1
+            else:
+                futures.append(future)
+        self.futures = futures
+
+    def _release(self, paths, future):
+        with self.lock:
+            for path in paths:
+                if self.inflight.get(path) is future:
+                    del self.inflight[path]
+
+    def _commit(self, writes):
+        for attempt in range(self.max_retries + 1):
+            batch = self.db.batch()
+            for path, document_data, _ in writes:
+                batch.set(self.db.document(path), document_data)
+            try:
+                batch.commit()
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                with self.lock:
+                    self.retry_count += 1
+                wait = self.backoff * (2 ** attempt)
+                logger.warning(
+                    "バッチ書き込みに失敗しました。%.1f 秒後に再試行します (%d/%d)",
+                    wait,
+                    attempt + 1,
+                    self.max_retries,
+                    exc_info=True,
+                )
+                time.sleep(wait)
+                continue
+
+            if self.on_commit is not None:
+                self.on_commit(
+                    [(path, context) for path, _, context in writes]
+                )
+            return len(writes)
+
+    def wait(self, paths):
+        """
+        paths のドキュメントへの登録済みの書き込みのコミットを待ちます。
+        """
+        paths = set(paths)
+        if any(path in paths for path, _, _ in self.pending):
+            self._submit()
+        with self.lock:
+            futures = {
+                self.inflight[path] for path in paths if path in self.inflight
+            }
+        for future in futures:
+            future.result()
+
+    def flush(self):
+        """
+        登録済みの書き込みをすべてコミットし、完了を待ちます。
+        """
+        if self.pending:
+            self._submit()
+        self._collect(wait=True)
+
+    def get_stats(self):
+        """
+        書き込みの実績 (ドキュメント数・バッチ数・再試行回数・スループット) を返します。
+        """
+        elapsed = time.perf_counter() - self.started_at
+        throughput = 0.0
+        if elapsed > 0:
+            throughput = self.document_count / elapsed
+        return {
+            "documents": self.document_count,
+            "batches": self.batch_count,
+            "retries": self.retry_count,
+            "elapsed_sec": elapsed,
+            "documents_per_sec": throughput,
+        }
+
+    def close(self):
+        """
+        残りの書き込みをコミットしてワーカーを終了します。
+        """
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown()
+        stats = self.get_stats()
+        logger.info(
+            "Firestore に %d 件 (%d バッチ) 書き込みました。"
+            "%.1f 秒, %.1f 件/秒, 再試行 %d 回",
+            stats["documents"],
+            stats["batches"],
+            stats["elapsed_sec"],
+            stats["documents_per_sec"],
+            stats["retries"],
+        )
+        return stats
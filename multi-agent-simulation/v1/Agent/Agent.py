@@ -31,6 +31,8 @@ class Agent:
 
         # 潜伏期間
         self.incubation_period = 0
+        # イベントカレンダーに登録中の状態遷移の識別トークン
+        self.event_token = 0
 
         # エージェントの状態
         self.status = status
@@ -132,9 +134,16 @@ class Agent:
         self.y = self.next_y
         self.current_section = self.next_section
 
-    def decide_next_status(self):
-        """ 次のエージェント状態を決定 """
-        if self.status == Status.RECOVERED:
+    def decide_next_status(self, scheduled=False):
+        """ 次のエージェント状態を決定
+
+        scheduled が True の場合、EXPOSED / INFECTED からの遷移は
+        イベントカレンダーで管理されるため、ここでは判定しない
+        """
+        if scheduled and self.status in [Status.EXPOSED, Status.INFECTED]:
+            self.next_status = self.status
+
+        elif self.status == Status.RECOVERED:
             # 回復者は再感染しない想定
             self.next_status = Status.RECOVERED
 
@@ -194,6 +203,21 @@ class Agent:
 
             self.neighbor_agents = []
 
+    def fire_scheduled_transition(self):
+        """ イベントカレンダーで発生日を迎えた状態遷移を次の状態に反映 """
+        if self.status == Status.EXPOSED:
+            self.next_status = Status.INFECTED
+        elif self.status == Status.INFECTED:
+            if (
+                random.random()
+                <= self.infection_model.antibody_acquisition_prob
+            ):
+                # 抗体獲得に成功した場合
+                self.next_status = Status.RECOVERED
+            else:
+                # 抗体獲得に失敗した場合
+                self.next_status = Status.SUSCEPTABLE
+
     def update_status(self):
         """ エージェントの状態を更新 """
         # 発症時の自覚症状発生判定
@@ -3,9 +3,11 @@
 """
 import random
 
+import numpy as np
 import pandas as pd
 
 from Agent import Agent, Status
+from Environment.EventCalendar import EventCalendar
 from Environment.Hospital import Hospital
 from Environment.Section import Section, SeverityLevel
 from Environment.Government import Government
@@ -20,6 +22,7 @@ class Environment:
         hospital_capacity,
         observation_period,
         has_apply_policy,
+        scheduling="daily",
     ):
         # 環境サイズ（env_size x env_size の空間を想定）
         self.env_size = env_size
@@ -51,6 +54,11 @@ class Environment:
         # 非常事態宣言を発令しているかどうか
         self.is_emergency = False
 
+        # 状態遷移のイベントカレンダー
+        #   scheduling="daily": 全エージェントの遷移を毎日判定 (カレンダーなし)
+        #   scheduling="event": 遷移の発生日をカレンダーで管理
+        self.calendar = EventCalendar() if scheduling == "event" else None
+
     def init_sections(self):
         """ 環境を初期化 (区画分割と属性付与) """
         section_size = self.env_size / self.section_div_num
@@ -130,6 +138,30 @@ class Environment:
         for target_id in infected_ids:
             self.agents[target_id].status = Status.INFECTED
             self.agents[target_id].has_subjective_symptoms = True
+            self.schedule_transition(self.agents[target_id])
+
+    def schedule_transition(self, agent):
+        """ エージェントの次の状態遷移をイベントカレンダーに登録
+
+        EXPOSED は潜伏期間後に発症、INFECTED は回復確率に従う幾何分布で
+        サンプリングした日数後に回復判定を行う
+        """
+        if self.calendar is None:
+            return
+        if agent.status == Status.EXPOSED:
+            delay = agent.incubation_period
+        elif agent.status == Status.INFECTED:
+            delay = np.random.geometric(self.infection_model.recovery_prob)
+        else:
+            return
+        self.calendar.schedule(delay, agent)
+
+    def fire_due_transitions(self):
+        """ 発生日を迎えた状態遷移を次の状態に反映 """
+        if self.calendar is None:
+            return
+        for agent in self.calendar.advance():
+            agent.fire_scheduled_transition()
 
     def get_neighbor_agents(self, agent):
         """ 対象エージェントと同じ区画に属するエージェントのリストを取得 """
@@ -202,16 +234,17 @@ class Environment:
 
     def get_snap_shot_df(self):
         """ 現時点のスナップショット(Pandas.DataFrame)を取得 """
-        df = pd.DataFrame(columns=["id", "x", "y", "status", "is_patient"])
-        for agent in self.agents:
-            record = pd.Series(index=df.columns, dtype="object")
-            record["id"] = agent.id
-            record["x"] = agent.x
-            record["y"] = agent.y
-            record["status"] = agent.status
-            record["is_patient"] = agent.is_in_hospital
-            df = df.append(record, ignore_index=True)
-        return df
+        agents = self.agents
+        return pd.DataFrame(
+            {
+                "id": [agent.id for agent in agents],
+                "x": [agent.x for agent in agents],
+                "y": [agent.y for agent in agents],
+                "status": [agent.status for agent in agents],
+                "is_patient": [agent.is_in_hospital for agent in agents],
+            },
+            columns=["id", "x", "y", "status", "is_patient"],
+        )
 
     def update_goverment(self):
         """ 現在の環境の状態に合わせて政府の情報を更新 """
@@ -0,0 +1,48 @@
+"""
+状態遷移のイベントカレンダー
+    潜伏期間の終了（E→I）や回復（I→R）の発生日をエージェントの状態変化時に
+    サンプリングし、日付ごとのバケットに登録する
+    （各日は発生日を迎えたエージェントのみを処理すればよい）
+"""
+from collections import defaultdict
+
+
+class EventCalendar:
+    def __init__(self):
+        # 現在の日付（advance() を呼び出すたびに 1 進む）
+        self.day = 0
+        # 日付ごとのイベント {day: [(agent, 登録時の状態, トークン), ...]}
+        self.buckets = defaultdict(list)
+
+    def clear(self):
+        """ カレンダーを初期化（各 Episode の最初に実行する想定） """
+        self.day = 0
+        self.buckets = defaultdict(list)
+
+    def schedule(self, delay: int, agent):
+        """ 現在の状態からの遷移を delay 日後に登録
+
+        登録済みのイベントがある場合は無効化される（1エージェントにつき
+        有効なイベントは常に1件）
+        """
+        agent.event_token += 1
+        day = self.day + max(1, int(delay))
+        self.buckets[day].append((agent, agent.status, agent.event_token))
+
+    def advance(self) -> list:
+        """ 日付を進め、発生日を迎えたエージェントのリストを取得
+
+        登録後に状態が変化した（死亡・再登録など）エージェントのイベントは
+        無効として読み捨てる
+        """
+        self.day += 1
+        events = self.buckets.pop(self.day, [])
+        return [
+            agent
+            for agent, status, token in events
+            if agent.event_token == token and agent.status == status
+        ]
+
+    def __len__(self):
+        """ 登録済み（未発生）のイベント数 """
+        return sum(len(events) for events in self.buckets.values())
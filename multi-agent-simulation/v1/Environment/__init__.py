@@ -1,4 +1,5 @@
 from Environment.Environment import Environment
+from Environment.EventCalendar import EventCalendar
 from Environment.Hospital import Hospital
 from Environment.Section import Section, SeverityLevel
 from Environment.Government import Government
@@ -4,6 +4,8 @@ MASシミュレーションの結果記録オブジェクト
 import pandas as pd
 from tqdm import tqdm
 
+from Simulator.Reporter import Reporter
+
 
 class Recorder:
     def __init__(self, days):
@@ -37,6 +39,10 @@ class Recorder:
         self.start_emergency_in_all_episode = []
         self.end_emergency_in_all_episode = []
 
+        # 全エピソードの集計テーブル (Reporter で作成したものを使い回す)
+        self.seir_table = None
+        self.patients_table = None
+
     def clear_simulation_records(self):
         """ シミュレーション記録の削除 """
         self.s_values_in_all_episode = []
@@ -48,6 +54,8 @@ class Recorder:
         self.section_maps = []
         self.start_emergency_in_all_episode = []
         self.end_emergency_in_all_episode = []
+        self.seir_table = None
+        self.patients_table = None
 
     def clear_episode_record(self):
         """ エピソード記録の削除 """
@@ -70,6 +78,8 @@ class Recorder:
         self.snap_shots_in_all_episode.append(self.snap_shots)
         self.start_emergency_in_all_episode.append(self.start_emergency)
         self.end_emergency_in_all_episode.append(self.end_emergency)
+        self.seir_table = None
+        self.patients_table = None
 
     def append_seirp(self, s_value, e_value, i_value, r_value, p_value):
         """ SEIRの数値と病院患者数を記録 """
@@ -108,6 +118,20 @@ class Recorder:
             r = r[episode]
         return s, e, i, r
 
+    def get_seir_table(self):
+        """ 全エピソードのSEIRカウントのロングフォーマットテーブルを取得 """
+        if self.seir_table is None:
+            self.seir_table = Reporter.seir_table(*self.get_simulation_seir())
+        return self.seir_table
+
+    def get_patients_table(self):
+        """ 全エピソードの病床数のロングフォーマットテーブルを取得 """
+        if self.patients_table is None:
+            self.patients_table = Reporter.patients_table(
+                self.get_simulation_patients()
+            )
+        return self.patients_table
+
     def get_simulation_patients(self, episode=None):
         """ シミュレーション記録から病床数を取得します """
         if episode is not None:
@@ -135,57 +159,39 @@ class Recorder:
             ee = self.end_emergency_in_all_episode[episode]
         return se, ee
 
-    def output_logs(self, episode, path):
-        """ シミュレーションログを出力 """
+    def get_log_table(self, episode):
+        """ エピソードのシミュレーションログをテーブルとして取得 """
         s_val, e_val, i_val, r_val = self.get_simulation_seir(episode)
         p_val = self.get_simulation_patients(episode)
         se, ee = self.get_emergency_date(episode)
 
-        df = pd.DataFrame(
-            columns=[
-                "Day",
-                "Susceptable",
-                "Exposed",
-                "Infected",
-                "Recovered",
-                "Patients",
-                "Emergency",
-            ]
+        return pd.DataFrame(
+            {
+                "Day": self.t_values,
+                "Susceptable": s_val,
+                "Exposed": e_val,
+                "Infected": i_val,
+                "Recovered": r_val,
+                "Patients": p_val,
+                # 非常事態宣言の日付リストを復元
+                "Emergency": Reporter.emergency_flags(
+                    len(self.t_values), se, ee
+                ),
+            }
         )
 
-        # 非常事態宣言の日付リストを復元
-        emergency_date = []
-        emergency = False
-        for t in self.t_values:
-            if emergency:
-                if t in ee:
-                    emergency = False
-            else:
-                if t in se:
-                    emergency = True
-            emergency_date.append(emergency)
-
-        with tqdm(
-            zip(
-                self.t_values,
-                s_val,
-                e_val,
-                i_val,
-                r_val,
-                p_val,
-                emergency_date,
-            ),
-            total=len(self.t_values),
-        ) as pbar:
-            for t, s, e, i, r, p, emg in pbar:
-                pbar.set_description("[LogOutput: Episode {}]".format(episode))
-                record = pd.Series(index=df.columns, dtype="object")
-                record["Day"] = t
-                record["Susceptable"] = s
-                record["Exposed"] = e
-                record["Infected"] = i
-                record["Recovered"] = r
-                record["Patients"] = p
-                record["Emergency"] = emg
-                df = df.append(record, ignore_index=True)
-            df.to_csv(path, index=False)
+    def output_logs(self, episode, path):
+        """ シミュレーションログを出力 """
+        self.get_log_table(episode).to_csv(path, index=False)
+
+    def output_all_logs(self, path):
+        """ 全エピソードのシミュレーションログを1ファイルに出力
+
+        各エピソードのテーブルを Episode 列付きで順に追記する
+        """
+        episode_num = len(self.s_values_in_all_episode)
+        with open(path, mode="w", newline="") as f:
+            for episode in tqdm(range(episode_num), desc="[LogOutput]"):
+                df = self.get_log_table(episode)
+                df.insert(0, "Episode", episode)
+                df.to_csv(f, index=False, header=(episode == 0))
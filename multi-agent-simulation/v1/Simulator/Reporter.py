@@ -0,0 +1,108 @@
+"""
+シミュレーション記録の集計テーブル作成
+    Recorder が保持するエピソードごとの配列から、グラフ出力・ログ出力で
+    共通して使うロングフォーマットのテーブルを一括で作成する
+"""
+import numpy as np
+import pandas as pd
+
+from Agent import Status
+
+# SEIRチャートに出力する状態 (テーブル内の並び順)
+SEIR_STATUS = [
+    Status.SUSCEPTABLE.value,
+    Status.EXPOSED.value,
+    Status.INFECTED.value,
+    Status.RECOVERED.value,
+]
+
+
+class Reporter:
+    @classmethod
+    def seir_table(cls, s_values, e_values, i_values, r_values):
+        """ SEIRカウントのロングフォーマットテーブルを作成
+
+        Parameters
+        ----------
+        s_values, e_values, i_values, r_values : list of list of int
+            エピソードごとの日別カウント [episode][day]
+
+        Returns
+        -------
+        pandas.DataFrame
+            Episode, Day, Count, Status の4列からなるテーブル
+        """
+        # (episode, day, status) の3次元配列を作成して平坦化
+        counts = np.stack(
+            [
+                np.asarray(s_values, dtype=int),
+                np.asarray(e_values, dtype=int),
+                np.asarray(i_values, dtype=int),
+                np.asarray(r_values, dtype=int),
+            ],
+            axis=-1,
+        )
+        episode_num, days, status_num = counts.shape
+
+        return pd.DataFrame(
+            {
+                "Episode": np.repeat(
+                    np.arange(episode_num), days * status_num
+                ).astype(str),
+                "Day": np.tile(
+                    np.repeat(np.arange(days), status_num), episode_num
+                ),
+                "Count": counts.ravel(),
+                "Status": np.tile(SEIR_STATUS, episode_num * days),
+            }
+        )
+
+    @classmethod
+    def patients_table(cls, p_values):
+        """ 病院の患者数のロングフォーマットテーブルを作成
+
+        Parameters
+        ----------
+        p_values : list of list of int
+            エピソードごとの日別患者数 [episode][day]
+
+        Returns
+        -------
+        pandas.DataFrame
+            Episode, Day, Count の3列からなるテーブル
+        """
+        counts = np.asarray(p_values, dtype=int)
+        episode_num, days = counts.shape
+
+        return pd.DataFrame(
+            {
+                "Episode": np.repeat(np.arange(episode_num), days).astype(str),
+                "Day": np.tile(np.arange(days), episode_num),
+                "Count": counts.ravel(),
+            }
+        )
+
+    @classmethod
+    def emergency_flags(cls, length, start_emergency, end_emergency):
+        """ 非常事態宣言の発令状況を日付ごとのフラグ配列として復元
+
+        発令日に +1、解除日に -1 を加算した累積和が正の日を発令中とみなす
+
+        Parameters
+        ----------
+        length : int
+            フラグ配列の長さ (日付 0 から length - 1 まで)
+        start_emergency, end_emergency : list of int
+            非常事態宣言の発令日・解除日
+
+        Returns
+        -------
+        numpy.ndarray
+            発令中の日付が True となる bool 配列
+        """
+        toggle = np.zeros(length, dtype=int)
+        starts = [date for date in start_emergency if 0 <= date < length]
+        ends = [date for date in end_emergency if 0 <= date < length]
+        np.add.at(toggle, starts, 1)
+        np.add.at(toggle, ends, -1)
+        return np.cumsum(toggle) > 0
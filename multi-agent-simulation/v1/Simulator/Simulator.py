@@ -10,7 +10,7 @@ from loguru import logger
 from tqdm import tqdm
 
 from Environment import Environment
-from Simulator import Recorder
+from Simulator import Profiler, Recorder
 from Simulator.Visualizer import Visualizer
 
 logger.remove()
@@ -29,6 +29,8 @@ class Simulator:
         hospital_capacity,
         observation_period,
         has_apply_policy,
+        scheduling="daily",
+        profile=None,
     ):
         # シミュレートする感染症モデル
         self.infection_model = infection_model
@@ -51,12 +53,20 @@ class Simulator:
 
         # 政策を適用するか
         self.has_apply_policy = has_apply_policy
+        # 状態遷移の判定方式 ("daily" または "event")
+        self.scheduling = scheduling
 
         # データ記録
         self.recorder = Recorder(simulation_days)
 
+        # フェーズ別プロファイラ
+        # (profile: {"enabled", "trace_memory", "cprofile"} の設定情報)
+        self.profiler = Profiler.from_setting(profile)
+
     def one_epoch(self, env, day):
         """ 1回のepochを実行 (1-epoch = 1-day) """
+        profiler = self.profiler
+        agents_num = len(env.agents)
         public_sections = [
             sec for sec in env.sections if sec.attribute == "public"
         ]
@@ -64,42 +74,96 @@ class Simulator:
         # 1時間ごとに Agent を行動させる
         snap_shots = []
         for hour in env.active_time:
-            snap_shots.append(env.get_snap_shot_df())
+            with profiler.phase("snap_shot"):
+                snap_shots.append(env.get_snap_shot_df())
 
             # エージェントの次の位置を決定
-            for agent in env.agents:
-                # 同じ区画に属している Agent を記録
-                agent.neighbor_agents.extend(env.get_neighbor_agents(agent))
-                agent.decide_action(
-                    0, self.env_size, 0, self.env_size, public_sections, hour
-                )
+            # (近傍探索で全エージェントの組を走査する)
+            with profiler.phase("decide_action"):
+                self.decide_agents_action(env, public_sections, hour)
+            profiler.count(
+                "decide_action",
+                {
+                    "agents_processed": agents_num,
+                    "edges_scanned": agents_num ** 2,
+                },
+            )
             # エージェントの位置を更新
-            for agent in env.agents:
-                agent.do_action()
+            with profiler.phase("do_action"):
+                self.do_agents_action(env)
+            profiler.count("do_action", {"agents_processed": agents_num})
 
         # 1日が終了したら、Agent の状態を更新
+        with profiler.phase("decide_next_status"):
+            self.decide_agents_next_status(env)
+        with profiler.phase("update_status"):
+            self.update_agents_status(env)
+        profiler.count("decide_next_status", {"agents_processed": agents_num})
+        profiler.count("update_status", {"agents_processed": agents_num})
+
+        # 病院への収容・病院からの退院を実行
+        with profiler.phase("hospital"):
+            self.update_hospital(env)
+        profiler.count("hospital", {"agents_processed": agents_num})
+
+        # 非常事態宣言の発動判定
+        with profiler.phase("policy"):
+            self.update_policy(env)
+
+        return snap_shots
+
+    def decide_agents_action(self, env, public_sections, hour):
+        """ [時間単位] エージェントの次の位置を決定 """
+        for agent in env.agents:
+            # 同じ区画に属している Agent を記録
+            agent.neighbor_agents.extend(env.get_neighbor_agents(agent))
+            agent.decide_action(
+                0, self.env_size, 0, self.env_size, public_sections, hour
+            )
+
+    def do_agents_action(self, env):
+        """ [時間単位] エージェントの位置を更新 """
+        for agent in env.agents:
+            agent.do_action()
+
+    def decide_agents_next_status(self, env):
+        """ [日単位] エージェントを帰宅させ、次の状態を決定 """
         inactive_time = 24 - len(env.active_time)
+        scheduled = env.calendar is not None
         for agent in env.agents:
             # 外出中のエージェントを自宅に帰す
             agent.go_back_home()
             # familyと同居する影響を付与 (非アクティブ時間はfamilyと接触する)
             agent.neighbor_agents.extend(agent.family * inactive_time)
-            agent.decide_next_status()
+            agent.decide_next_status(scheduled)
+
+        # 発生日を迎えた状態遷移を反映 (イベント方式の場合のみ)
+        env.fire_due_transitions()
+
+    def update_agents_status(self, env):
+        """ [日単位] エージェントの状態を更新 """
+        scheduled = env.calendar is not None
         for agent in env.agents:
+            status = agent.status
             agent.update_status()
+            if scheduled and agent.status != status:
+                # 次の状態遷移をイベントカレンダーに登録
+                env.schedule_transition(agent)
 
-        # 病院への収容・病院からの退院を実行
-        #   - 入院処理 => 退院処理の順に実行
-        #     (空いた病床に新たな患者が入るのは早くても翌日になる)
+    def update_hospital(self, env):
+        """ [日単位] 病院への収容・病院からの退院を実行
+
+        入院処理 => 退院処理の順に実行
+        (空いた病床に新たな患者が入るのは早くても翌日になる)
+        """
         env.accommodate_to_hospital()
         env.leave_from_hospital()
 
-        # 非常事態宣言の発動判定
+    def update_policy(self, env):
+        """ [日単位] 非常事態宣言の発動判定と政策の適用 """
         env.update_goverment()
         env.apply_policy()
 
-        return snap_shots
-
     def run(self):
         """ シミュレーションを実行 """
         self.clear_output_dirs()
@@ -119,49 +183,35 @@ class Simulator:
                 self.hospital_capacity,
                 self.observation_period,
                 self.has_apply_policy,
+                self.scheduling,
             )
             env.init_agents(self.init_infected_num)
             self.recorder.append_section_map(env.get_sections())
 
-            # 初期状態を記録
-            susceptable_num = env.count_susceptable()
-            exposed_num = env.count_exposed()
-            infected_num = env.count_infected()
-            recovered_num = env.count_recovered()
-            patients_num = env.count_hospital_parients()
             logger.info(
                 "Population density: {} [members/square]".format(
                     self.population / (self.env_size ** 2)
                 )
             )
 
+            # 初期状態を記録
             self.recorder.clear_episode_record()
-            self.recorder.append_seirp(
-                susceptable_num,
-                exposed_num,
-                infected_num,
-                recovered_num,
-                patients_num,
-            )
+            self.save_record(env)
+            self.profiler.start_episode(episode)
 
             with tqdm(range(self.simulation_days)) as pbar:
                 emergency = False
                 for day in pbar:
                     snap_shots = self.one_epoch(env, day + 1)
 
-                    susceptable_num = env.count_susceptable()
-                    exposed_num = env.count_exposed()
-                    infected_num = env.count_infected()
-                    recovered_num = env.count_recovered()
-                    patients_num = env.count_hospital_parients()
-
-                    self.recorder.append_seirp(
-                        susceptable_num,
-                        exposed_num,
-                        infected_num,
-                        recovered_num,
-                        patients_num,
-                    )
+                    with self.profiler.phase("save_record"):
+                        (
+                            susceptable_num,
+                            exposed_num,
+                            infected_num,
+                            recovered_num,
+                            patients_num,
+                        ) = self.save_record(env)
                     self.recorder.append_snap_shot(snap_shots)
 
                     if env.is_emergency - emergency == 1:
@@ -188,14 +238,28 @@ class Simulator:
                         )
                     )
             self.recorder.update_simulation_records()
+            self.profiler.end_episode()
         logger.info("シミュレーション終了")
 
+    def save_record(self, env):
+        """ [日単位] 状態別のエージェント数と病院の患者数を記録 """
+        counts = (
+            env.count_susceptable(),
+            env.count_exposed(),
+            env.count_infected(),
+            env.count_recovered(),
+            env.count_hospital_parients(),
+        )
+        self.recorder.append_seirp(*counts)
+        return counts
+
     def clear_output_dirs(self):
         """ 出力ディレクトリの中身をクリア """
         target_dirs = [
             "outputs/animations/*.mp4",
             "outputs/images/*.png",
             "outputs/logs/*.csv",
+            "outputs/profile/*.prof",
         ]
         logger.info("出力ディレクトリの中身をクリアします")
         for target_dir in target_dirs:
@@ -204,15 +268,38 @@ class Simulator:
                     os.remove(path)
         logger.info("出力ディレクトリの中身をクリアしました")
 
-    def output_logs(self):
-        """ シミュレーションログを出力 """
+    def output_logs(self, single_file=False):
+        """ シミュレーションログを出力
+
+        Parameters
+        ----------
+        single_file : bool, optional
+            True の場合、全エピソードのログを Episode 列付きの
+            1ファイル (episodes.csv) にまとめて出力
+        """
         logger.info("ログ出力を開始します")
+        if single_file:
+            self.recorder.output_all_logs("outputs/logs/episodes.csv")
+            logger.info("episodes.csv を出力しました")
+            return
+
         output_logs = self.recorder.output_logs
         for episode in range(self.episode_num):
             path = "outputs/logs/episode-{}.csv".format(episode)
             output_logs(episode, path)
             logger.info("episode-{}.csv を出力しました".format(episode))
 
+    def output_profile(self):
+        """ フェーズ別のプロファイル結果を出力（プロファイラ有効時のみ） """
+        if not self.profiler.enabled:
+            return
+        self.profiler.output("outputs/logs/profile.csv")
+        logger.info("profile.csv を出力しました")
+
+        if self.profiler.cprofile:
+            self.profiler.dump_cprofile("outputs/profile")
+            logger.info("cProfile の統計を outputs/profile に出力しました")
+
     def output_environment_section_map(self):
         """ Environment の区画マップを出力 """
         logger.info("区画マップ出力を開始します")
@@ -234,7 +321,9 @@ class Simulator:
             output_seir_chart(episode, s, e, i, r, se, ee, path)
             logger.info("episode-{}.png を出力しました".format(episode))
 
-    def output_aggregated_seir_chart(self, title=None, estimator="mean"):
+    def output_aggregated_seir_chart(
+        self, title=None, estimator="mean", quantiles=None
+    ):
         """ 集計結果のSEIRチャートを出力
         
         Parameters
@@ -242,8 +331,10 @@ class Simulator:
         title : str, optional
             タイトル
         estimator : str, optional
-            集計方法（デフォルトは平均値）
+            集計方法（"mean" または "median"、デフォルトは平均値）
             Noneを指定した場合は、全エピソードの結果を重ねてプロット
+        quantiles : list of float, optional
+            信頼区間に加えて描画する分位点 (例: [0.05, 0.95])
         """
         logger.info("集計結果ラインチャートの出力を開始します estimator:{}".format(estimator))
         s, e, i, r = self.recorder.get_simulation_seir()
@@ -252,7 +343,18 @@ class Simulator:
         if estimator is not None:
             path = "outputs/images/aggrigated-{}.png".format(estimator)
         Visualizer.output_aggregated_seir_chart(
-            self.episode_num, s, e, i, r, se, ee, path, title, estimator
+            self.episode_num,
+            s,
+            e,
+            i,
+            r,
+            se,
+            ee,
+            path,
+            title,
+            estimator,
+            quantiles,
+            table=self.recorder.get_seir_table(),
         )
         logger.info("集計結果ラインチャートを出力しました")
 
@@ -271,7 +373,7 @@ class Simulator:
             logger.info("patients-episode-{}.png を出力しました".format(episode))
 
     def output_hospital_patients_aggregated_chart(
-        self, title=None, estimator="mean"
+        self, title=None, estimator="mean", quantiles=None
     ):
         """ 病院の患者数集計ラインチャートを出力
 
@@ -280,8 +382,10 @@ class Simulator:
         title : str, optional
             タイトル
         estimator : str, optional
-            集計方法（デフォルトは平均値）
+            集計方法（"mean" または "median"、デフォルトは平均値）
             Noneを指定した場合は、全エピソードの結果を重ねてプロット
+        quantiles : list of float, optional
+            信頼区間に加えて描画する分位点 (例: [0.05, 0.95])
         """
         logger.info("病院の患者数集計グラフの出力を開始します")
         p = self.recorder.get_simulation_patients()
@@ -291,7 +395,14 @@ class Simulator:
                 estimator
             )
         Visualizer.output_hospital_patients_aggregated_chart(
-            self.episode_num, self.hospital_capacity, p, path, title, estimator
+            self.episode_num,
+            self.hospital_capacity,
+            p,
+            path,
+            title,
+            estimator,
+            quantiles,
+            table=self.recorder.get_patients_table(),
         )
         logger.info("病院の患者数集計グラフを出力しました")
 
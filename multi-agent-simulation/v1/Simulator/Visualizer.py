@@ -5,13 +5,33 @@ import math
 import itertools
 
 import matplotlib.animation as animation
+import matplotlib.colors as colors
 import matplotlib.patches as patches
 import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 import seaborn as sns
 from tqdm import tqdm
 
 from Agent import Status
+from Simulator.ConfidenceBand import ConfidenceBand
+from Simulator.Reporter import Reporter
+
+# アニメーションの描画色 (ステータスコードをインデックスとする参照配列)
+STATUS_CODES = {
+    Status.SUSCEPTABLE: 0,
+    Status.EXPOSED: 1,
+    Status.INFECTED: 2,
+    Status.RECOVERED: 3,
+}
+PATIENT_CODE = 4
+STATUS_COLORS = [
+    "lightskyblue",
+    "orange",
+    "red",
+    "lightgreen",
+    # 病院に収容されている感染者
+    "darkgrey",
+]
 
 
 class Visualizer:
@@ -60,48 +80,9 @@ class Visualizer:
         """ SEIRチャートを出力 """
         plt.clf()
 
-        df = pd.DataFrame(columns=["Day", "Count", "Status"])
-        with tqdm(
-            zip(
-                list(range(len(s_values))),
-                s_values,
-                e_values,
-                i_values,
-                r_values,
-            ),
-            total=len(s_values),
-        ) as pbar:
-            for t, s, e, i, r in pbar:
-                pbar.set_description(
-                    "[LineChartOutput: Episode {}]".format(episode)
-                )
-
-                s_record = pd.Series(index=df.columns, dtype="object")
-                s_record["Day"] = t
-                s_record["Count"] = s
-                s_record["Status"] = Status.SUSCEPTABLE.value
-                df = df.append(s_record, ignore_index=True)
-
-                e_record = pd.Series(index=df.columns, dtype="object")
-                e_record["Day"] = t
-                e_record["Count"] = e
-                e_record["Status"] = Status.EXPOSED.value
-                df = df.append(e_record, ignore_index=True)
-
-                i_record = pd.Series(index=df.columns, dtype="object")
-                i_record["Day"] = t
-                i_record["Count"] = i
-                i_record["Status"] = Status.INFECTED.value
-                df = df.append(i_record, ignore_index=True)
-
-                r_record = pd.Series(index=df.columns, dtype="object")
-                r_record["Day"] = t
-                r_record["Count"] = r
-                r_record["Status"] = Status.RECOVERED.value
-                df = df.append(r_record, ignore_index=True)
-
-        df["Day"] = df["Day"].astype(int)
-        df["Count"] = df["Count"].astype(int)
+        df = Reporter.seir_table(
+            [s_values], [e_values], [i_values], [r_values]
+        )
 
         sns.lineplot(x="Day", y="Count", hue="Status", data=df)
 
@@ -125,50 +106,19 @@ class Visualizer:
         path,
         title=None,
         estimator="mean",
+        quantiles=None,
+        table=None,
     ):
-        """ 集計SEIRチャートを出力 """
+        """ 集計SEIRチャートを出力
+
+        table に Reporter.seir_table() で作成済みのテーブルを渡した場合、
+        s_values 等からのテーブル作成を省略する
+        """
         plt.clf()
 
-        df = pd.DataFrame(columns=["Episode", "Day", "Count", "Status"])
-        for episode in tqdm(range(episode_num)):
-            s_val = s_values[episode]
-            e_val = e_values[episode]
-            i_val = i_values[episode]
-            r_val = r_values[episode]
-            t_val = list(range(len(s_val)))
-            for t, s, e, i, r in zip(t_val, s_val, e_val, i_val, r_val):
-                s_record = pd.Series(index=df.columns, dtype="object")
-                s_record["Episode"] = episode
-                s_record["Day"] = t
-                s_record["Count"] = s
-                s_record["Status"] = Status.SUSCEPTABLE.value
-                df = df.append(s_record, ignore_index=True)
-
-                e_record = pd.Series(index=df.columns, dtype="object")
-                e_record["Episode"] = episode
-                e_record["Day"] = t
-                e_record["Count"] = e
-                e_record["Status"] = Status.EXPOSED.value
-                df = df.append(e_record, ignore_index=True)
-
-                i_record = pd.Series(index=df.columns, dtype="object")
-                i_record["Episode"] = episode
-                i_record["Day"] = t
-                i_record["Count"] = i
-                i_record["Status"] = Status.INFECTED.value
-                df = df.append(i_record, ignore_index=True)
-
-                r_record = pd.Series(index=df.columns, dtype="object")
-                r_record["Episode"] = episode
-                r_record["Day"] = t
-                r_record["Count"] = r
-                r_record["Status"] = Status.RECOVERED.value
-                df = df.append(r_record, ignore_index=True)
-
-        df["Episode"] = df["Episode"].astype(str)
-        df["Day"] = df["Day"].astype(int)
-        df["Count"] = df["Count"].astype(int)
-        df["Status"] = df["Status"].astype(str)
+        df = table
+        if df is None:
+            df = Reporter.seir_table(s_values, e_values, i_values, r_values)
 
         if title is not None:
             plt.title(title)
@@ -183,9 +133,25 @@ class Visualizer:
                 data=df,
             )
         else:
-            sns.lineplot(
-                x="Day", y="Count", hue="Status", estimator=estimator, data=df
-            )
+            # エピソード間の集計値と信頼区間を Status ごとに描画
+            palette = sns.color_palette()
+            for idx, status in enumerate(df["Status"].unique()):
+                band = ConfidenceBand.from_frame(
+                    df[df["Status"] == status],
+                    x="Day",
+                    y="Count",
+                    units="Episode",
+                    quantiles=quantiles,
+                    keep_samples=estimator == "median",
+                )
+                band.plot(
+                    label=status,
+                    color=palette[idx % len(palette)],
+                    estimator=estimator,
+                )
+            plt.xlabel("Day")
+            plt.ylabel("Count")
+            plt.legend()
 
         # 非常事態宣言の発令・解除日をプロット
         ymax = max(list(itertools.chain.from_iterable(s_values)))
@@ -201,20 +167,7 @@ class Visualizer:
         plt.clf()
         plt.ylim(0, capacity)
 
-        df = pd.DataFrame(columns=["Day", "Count"])
-        with tqdm(p_values) as pbar:
-            for t, p in enumerate(pbar):
-                pbar.set_description(
-                    "[PatientsChartOutput: Episode {}]".format(episode)
-                )
-
-                record = pd.Series(index=df.columns, dtype="object")
-                record["Day"] = t
-                record["Count"] = p
-                df = df.append(record, ignore_index=True)
-
-        df["Day"] = df["Day"].astype(int)
-        df["Count"] = df["Count"].astype(int)
+        df = Reporter.patients_table([p_values])
 
         sns.lineplot(x="Day", y="Count", data=df)
         plt.savefig(path)
@@ -228,24 +181,20 @@ class Visualizer:
         path,
         title=None,
         estimator="mean",
+        quantiles=None,
+        table=None,
     ):
-        """ 病院の患者数推移の集計チャートを出力 """
+        """ 病院の患者数推移の集計チャートを出力
+
+        table に Reporter.patients_table() で作成済みのテーブルを渡した場合、
+        p_values からのテーブル作成を省略する
+        """
         plt.clf()
         plt.ylim(0, capacity)
 
-        df = pd.DataFrame(columns=["Episode", "Day", "Count"])
-        for episode in tqdm(range(episode_num)):
-            p_val = p_values[episode]
-            for t, p in enumerate(p_val):
-                record = pd.Series(index=df.columns, dtype="object")
-                record["Episode"] = episode
-                record["Day"] = t
-                record["Count"] = p
-                df = df.append(record, ignore_index=True)
-
-        df["Episode"] = df["Episode"].astype(str)
-        df["Day"] = df["Day"].astype(int)
-        df["Count"] = df["Count"].astype(int)
+        df = table
+        if df is None:
+            df = Reporter.patients_table(p_values)
 
         if title is not None:
             plt.title(title)
@@ -259,7 +208,17 @@ class Visualizer:
                 data=df,
             )
         else:
-            sns.lineplot(x="Day", y="Count", estimator=estimator, data=df)
+            band = ConfidenceBand.from_frame(
+                df,
+                x="Day",
+                y="Count",
+                units="Episode",
+                quantiles=quantiles,
+                keep_samples=estimator == "median",
+            )
+            band.plot(estimator=estimator)
+            plt.xlabel("Day")
+            plt.ylabel("Count")
         plt.savefig(path)
 
     @classmethod
@@ -274,18 +233,14 @@ class Visualizer:
         path,
         interval=200,
     ):
-        """ シミュレーション結果のアニメーション出力 """
-        # 非常事態宣言の日付リストを復元
-        emergency_date = []
-        emergency = False
-        for t, _ in enumerate(snap_shots):
-            if emergency:
-                if t + 1 in ee:
-                    emergency = False
-            else:
-                if t + 1 in se:
-                    emergency = True
-            emergency_date.append(emergency)
+        """ シミュレーション結果のアニメーション出力
+
+        1つの scatter を使い回して座標と色だけを更新し、
+        フレームを1枚ずつ ffmpeg に書き出す
+        """
+        # 非常事態宣言の日付リストを復元 (スナップショット t は t+1 日目)
+        emergency_date = Reporter.emergency_flags(len(snap_shots) + 1, se, ee)
+        emergency_date = emergency_date[1:]
 
         plt.clf()
         fig = plt.figure()
@@ -295,7 +250,6 @@ class Visualizer:
         plt.xlim(-margin, env_size + margin)
         plt.ylim(-margin, env_size + margin)
 
-        artists = []
         rectangle = patches.Rectangle
         for section in section_map:
             fill_color = (
@@ -315,45 +269,57 @@ class Visualizer:
         plt.axis("scaled")
         ax.set_aspect("equal")
 
-        scatter = ax.scatter
-        text = ax.text
-        with tqdm(snap_shots) as pbar:
-            for d_idx, snap_shots_in_hours in enumerate(pbar):
-                pbar.set_description(
-                    "[AnimationOutput: Episode {}]".format(episode)
-                )
-                is_emergency_day = emergency_date[d_idx]
-
-                for h_idx, df in enumerate(snap_shots_in_hours):
-                    df.loc[
-                        df["status"] == Status.SUSCEPTABLE, "color"
-                    ] = "lightskyblue"
-                    df.loc[df["status"] == Status.EXPOSED, "color"] = "orange"
-                    df.loc[
-                        (df["status"] == Status.INFECTED)
-                        & ~(df["is_patient"]),
-                        "color",
-                    ] = "red"
-                    df.loc[
-                        (df["status"] == Status.INFECTED) & (df["is_patient"]),
-                        "color",
-                    ] = "darkgrey"
-                    df.loc[
-                        df["status"] == Status.RECOVERED, "color"
-                    ] = "lightgreen"
-
-                    artist = scatter(df["x"], df["y"], s=10, c=df["color"])
-                    title = text(
-                        0,
-                        0,
-                        "Day:{} Hour:{} {}".format(
-                            d_idx + 1,
-                            h_idx + 7,
-                            "<<EMERGENCY>>" if is_emergency_day else "",
-                        ),
-                        fontsize="small",
-                    )
-                    artists.append([artist, title])
+        palette = colors.to_rgba_array(STATUS_COLORS)
+        scatter = ax.scatter([], [], s=10)
+        title = ax.text(0, 0, "", fontsize="small")
 
-        anim = animation.ArtistAnimation(fig, artists, interval=interval)
+        def frames():
+            with tqdm(snap_shots) as pbar:
+                for d_idx, snap_shots_in_hours in enumerate(pbar):
+                    pbar.set_description(
+                        "[AnimationOutput: Episode {}]".format(episode)
+                    )
+                    for h_idx, df in enumerate(snap_shots_in_hours):
+                        yield d_idx, h_idx, df
+
+        def init():
+            scatter.set_offsets(np.empty((0, 2)))
+            title.set_text("")
+            return scatter, title
+
+        def update(frame):
+            d_idx, h_idx, df = frame
+            scatter.set_offsets(df[["x", "y"]].to_numpy(dtype=float))
+            scatter.set_color(palette[cls._get_status_codes(df)])
+            title.set_text(
+                "Day:{} Hour:{} {}".format(
+                    d_idx + 1,
+                    h_idx + 7,
+                    "<<EMERGENCY>>" if emergency_date[d_idx] else "",
+                )
+            )
+            return scatter, title
+
+        frame_num = sum(len(hours) for hours in snap_shots)
+        anim = animation.FuncAnimation(
+            fig,
+            update,
+            frames=frames,
+            init_func=init,
+            interval=interval,
+            blit=True,
+            save_count=frame_num,
+            cache_frame_data=False,
+        )
         anim.save(path, writer="ffmpeg")
+        plt.close(fig)
+
+    @classmethod
+    def _get_status_codes(cls, df):
+        """ スナップショットの各エージェントの描画色コードを取得 """
+        codes = df["status"].map(STATUS_CODES).to_numpy(dtype=int)
+        is_patient = df["is_patient"].to_numpy(dtype=bool)
+        codes[(codes == STATUS_CODES[Status.INFECTED]) & is_patient] = (
+            PATIENT_CODE
+        )
+        return codes
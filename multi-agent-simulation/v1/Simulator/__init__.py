@@ -1,4 +1,7 @@
+from Simulator.ConfidenceBand import ConfidenceBand
 from Simulator.InfectionModel import Infection
+from Simulator.Profiler import Profiler
 from Simulator.Recorder import Recorder
+from Simulator.Reporter import Reporter
 from Simulator.Simulator import Simulator
 from Simulator.Visualizer import Visualizer
@@ -0,0 +1,263 @@
+"""
+MASシミュレーターのフェーズ別ベンチマーク
+    人口ごとに時間単位・日単位の各フェーズの処理時間を計測し、JSON で出力する
+
+    計測:
+        python benchmark.py --populations 1000 10000 --days 3 -o bench.json
+    比較:
+        python benchmark.py --compare before.json after.json
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
+import numpy as np
+from loguru import logger
+
+from Environment import Environment
+from Simulator import Infection, Simulator
+from main import INFECTION_PARAMS, SIMULATION_PARAMS
+
+# 計測する人口のデフォルト値
+DEFAULT_POPULATIONS = [1000, 10000, 100000, 1000000]
+
+# 計測対象のフェーズ (フェーズ名, Simulator のメソッド名)
+PHASES = [
+    ("decide_action", "decide_agents_action"),
+    ("do_action", "do_agents_action"),
+    ("decide_next_status", "decide_agents_next_status"),
+    ("update_status", "update_agents_status"),
+    ("hospital", "update_hospital"),
+    ("policy", "update_policy"),
+    ("save_record", "save_record"),
+]
+
+
+class PhaseTimer:
+    def __init__(self):
+        # フェーズごとの累積時間 [sec] と呼び出し回数
+        self.elapsed = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def wrap(self, obj, method_name, phase):
+        """ obj のメソッドを計測付きのメソッドに差し替え """
+        method = getattr(obj, method_name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.elapsed[phase] += time.perf_counter() - start
+                self.calls[phase] += 1
+
+        setattr(obj, method_name, timed)
+
+    def get_result(self, days):
+        """ フェーズ別の計測結果を取得 """
+        return OrderedDict(
+            (
+                phase,
+                {
+                    "total_sec": self.elapsed[phase],
+                    "calls": self.calls[phase],
+                    "per_day_sec": self.elapsed[phase] / days,
+                },
+            )
+            for phase in self.elapsed
+        )
+
+
+def run_benchmark(population, days, seed):
+    """ 人口 population のシミュレーションを days 日分実行して計測 """
+    random.seed(seed)
+    np.random.seed(seed)
+
+    # 人口密度を main.py の設定と揃えるように環境サイズを決定
+    params = dict(SIMULATION_PARAMS)
+    density = params["population"] / (params["env_size"] ** 2)
+    params["env_size"] = math.ceil(math.sqrt(population / density))
+    params["population"] = population
+    params["init_infected_num"] = max(
+        1,
+        round(
+            population
+            * SIMULATION_PARAMS["init_infected_num"]
+            / SIMULATION_PARAMS["population"]
+        ),
+    )
+    params["simulation_days"] = days
+    params["episode_num"] = 1
+
+    infection_model = Infection(**INFECTION_PARAMS)
+    simulator = Simulator(infection_model=infection_model, **params)
+
+    timer = PhaseTimer()
+    start = time.perf_counter()
+    env = Environment(
+        params["env_size"],
+        population,
+        infection_model,
+        params["hospital_capacity"],
+        params["observation_period"],
+        params["has_apply_policy"],
+        params["scheduling"],
+    )
+    env.init_agents(params["init_infected_num"])
+    setup_sec = time.perf_counter() - start
+
+    for phase, method_name in PHASES:
+        timer.wrap(simulator, method_name, phase)
+    timer.wrap(env, "get_snap_shot_df", "snap_shot")
+
+    simulator.recorder.clear_episode_record()
+    start = time.perf_counter()
+    for day in range(days):
+        simulator.one_epoch(env, day + 1)
+        simulator.save_record(env)
+    run_sec = time.perf_counter() - start
+
+    return OrderedDict(
+        population=population,
+        env_size=params["env_size"],
+        setup_sec=setup_sec,
+        run_sec=run_sec,
+        per_day_sec=run_sec / days,
+        phases=timer.get_result(days),
+    )
+
+
+def get_commit():
+    """ 現在のコミットハッシュを取得 """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(populations, days, seed, max_seconds):
+    """ 人口ごとのベンチマークを実行 """
+    results = []
+    exceeded = False
+    for population in populations:
+        if exceeded:
+            # 前段の計測が制限時間を超えた場合、より大きな人口はスキップ
+            logger.info("population={} をスキップします".format(population))
+            results.append(OrderedDict(population=population, skipped=True))
+            continue
+
+        logger.info("population={} の計測を開始します".format(population))
+        result = run_benchmark(population, days, seed)
+        logger.info(
+            "population={} setup:{:.2f}s run:{:.2f}s".format(
+                population, result["setup_sec"], result["run_sec"]
+            )
+        )
+        results.append(result)
+        exceeded = result["setup_sec"] + result["run_sec"] > max_seconds
+
+    return OrderedDict(
+        meta=OrderedDict(
+            version="v1",
+            commit=get_commit(),
+            timestamp=datetime.now().isoformat(),
+            python=platform.python_version(),
+            machine=platform.machine(),
+            days=days,
+            seed=seed,
+        ),
+        results=results,
+    )
+
+
+def compare(base_path, target_path, threshold):
+    """ 2つのベンチマーク結果を比較し、劣化したフェーズがあれば False を返す """
+    with open(base_path, mode="r") as f:
+        base = json.load(f)
+    with open(target_path, mode="r") as f:
+        target = json.load(f)
+
+    base_results = {
+        r["population"]: r for r in base["results"] if not r.get("skipped")
+    }
+    passed = True
+    print(
+        "{:>10} {:>20} {:>12} {:>12} {:>8}".format(
+            "population", "phase", "base[s]", "target[s]", "ratio"
+        )
+    )
+    for result in target["results"]:
+        base_result = base_results.get(result["population"])
+        if result.get("skipped") or base_result is None:
+            continue
+        for phase, values in result["phases"].items():
+            if phase not in base_result["phases"]:
+                continue
+            base_sec = base_result["phases"][phase]["per_day_sec"]
+            target_sec = values["per_day_sec"]
+            ratio = target_sec / base_sec if base_sec > 0 else float("inf")
+            mark = ""
+            if ratio > threshold:
+                mark = " <<"
+                passed = False
+            print(
+                "{:>10} {:>20} {:>12.4f} {:>12.4f} {:>8.2f}{}".format(
+                    result["population"],
+                    phase,
+                    base_sec,
+                    target_sec,
+                    ratio,
+                    mark,
+                )
+            )
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フェーズ別ベンチマーク")
+    parser.add_argument(
+        "--populations", type=int, nargs="+", default=DEFAULT_POPULATIONS
+    )
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=600,
+        help="この秒数を超えた場合、以降の人口の計測をスキップ",
+    )
+    parser.add_argument("-o", "--output", default="benchmark_v1.json")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASE", "TARGET"), default=None
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="比較時に劣化とみなす処理時間の比率",
+    )
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        passed = compare(*args.compare, args.threshold)
+        sys.exit(0 if passed else 1)
+
+    report = benchmark(
+        args.populations, args.days, args.seed, args.max_seconds
+    )
+    with open(args.output, mode="w") as f:
+        json.dump(report, f, indent=2)
+    logger.info("ベンチマーク結果 {} を出力しました".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 """
 MASシミュレーションの実行コード
 """
+import argparse
+
 from Simulator import Infection, Simulator
 
 # シミュレーションパラメータ
@@ -21,6 +23,8 @@ SIMULATION_PARAMS = {
     "observation_period": 5,
     # 政策を適用するか
     "has_apply_policy": True,
+    # 状態遷移の判定方式 (daily: 毎日判定, event: イベントカレンダーで管理)
+    "scheduling": "daily",
 }
 
 # 感染症パラメータ
@@ -43,12 +47,28 @@ INFECTION_PARAMS = {
 
 
 def main():
+    parser = argparse.ArgumentParser(description="MASシミュレーション")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="フェーズ別のプロファイル結果と cProfile の統計を出力",
+    )
+    args = parser.parse_args()
+
+    # --profile 指定時はフェーズ別の計測と cProfile の統計出力を有効化
+    profile = {"enabled": True, "cprofile": True} if args.profile else None
+
     infection_model = Infection(**INFECTION_PARAMS)
-    simulator = Simulator(infection_model=infection_model, **SIMULATION_PARAMS)
+    simulator = Simulator(
+        infection_model=infection_model, profile=profile, **SIMULATION_PARAMS
+    )
 
     # シミュレーション実行
     simulator.run()
 
+    # プロファイル結果出力
+    simulator.output_profile()
+
     # 区画マップ出力
     simulator.output_environment_section_map()
 
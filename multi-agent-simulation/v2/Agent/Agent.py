@@ -3,7 +3,6 @@
 """
 from __future__ import annotations
 
-import random
 from typing import List
 
 import numpy as np
@@ -49,6 +48,10 @@ class Agent:
 
         # 潜伏日数（発症までの残り日数）
         self.incubation_count = 0
+        # イベントカレンダーに登録中の状態遷移の識別トークン
+        self.event_token = 0
+        # イベントカレンダーに登録中の状態遷移の発生日
+        self.event_due_day = 0
 
         # 体力
         physical_settings = agent_setting["params"]["physical"]
@@ -80,6 +83,54 @@ class Agent:
         # 公務員かどうか（公務員の場合 env から収入を得られる）
         self.is_civil_servant = False
 
+    # プロセス間で受け渡す状態の項目
+    RECORD_FIELDS = (
+        "incubation_count",
+        "stay_period",
+        "physical_strength",
+        "immunity",
+        "mental_stabilize_point",
+        "mental_strength",
+        "income_stabilize_point",
+        "income",
+        "is_civil_servant",
+    )
+
+    @classmethod
+    def from_record(
+        cls, record: dict, agent_setting: dict, infection_model: InfectionModel
+    ) -> Agent:
+        """ to_record() で取得したレコードからエージェントを復元 """
+        agent = cls(
+            agent_setting=agent_setting,
+            id=record["id"],
+            age=record["age"],
+            hometown=record["hometown"],
+            status=Status(record["status"]),
+            infection_model=infection_model,
+        )
+        agent.apply_record(record)
+        return agent
+
+    def to_record(self) -> dict:
+        """ 他のプロセスに受け渡すための状態を辞書形式で取得 """
+        record = {
+            "code": self.code,
+            "id": self.id,
+            "age": self.age,
+            "hometown": self.hometown,
+            "status": self.status.value,
+        }
+        for field in self.RECORD_FIELDS:
+            record[field] = getattr(self, field)
+        return record
+
+    def apply_record(self, record: dict):
+        """ to_record() で取得したレコードの状態を反映 """
+        self.status = Status(record["status"])
+        for field in self.RECORD_FIELDS:
+            setattr(self, field, record[field])
+
     @property
     def is_living(self):
         """ 生存しているかどうか """
@@ -128,11 +179,11 @@ class Agent:
             # 売り手の場合 => 所得は増加
             self.trade_price = +price
 
-    def get_trade_price(self) -> int:
+    def get_trade_price(self, rng=np.random) -> int:
         """ 取引額を決定 """
         base_line = abs(self.income_stabilize_point - self.income)
         scale = base_line * 0.5
-        price = np.random.normal(loc=base_line, scale=scale)
+        price = rng.normal(loc=base_line, scale=scale)
         price = min(price, self.income)
 
         min_price = self.agent_setting["params"]["economical"][
@@ -145,8 +196,15 @@ class Agent:
         price = max(price, min_price)
         return int(price)
 
-    def decide_next_status(self, neighbors: List[Agent]):
-        """ エージェントの次ステータスを決定 """
+    def decide_next_status(
+        self, neighbors: List[Agent], scheduled: bool = False, rng=np.random
+    ):
+        """ エージェントの次ステータスを決定
+
+        scheduled が True の場合、EXPOSED / INFECTED からの遷移は
+        イベントカレンダーで管理されるため、ここでは判定しない
+        rng には乱数生成器（np.random または np.random.Generator）を指定する
+        """
         # エージェントの状態変化ルール
         #  [現在の状態]  [状態変化ルール]
         #  (ALL)        体力がゼロになった場合 DEATH に推移
@@ -173,10 +231,13 @@ class Agent:
             prob = 1 - (
                 (1 - self.infection_model.infection_prob) ** len(infecteds)
             )
-            if random.random() <= prob:
+            if rng.random() <= prob:
                 self.next_status = Status.EXPOSED
                 self.incubation_count = self.infection_model.incubation_period
 
+        if scheduled:
+            return
+
         # EXPOSED
         if self.status == Status.EXPOSED:
             count = self.incubation_count - 1
@@ -186,10 +247,17 @@ class Agent:
 
         # INFECTED
         if self.status == Status.INFECTED:
-            if random.random() <= self.infection_model.recovery_prob:
+            if rng.random() <= self.infection_model.recovery_prob:
                 self.next_status = Status.RECOVERED
 
-    def decide_trade_action(self) -> str:
+    def fire_scheduled_transition(self):
+        """ イベントカレンダーで発生日を迎えた状態遷移を次ステータスに反映 """
+        if self.status == Status.EXPOSED:
+            self.next_status = Status.INFECTED
+        elif self.status == Status.INFECTED:
+            self.next_status = Status.RECOVERED
+
+    def decide_trade_action(self, rng=np.random) -> str:
         """ 取引アクションを決定 """
         # 取引アクションの種類:
         #     sell (売り手): 自身の所得を増加させる取引
@@ -211,10 +279,9 @@ class Agent:
         # isp と income の差から sell と buy の比重を算出
         max_val = self.income_stabilize_point * 2
         buy_w = min(self.income / max_val, 1)
-        sell_w = 1 - buy_w
 
-        # 取引アクションを確率で決定
-        action = random.choices(["buy", "sell"], weights=[buy_w, sell_w])[0]
+        # 取引アクションを確率で決定（sell の確率は 1 - buy_w）
+        action = "buy" if rng.random() < buy_w else "sell"
         return action
 
     def receive_salary(self, salary):
@@ -243,10 +310,10 @@ class Agent:
         # 体力値を更新（ダメージ量分を減算）
         self.physical_strength = max(self.physical_strength - damage, 0)
 
-    def update_mental_strength(self):
+    def update_mental_strength(self, rng=np.random):
         """ 精神力を更新 """
         # メンタルの更新方向を決定（positive/negative)
-        vec = np.random.normal(
+        vec = rng.normal(
             loc=self.mental_stabilize_point, scale=self.stabilize_scale
         )
         pn = 1 if vec > self.mental_stabilize_point else -1
@@ -254,7 +321,7 @@ class Agent:
         # メンタルの更新量を決定（カイ二乗分布で移動量を決定）
         df = self.emotional_instability_setting["degree_of_freedom"]
         cor = self.emotional_instability_setting["correction"]
-        amount = cor * np.random.chisquare(df=df)
+        amount = cor * rng.chisquare(df=df)
 
         # メンタル値の更新
         new_strength = self.mental_strength + (pn * amount)
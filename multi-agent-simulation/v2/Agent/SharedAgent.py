@@ -0,0 +1,141 @@
+"""
+共有メモリ上に状態を持つエージェント定義
+    日単位で更新されるエージェントの状態（ステータス・体力・精神力・所得・所在地など）
+    を multiprocessing.shared_memory 上の配列に格納し、fork したワーカープロセス
+    から同じ World のエージェントを直接更新できるようにする
+"""
+from multiprocessing import shared_memory
+from typing import List
+
+import numpy as np
+
+from Agent.Agent import Agent
+from Agent.Status import Status
+
+# 共有メモリに格納する状態 (項目名, 型)
+SHARED_FIELDS = [
+    ("status", np.int8),
+    ("next_status", np.int8),
+    ("location", np.int16),
+    ("stay_period", np.int32),
+    ("incubation_count", np.int32),
+    ("physical_strength", np.float64),
+    ("mental_strength", np.float64),
+    ("income", np.float64),
+    ("trade_price", np.float64),
+]
+
+# ステータスと共有メモリ上のコードの対応 (None / 所在地なしは -1)
+STATUS_LIST = list(Status)
+STATUS_CODES = {status: code for code, status in enumerate(STATUS_LIST)}
+
+
+class AgentStateArrays:
+    def __init__(self, capacity: int, env_names: List[str]):
+        # 格納できるエージェント数
+        self.capacity = capacity
+        # 所在地のコードと環境名の対応
+        self.env_names = list(env_names)
+        self.env_codes = {name: code for code, name in enumerate(env_names)}
+
+        # 項目ごとの共有メモリと、それを参照する配列
+        self.memories = []
+        self.arrays = {}
+        for name, dtype in SHARED_FIELDS:
+            size = max(1, capacity * np.dtype(dtype).itemsize)
+            memory = shared_memory.SharedMemory(create=True, size=size)
+            self.memories.append(memory)
+            self.arrays[name] = np.ndarray(
+                (capacity,), dtype=dtype, buffer=memory.buf
+            )
+
+        # スロット番号ごとのエージェント
+        self.agents: List[SharedAgent] = []
+
+    def reset(self):
+        """ 全スロットを解放（各 Episode の最初に実行する想定） """
+        self.agents = []
+        for array in self.arrays.values():
+            array.fill(0)
+
+    def create_agent(self, **kwargs) -> "SharedAgent":
+        """ 空きスロットにエージェントを生成（引数は Agent と同じ） """
+        slot = len(self.agents)
+        if slot >= self.capacity:
+            raise RuntimeError(
+                "共有メモリのエージェント数の上限 ({}) を超えました".format(
+                    self.capacity
+                )
+            )
+        agent = SharedAgent(self, slot, **kwargs)
+        self.agents.append(agent)
+        return agent
+
+    def close(self):
+        """ 共有メモリを解放 """
+        self.arrays = {}
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
+        self.memories = []
+
+
+def _shared_property(name: str):
+    """ 共有メモリ上の数値を参照するプロパティを作成 """
+
+    def getter(self):
+        return self._state.arrays[name][self._slot].item()
+
+    def setter(self, value):
+        self._state.arrays[name][self._slot] = value
+
+    return property(getter, setter)
+
+
+class SharedAgent(Agent):
+    def __init__(self, state: AgentStateArrays, slot: int, **kwargs):
+        # 状態を格納する共有メモリとスロット番号
+        #   (Agent の初期化で状態が設定されるため先に設定する)
+        self._state = state
+        self._slot = slot
+        super().__init__(**kwargs)
+
+    @property
+    def slot(self) -> int:
+        """ 共有メモリ上のスロット番号 """
+        return self._slot
+
+    @property
+    def status(self) -> Status:
+        return STATUS_LIST[self._state.arrays["status"][self._slot]]
+
+    @status.setter
+    def status(self, value: Status):
+        self._state.arrays["status"][self._slot] = STATUS_CODES[value]
+
+    @property
+    def next_status(self) -> Status:
+        code = self._state.arrays["next_status"][self._slot]
+        return None if code < 0 else STATUS_LIST[code]
+
+    @next_status.setter
+    def next_status(self, value: Status):
+        code = -1 if value is None else STATUS_CODES[value]
+        self._state.arrays["next_status"][self._slot] = code
+
+    @property
+    def current_location(self) -> str:
+        code = self._state.arrays["location"][self._slot]
+        return None if code < 0 else self._state.env_names[code]
+
+    @current_location.setter
+    def current_location(self, value: str):
+        code = -1 if value is None else self._state.env_codes[value]
+        self._state.arrays["location"][self._slot] = code
+
+    stay_period = _shared_property("stay_period")
+    incubation_count = _shared_property("incubation_count")
+    physical_strength = _shared_property("physical_strength")
+    mental_strength = _shared_property("mental_strength")
+    income = _shared_property("income")
+    trade_price = _shared_property("trade_price")
@@ -0,0 +1,399 @@
+"""
+分散実行用の World 定義
+    Environment をグループに分けてワーカープロセスに配置し、各ワーカーが
+    担当する Environment の1日分のフェーズを並列に実行する
+    （エージェントの環境間移動は、1日ごとの同期ステップでエージェントの状態を
+    コンパクトなレコードとして交換することで実現する）
+
+    - DistributedWorld: ワーカーにフェーズの実行を指示し、旅行者を中継する
+    - WorkerWorld: ワーカープロセス内で担当する Environment を保持する World
+    - run_worker: ワーカープロセスのエントリポイント
+
+    通信には multiprocessing.connection を使用するため、ワーカーは同一マシン
+    で起動する（spawn_local）ほか、別マシンから `python main.py --worker` で
+    接続することもできる
+"""
+import random
+import traceback
+from collections import Counter
+from multiprocessing import Process
+from multiprocessing.connection import Client, Listener
+from typing import List, Tuple
+
+import numpy as np
+from loguru import logger
+
+from Agent.Agent import Agent
+from Environment.World import World
+from Simulator.InfectionModel import InfectionModel
+
+# ワーカーとの通信のデフォルト設定
+DEFAULT_ADDRESS = ("localhost", 6000)
+DEFAULT_AUTHKEY = "mas-simulation"
+
+
+class WorkerWorld(World):
+    def __init__(
+        self,
+        infection_model: InfectionModel,
+        world_setting: dict,
+        agent_setting: dict,
+        env_names: List[str],
+    ):
+        # World 全体の Environment 名（移動先の候補）
+        self.destinations = [
+            env["name"] for env in world_setting["environments"]
+        ]
+
+        # 担当する Environment のみで World を構築
+        setting = dict(world_setting)
+        setting["environments"] = [
+            env
+            for env in world_setting["environments"]
+            if env["name"] in env_names
+        ]
+        super().__init__(infection_model, setting, agent_setting)
+
+        # 旅行中の住民の出発時の所得 {code: 所得}
+        #   (旅行中も故郷の環境が手元の住民に給料を支給するため、帰還時に
+        #   出発後の増分を旅行先での状態に加算する)
+        self.departure_incomes = {}
+
+    def reset_environments(self):
+        """ Environment をリセット（各 Episode の最初に実行する想定） """
+        self.departure_incomes = {}
+        super().reset_environments()
+
+    def forward_time(self):
+        """ 時間を進める（滞在中のエージェントの滞在期間をデクリメント） """
+        for env in self.get_environments():
+            agents = env.get_present_agents()
+            for agent in agents:
+                agent.stay_period = max(0, agent.stay_period - 1)
+            self.work_counts["agents_processed"] += len(agents)
+
+    def send_back(self) -> List[Tuple[str, str, dict]]:
+        """ 帰還者を抽出し、送信するレコードのリストを取得
+
+        Returns
+        -------
+        [(宛先の環境名, 種別 ("return"), レコード), ...]
+        """
+        self.travelers = []
+        outbound = []
+
+        # 流出処理（滞在期間がゼロになった来訪者を故郷へ帰還させる）
+        for env in self.get_environments():
+            outflow_agents = self.immigration(
+                [(env.name, agent) for agent in env.get_outflow_agents()]
+            )
+            env.outflow(outflow_agents)
+            for agent in outflow_agents:
+                self.travelers.append((env.name, agent))
+                outbound.append((agent.hometown, "return", agent.to_record()))
+        self.work_counts["travelers_sent"] += len(outbound)
+        return outbound
+
+    def depart(self) -> List[Tuple[str, str, dict]]:
+        """ 出発者を抽出し、送信するレコードのリストを取得
+
+        帰還者のレコードを arrive() で反映した後に実行する（World.move_agent と
+        同様に、当日帰還した住民も再び出発できる）
+
+        Returns
+        -------
+        [(宛先の環境名, 種別 ("visit"), レコード), ...]
+        """
+        outbound = []
+
+        # 出発処理（各環境の住民からランダムに移動者を決定）
+        for env in self.get_environments():
+            departures = self.immigration(
+                [
+                    (env.name, agent)
+                    for agent in env.get_departure_agents(self.flow_rate)
+                ]
+            )
+            for agent in departures:
+                destination = random.choice(
+                    [name for name in self.destinations if name != env.name]
+                )
+                agent.current_location = destination
+                agent.stay_period = random.randint(
+                    min(self.travel_days), max(self.travel_days)
+                )
+                self.travelers.append((env.name, agent))
+                outbound.append((destination, "visit", agent.to_record()))
+                self.departure_incomes[agent.code] = agent.income
+        self.work_counts["travelers_sent"] += len(outbound)
+        return outbound
+
+    def arrive(self, inbound: List[Tuple[str, str, dict]]):
+        """ 他のワーカー（または自身）から届いたレコードを反映 """
+        for env_name, kind, record in inbound:
+            env = self.get_environment(env_name)
+            agent = env.get_agent(record["code"])
+            if kind == "return":
+                # 故郷への帰還（住民の状態を旅行先での状態に更新）
+                #   (旅行中に故郷で支給された給料は旅行先の状態に含まれないため、
+                #   出発後の所得の増分を加算する)
+                salary = agent.income - self.departure_incomes.pop(
+                    agent.code, agent.income
+                )
+                agent.apply_record(record)
+                agent.income += salary
+                agent.go_back_hometown()
+            else:
+                # 来訪（過去に来訪したことがある場合は状態のみ更新）
+                if agent is None:
+                    agent = Agent.from_record(
+                        record, self.agent_setting, self.infection_model
+                    )
+                agent.apply_record(record)
+                env.inflow(agent, record["stay_period"])
+            env._update_active_agents(agent)
+        self.work_counts["travelers_received"] += len(inbound)
+
+    def after_move(self):
+        """ 各環境の移動後の更新処理（コードリストの更新など） """
+        for env in self.get_environments():
+            env.after_move()
+
+    def step_environments(self, is_waking_up: bool, profiler=None) -> list:
+        """ 担当する Environment の1日分のフェーズを実行し、記録値を取得 """
+        records = []
+        for env in self.get_environments():
+            env.step(is_waking_up, profiler)
+            outflow = len(self.get_travelers(env.name))
+            records.append(env.get_record(outflow))
+        return records
+
+
+def run_worker(address, authkey: bytes, seed: int = None):
+    """ ワーカープロセスのメインループ
+
+    コーディネーター (DistributedWorld) に接続し、コマンドを受信して実行する
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+    conn = Client(address, authkey=authkey)
+    world = None
+    try:
+        while True:
+            command, payload = conn.recv()
+            try:
+                if command == "init":
+                    world = WorkerWorld(
+                        InfectionModel(**payload["infection_setting"]),
+                        payload["world_setting"],
+                        payload["agent_setting"],
+                        payload["env_names"],
+                    )
+                    result = None
+                elif command == "reset":
+                    world.reset_environments()
+                    result = None
+                elif command == "send_back":
+                    world.forward_time()
+                    result = world.send_back()
+                elif command == "depart":
+                    world.arrive(payload["inbound"])
+                    result = world.depart()
+                elif command == "arrive":
+                    world.arrive(payload["inbound"])
+                    world.after_move()
+                    result = world.step_environments(payload["is_waking_up"])
+                elif command == "close":
+                    conn.send(("ok", None))
+                    break
+                else:
+                    raise ValueError("未知のコマンドです: {}".format(command))
+            except Exception:
+                conn.send(("error", traceback.format_exc()))
+                raise
+            conn.send(("ok", result))
+    finally:
+        conn.close()
+
+
+class DistributedWorld:
+    def __init__(
+        self,
+        infection_setting: dict,
+        world_setting: dict,
+        agent_setting: dict,
+        distributed_setting: dict,
+    ):
+        if world_setting.get("scheduling", "daily") != "daily":
+            raise ValueError(
+                "分散実行ではイベント方式の状態遷移 (scheduling: event) は"
+                "使用できません"
+            )
+
+        self.env_names = [env["name"] for env in world_setting["environments"]]
+        self.worker_num = min(
+            distributed_setting.get("workers", 2), len(self.env_names)
+        )
+        address = tuple(distributed_setting.get("address", DEFAULT_ADDRESS))
+        authkey = distributed_setting.get("authkey", DEFAULT_AUTHKEY).encode()
+        seed = distributed_setting.get("seed")
+
+        # 各ワーカーが担当する Environment を決定
+        groups = self._split_environments(world_setting["environments"])
+
+        # ワーカーの接続を待機
+        self.listener = Listener(address, authkey=authkey)
+        self.processes = []
+        if distributed_setting.get("spawn_local", True):
+            for idx in range(self.worker_num):
+                worker_seed = None if seed is None else seed + idx
+                process = Process(
+                    target=run_worker,
+                    args=(address, authkey, worker_seed),
+                    daemon=True,
+                )
+                process.start()
+                self.processes.append(process)
+        else:
+            logger.info(
+                "ワーカーの接続を待機しています... ({}:{}, {}台)".format(
+                    *address, self.worker_num
+                )
+            )
+        self.connections = [
+            self.listener.accept() for _ in range(self.worker_num)
+        ]
+
+        # 各ワーカーに担当する Environment を構築させる
+        self.owners = {}
+        messages = []
+        for idx, env_names in enumerate(groups):
+            for name in env_names:
+                self.owners[name] = idx
+            payload = {
+                "infection_setting": infection_setting,
+                "world_setting": world_setting,
+                "agent_setting": agent_setting,
+                "env_names": env_names,
+            }
+            messages.append(("init", payload))
+        self._request_all(messages)
+
+        # 直近の記録値 {env_name: record}
+        self.records = {}
+        # ワーカーとの交換件数（プロファイラが参照する）
+        self.work_counts = Counter()
+
+        logger.info(
+            "分散Worldを初期化しました。ワーカー数:{}, 担当:{}".format(
+                self.worker_num, groups
+            )
+        )
+
+    def _split_environments(self, env_settings: List[dict]) -> List[List[str]]:
+        """ 人口がなるべく均等になるように Environment をワーカーに割り当て """
+        groups = [[] for _ in range(self.worker_num)]
+        loads = [0] * self.worker_num
+        for env in sorted(
+            env_settings, key=lambda e: e["population"], reverse=True
+        ):
+            idx = loads.index(min(loads))
+            groups[idx].append(env["name"])
+            loads[idx] += env["population"]
+        return groups
+
+    def _request_all(self, messages: list) -> list:
+        """ 全ワーカーにメッセージを送信し、全ワーカーの応答を取得 """
+        for conn, message in zip(self.connections, messages):
+            conn.send(message)
+        results = []
+        for conn in self.connections:
+            status, result = conn.recv()
+            if status == "error":
+                raise RuntimeError(
+                    "ワーカーでエラーが発生しました:\n{}".format(result)
+                )
+            results.append(result)
+        return results
+
+    def _broadcast(self, command: str, payload=None) -> list:
+        """ 全ワーカーに同じコマンドを送信 """
+        return self._request_all(
+            [(command, payload) for _ in range(self.worker_num)]
+        )
+
+    def reset_environments(self):
+        """ Environment をリセット（各 Episode の最初に実行する想定） """
+        self._broadcast("reset")
+        self.records = {}
+
+    def step(self, is_waking_up: bool = False) -> list:
+        """ 1日分のフェーズを全ワーカーで実行し、各環境の記録値を取得
+
+        Returns
+        -------
+        Environment ごとの Environment.get_record() の値のリスト
+        """
+        # 帰還者を故郷の環境を担当するワーカーへ中継
+        inbounds = self._relay(self._broadcast("send_back"))
+        # 帰還を反映してから出発者を抽出し、旅行先を担当するワーカーへ中継
+        #   (World.move_agent と同様に、当日帰還した住民も再び出発できる)
+        inbounds = self._relay(
+            self._request_all(
+                [("depart", {"inbound": inbound}) for inbound in inbounds]
+            )
+        )
+
+        # 移動の反映と各環境のフェーズを並列に実行
+        results = self._request_all(
+            [
+                ("arrive", {"is_waking_up": is_waking_up, "inbound": inbound})
+                for inbound in inbounds
+            ]
+        )
+        self.records = {
+            record[0]: record for records in results for record in records
+        }
+        return [self.records[name] for name in self.env_names]
+
+    def _relay(self, outbounds: list) -> list:
+        """ 各ワーカーが送信するレコードを宛先の環境を担当するワーカーごとに分配 """
+        inbounds = [[] for _ in range(self.worker_num)]
+        for outbound in outbounds:
+            for message in outbound:
+                inbounds[self.owners[message[0]]].append(message)
+        self.work_counts["travelers_exchanged"] += sum(map(len, inbounds))
+        return inbounds
+
+    def is_extinct(self) -> bool:
+        """ World 全体で EXPOSED / INFECTED のエージェントが存在しないか """
+        return all(
+            record[7] + record[8] == 0 for record in self.records.values()
+        )
+
+    def get_status_counts(self) -> List[Tuple[str, int, int, int, int, int]]:
+        """ 直近の各環境の状態別エージェント数 (name, s, e, i, r, d) を取得 """
+        return [
+            (name,) + tuple(self.records[name][6:])
+            for name in self.env_names
+            if name in self.records
+        ]
+
+    def pop_work_counts(self) -> Counter:
+        """ 前回の取得以降の処理件数を取得してリセット """
+        counts = self.work_counts
+        self.work_counts = Counter()
+        return counts
+
+    def close(self):
+        """ ワーカーを終了 """
+        try:
+            self._broadcast("close")
+        finally:
+            for conn in self.connections:
+                conn.close()
+            for process in self.processes:
+                process.join()
+            self.listener.close()
@@ -3,14 +3,18 @@
 """
 import random
 import math
-from typing import List
+from collections import Counter
+from typing import List, Tuple
 
 import networkx as nx
+import numpy as np
 import pandas as pd
 from loguru import logger
 
 from Agent.Agent import Agent
 from Agent.Status import Status
+from Environment.Kernels import update_agent_params
+from Simulator.Profiler import Profiler
 
 POPULATION_PYRAMID_DATA = "settings/population-pyramid.csv"
 
@@ -27,6 +31,7 @@ class Environment:
         attach,
         init_infection,
         economy,
+        agent_factory=None,
     ):
         self.id = id
         self.name = name
@@ -38,6 +43,8 @@ class Environment:
         self.population_pyramid = pd.read_csv(POPULATION_PYRAMID_DATA)
         # エージェントの設定
         self.agent_setting = agent_setting
+        # エージェントの生成関数（引数は Agent と同じ、World が指定する）
+        self.agent_factory = agent_factory or Agent
 
         # 感染症モデル
         self.infection_model = infection_model
@@ -45,11 +52,19 @@ class Environment:
         self.init_infection = init_infection
 
         # 環境グラフ（各エージェントをつなぐバラバシ・アルバートグラフ）
+        #   - init_environment() で生成する
         self.attach = attach
-        self.graph = nx.barabasi_albert_graph(n=self.agent_num, m=attach)
+        self.graph = nx.Graph()
+        # この環境を故郷とするエージェント（旅行中を含む）
+        self.residents: List[Agent] = []
 
         # ノードのコードリスト
         self.code_list = []
+        # エージェントのコードからノード番号への索引 {code: idx}
+        self.node_index = {}
+        # 移動処理で追加したノード [(idx, Agent, 接続先のノード番号), ...]
+        #   (World が設定、記録しない場合は None)
+        self.new_nodes = None
 
         # 経済関連の設定情報
         self.economy_setting = economy
@@ -60,6 +75,22 @@ class Environment:
         # 一日の税収
         self.tmp_tax_revenue = 0
 
+        # フェーズごとの処理件数（プロファイラが参照する）
+        self.work_counts = Counter()
+
+        # step() で使用する乱数生成器（np.random または np.random.Generator）
+        self.rng = np.random
+
+        # 状態遷移のイベントカレンダー（World が設定、日単位の判定時は None）
+        self.calendar = None
+        # 本日遷移の発生日を迎えた滞在中のエージェント
+        self.due_agents: List[Agent] = []
+        # World 全体の EXPOSED / INFECTED のエージェント {code: Agent}
+        #   (World が設定、全ノードを判定する場合は None)
+        self.active_agents = None
+        # 本日次ステータスを決定したエージェント
+        self.decided_agents: List[Agent] = []
+
         # エージェント設定にこの環境における平均所得と所得幅を追加
         self.agent_setting["params"]["economical"]["income_avg"] = economy[
             "agent_avg_income"
@@ -77,7 +108,7 @@ class Environment:
         for node in self.graph.nodes(data=True):
             idx, data = node
             age = self.get_agent_age()
-            data["agent"] = Agent(
+            data["agent"] = self.agent_factory(
                 agent_setting=self.agent_setting,
                 id=idx,
                 age=age,
@@ -85,6 +116,11 @@ class Environment:
                 status=Status.SUSCEPTABLE,
                 infection_model=self.infection_model,
             )
+        self.node_index = {
+            data["agent"].code: idx
+            for idx, data in self.graph.nodes(data=True)
+        }
+        self.residents = self.get_agents()
 
         # 公務員を確定
         cs_num = math.ceil(
@@ -99,13 +135,17 @@ class Environment:
             self.graph.nodes(data=True), self.init_infection
         )
         for _, data in init_infected:
-            data["agent"].status = Status.INFECTED
+            self._infect(data["agent"])
 
         # 経済パラメータを初期化
         self.finance = self.economy_setting["init_gdp"]
         self.tax_rate = self.economy_setting["tax_rate"]
         self.tmp_tax_revenue = 0
 
+        self.work_counts = Counter()
+        self.due_agents = []
+        self.decided_agents = []
+
         logger.info(
             'Enviromnent "{}" を初期化しました。人口:{}, 初期感染者:{}'.format(
                 self.name.upper(), self.agent_num, self.init_infection
@@ -132,7 +172,7 @@ class Environment:
         inflow_agent.stay_period = stay_period
 
         # 過去に流入したことがある場合はノードの新規作成をスキップ
-        if inflow_agent.code in self.code_list:
+        if inflow_agent.code in self.node_index:
             return
 
         # 過去に流入したことがない場合は新規ノードを追加
@@ -155,9 +195,42 @@ class Environment:
 
         # 流入者の受け入れ
         new_idx = len(self.graph.nodes()) + 1
-        self.graph.add_node(new_idx, agent=new_agent)
-        for relevant_idx in [connect_target] + connect_neighbors:
-            self.graph.add_edge(new_idx, relevant_idx)
+        targets = [connect_target] + connect_neighbors
+        self.add_agent_node(new_idx, new_agent, targets)
+        if self.new_nodes is not None:
+            self.new_nodes.append((new_idx, new_agent, targets))
+
+    def add_agent_node(self, idx: int, agent: Agent, targets: List[int]):
+        """ エージェントのノードを追加し、targets のノードと接続 """
+        self.graph.add_node(idx, agent=agent)
+        self.node_index[agent.code] = idx
+        for relevant_idx in targets:
+            self.graph.add_edge(idx, relevant_idx)
+
+    def get_departure_agents(self, flow_rate: float) -> List[Agent]:
+        """ 住民から flow_rate の確率で旅行に出発するエージェントを抽出 """
+        return [
+            agent
+            for agent in self.residents
+            if agent.is_living
+            and not agent.is_traveler
+            and random.random() <= flow_rate
+        ]
+
+    def get_outflow_agents(self) -> List[Agent]:
+        """ 滞在期間がゼロになった来訪者のリストを取得 """
+        return [
+            data["agent"]
+            for _, data in self.graph.nodes(data=True)
+            if data["agent"].is_stay_in(self.name)
+            and data["agent"].is_living
+            and data["agent"].is_traveler
+            and data["agent"].stay_period == 0
+        ]
+
+    def after_move(self):
+        """ World の移動処理の完了後に実行する更新処理 """
+        self.update_code_list()
 
     def outflow(self, outflow_agents: List[Agent]):
         """ 外部環境から来訪しているエージェントの流出処理 """
@@ -165,41 +238,126 @@ class Environment:
         for agent in outflow_agents:
             agent.go_back_hometown()
 
+    def step(
+        self,
+        is_waking_up: bool = False,
+        profiler: Profiler = None,
+        pay_salary: bool = True,
+    ):
+        """ 環境内の1日分のフェーズ（経済・感染）を実行
+
+        pay_salary が False の場合、給料の支給は呼び出し側で実行済みとする
+        """
+        if profiler is None:
+            profiler = Profiler()
+
+        # 公務員エージェントに給料を支給
+        if pay_salary:
+            with profiler.phase("salary", self):
+                self.pay_salary_to_public_officials()
+        # 前日の税収を env の経済力に反映
+        with profiler.phase("finance", self):
+            self.update_finance()
+        # エージェント間の経済取引を実行
+        with profiler.phase("trade", self):
+            self.trade()
+
+        # ウェイクアップ時は感染拡大をシミュレートしない
+        if is_waking_up:
+            return
+
+        # エージェントの体力値を更新
+        with profiler.phase("update_agents_params", self):
+            self.update_agents_params()
+
+        # 潜伏者・発症者が滞在していない環境は状態が変化しないため省略
+        if not self.has_active_agents():
+            profiler.count("skipped_environments", {"environments": 1})
+            return
+
+        # エージェントの次ステータスを決定
+        with profiler.phase("decide_agents_next_status", self):
+            self.decide_agents_next_status()
+        # エージェントの状態を更新
+        with profiler.phase("update_agents_status", self):
+            self.update_agents_status()
+
     def update_agents_params(self):
-        """ エージェントのパラメータ（体力・精神力）を更新 """
-        for node in self.graph.nodes(data=True):
-            _, data = node
-            if data["agent"].is_stay_in(self.name):
-                # 精神力を更新
-                data["agent"].update_mental_strength()
-                # 体力を更新
-                data["agent"].update_physical_strength()
+        """ エージェントのパラメータ（体力・精神力）を更新
+
+        滞在中のエージェントの精神力 → 体力の順の更新を配列演算で一括実行する
+        """
+        agents = self.get_present_agents()
+        if not agents:
+            return
+
+        instability = [a.emotional_instability_setting for a in agents]
+        mental, physical = update_agent_params(
+            mental=np.array([a.mental_strength for a in agents]),
+            stabilize_point=np.array(
+                [a.mental_stabilize_point for a in agents]
+            ),
+            stabilize_scale=np.array([a.stabilize_scale for a in agents]),
+            degree_of_freedom=np.array(
+                [s["degree_of_freedom"] for s in instability]
+            ),
+            correction=np.array([s["correction"] for s in instability]),
+            physical=np.array(
+                [a.physical_strength for a in agents], dtype=float
+            ),
+            immunity=np.array([a.immunity for a in agents]),
+            infected=np.array([a.status == Status.INFECTED for a in agents]),
+            impact=self.infection_model.impact,
+            rng=self.rng,
+        )
+        for agent, m, p in zip(agents, mental.tolist(), physical.tolist()):
+            agent.mental_strength = m
+            agent.physical_strength = p
+        self.work_counts["agents_processed"] += len(agents)
 
     def decide_agents_next_status(self):
         """ エージェントの次ステータスを決定 """
-        for node in self.graph.nodes(data=True):
-            idx, data = node
-            if data["agent"].is_stay_in(self.name):
-                neighbors = []
-                for n in self.graph.neighbors(idx):
-                    agent = self.graph.nodes[n]["agent"]
-                    if agent.is_stay_in(self.name):
-                        neighbors.append(agent)
-                data["agent"].decide_next_status(neighbors)
+        scheduled = self.calendar is not None
+        decided = []
+        scanned = 0
+        for idx in self._get_decision_targets():
+            neighbors = []
+            for n in self.graph.neighbors(idx):
+                agent = self.graph.nodes[n]["agent"]
+                if agent.is_stay_in(self.name):
+                    neighbors.append(agent)
+            agent = self.graph.nodes[idx]["agent"]
+            agent.decide_next_status(neighbors, scheduled, self.rng)
+            decided.append(agent)
+            scanned += len(self.graph[idx])
+        self.decided_agents = decided
+        self.work_counts["agents_processed"] += len(decided)
+        self.work_counts["edges_scanned"] += scanned
+
+        # 発生日を迎えた状態遷移を反映（同日に死亡する場合は死亡を優先）
+        for agent in self.due_agents:
+            if agent.next_status == agent.status:
+                agent.fire_scheduled_transition()
+        self.work_counts["events_fired"] += len(self.due_agents)
+        self.due_agents = []
 
     def trade(self):
         """ エージェント間の経済的取引を実行 """
+        processed = 0
+        scanned = 0
         for idx, data in self.graph.nodes(data=True):
             agent = data["agent"]
             if agent.is_stay_in(self.name) and agent.is_tradable:
+                processed += 1
+                scanned += len(self.graph[idx])
                 for n in self.graph.neighbors(idx):
                     partner = self.graph.nodes[n]["agent"]
                     if not partner.is_stay_in(self.name):
                         continue
 
                     # Step-1. 取引アクションの決定
-                    a_action = agent.decide_trade_action()
-                    p_action = partner.decide_trade_action()
+                    a_action = agent.decide_trade_action(self.rng)
+                    p_action = partner.decide_trade_action(self.rng)
 
                     # Step-2. 取引成立判定
                     if a_action == p_action:
@@ -207,9 +365,9 @@ class Environment:
                         continue
 
                     # Step-3. sell 側が取引金額を決定
-                    price = agent.get_trade_price()
+                    price = agent.get_trade_price(self.rng)
                     if p_action == "sell":
-                        price = partner.get_trade_price()
+                        price = partner.get_trade_price(self.rng)
 
                     # Step-4. 取引実行 および 税収処理
                     tax = math.ceil(price * self.tax_rate)
@@ -226,13 +384,116 @@ class Environment:
                     # Step-5. 取引実績の更新
                     agent.update_income()
                     partner.update_income()
+        self.work_counts["agents_processed"] += processed
+        self.work_counts["edges_scanned"] += scanned
+
+    def _get_decision_targets(self) -> List[int]:
+        """ 次ステータスを決定するノード番号のリストを取得
+
+        全ノードを判定する場合は滞在中の全エージェント、
+        フロンティア方式の場合は滞在中の EXPOSED / INFECTED のエージェントと、
+        それに隣接する滞在中の SUSCEPTABLE のエージェントのみを対象とする
+        (それ以外のエージェントは状態が変化しない)
+        """
+        if self.active_agents is None:
+            return [
+                idx
+                for idx, data in self.graph.nodes(data=True)
+                if data["agent"].is_stay_in(self.name)
+            ]
+
+        # 重複を除きつつ順序を保つため dict をセットとして使用
+        targets = {}
+        for agent in self.active_agents.values():
+            if not agent.is_stay_in(self.name):
+                continue
+            idx = self.node_index[agent.code]
+            targets[idx] = None
+            for n in self.graph.neighbors(idx):
+                neighbor = self.graph.nodes[n]["agent"]
+                if (
+                    neighbor.status == Status.SUSCEPTABLE
+                    and neighbor.is_stay_in(self.name)
+                ):
+                    targets[n] = None
+        self.work_counts["frontier_size"] += len(targets)
+        return list(targets)
 
     def update_agents_status(self):
-        """ エージェントの状態を更新 """
-        for node in self.graph.nodes(data=True):
-            _, data = node
-            if data["agent"].is_stay_in(self.name):
-                data["agent"].update_status()
+        """ 次ステータスを決定したエージェントの状態を更新 """
+        scheduled = self.calendar is not None
+        for agent in self.decided_agents:
+            status = agent.status
+            agent.update_status()
+            if agent.status != status:
+                if scheduled:
+                    self.schedule_transition(agent)
+                self._update_active_agents(agent)
+        self.work_counts["agents_processed"] += len(self.decided_agents)
+        self.decided_agents = []
+
+    def _infect(self, agent: Agent):
+        """ エージェントを INFECTED にする（初期感染者・輸入感染者） """
+        agent.status = Status.INFECTED
+        self.schedule_transition(agent)
+        self._update_active_agents(agent)
+
+    def import_infection(
+        self, age_range: Tuple[int, int] = None, count: int = 1
+    ) -> int:
+        """ 故郷に滞在中の SUSCEPTABLE の住民から count 人を感染させる（輸入感染）
+
+        age_range を指定した場合はその年齢の範囲の住民から優先して選び、
+        不足する場合は残りを範囲外の住民から選ぶ。感染させた人数を返す
+        """
+        candidates = [
+            agent
+            for agent in self.residents
+            if agent.status == Status.SUSCEPTABLE
+            and agent.is_stay_in(self.name)
+        ]
+        matched, others = candidates, []
+        if age_range is not None:
+            lower, upper = age_range
+            matched = [a for a in candidates if lower <= a.age <= upper]
+            others = [a for a in candidates if not lower <= a.age <= upper]
+
+        targets = []
+        for group in [matched, others]:
+            num = min(count - len(targets), len(group))
+            if num <= 0:
+                continue
+            for i in self.rng.choice(len(group), size=num, replace=False):
+                targets.append(group[i])
+
+        for agent in targets:
+            self._infect(agent)
+        return len(targets)
+
+    def _update_active_agents(self, agent: Agent):
+        """ EXPOSED / INFECTED のエージェントの集合を更新 """
+        if self.active_agents is None:
+            return
+        if agent.status in [Status.EXPOSED, Status.INFECTED]:
+            self.active_agents[agent.code] = agent
+        else:
+            self.active_agents.pop(agent.code, None)
+
+    def schedule_transition(self, agent: Agent):
+        """ エージェントの次の状態遷移をイベントカレンダーに登録
+
+        EXPOSED は潜伏期間後に発症、INFECTED は回復確率に従う幾何分布で
+        サンプリングした日数後に回復する
+        """
+        if self.calendar is None:
+            return
+        if agent.status == Status.EXPOSED:
+            delay = self.infection_model.incubation_period
+        elif agent.status == Status.INFECTED:
+            delay = self.rng.geometric(self.infection_model.recovery_prob)
+        else:
+            return
+        self.calendar.schedule(delay, agent)
 
     def pay_tax(self, tax):
         """ 税金を納める """
@@ -255,6 +516,32 @@ class Environment:
         for agent in civil_servants:
             agent.receive_salary(salary)
             self.finance -= salary
+        self.work_counts["agents_processed"] += len(civil_servants)
+
+    def has_active_cases(self) -> bool:
+        """ この環境の住民（旅行中を含む）に EXPOSED / INFECTED がいるか """
+        if self.active_agents is not None:
+            return any(
+                agent.hometown == self.name
+                for agent in self.active_agents.values()
+            )
+        return any(
+            agent.status in [Status.EXPOSED, Status.INFECTED]
+            for agent in self.residents
+        )
+
+    def has_active_agents(self) -> bool:
+        """ 滞在中の EXPOSED / INFECTED のエージェントが存在するか """
+        if self.active_agents is not None:
+            return any(
+                agent.is_stay_in(self.name)
+                for agent in self.active_agents.values()
+            )
+        return any(
+            data["agent"].status in [Status.EXPOSED, Status.INFECTED]
+            and data["agent"].is_stay_in(self.name)
+            for _, data in self.graph.nodes(data=True)
+        )
 
     def count_agent(self, status: Status = None) -> int:
         """ 該当ステータスのエージェント数をカウント """
@@ -295,6 +582,12 @@ class Environment:
         ]
         return sum(values) / len(values)
 
+    def pop_work_counts(self) -> Counter:
+        """ 前回の取得以降の処理件数を取得してリセット """
+        counts = self.work_counts
+        self.work_counts = Counter()
+        return counts
+
     def get_graph(self) -> nx.Graph:
         """ Environment グラフを取得 """
         return self.graph
@@ -303,6 +596,49 @@ class Environment:
         """ Agent のリストを取得 """
         return [node[1]["agent"] for node in self.graph.nodes(data=True)]
 
+    def get_residents(self) -> List[Agent]:
+        """ この環境を故郷とする Agent のリストを取得 """
+        return self.residents
+
+    def get_present_agents(self) -> List[Agent]:
+        """ この環境に滞在中の Agent のリストを取得 """
+        return [
+            data["agent"]
+            for _, data in self.graph.nodes(data=True)
+            if data["agent"].is_stay_in(self.name)
+        ]
+
+    def get_agent(self, code: str) -> Agent:
+        """ コードに対応する Agent を取得（存在しない場合は None） """
+        idx = self.node_index.get(code)
+        if idx is None:
+            return None
+        return self.graph.nodes[idx]["agent"]
+
+    def get_record(
+        self, outflow: int
+    ) -> Tuple[str, int, float, float, float, float, int, int, int, int, int]:
+        """ Recorder に記録する値を取得
+
+        Returns
+        -------
+        (city, outflow, avg_mental, finance, tax_revenue, avg_income,
+         s, e, i, r, d)
+        """
+        return (
+            self.name,
+            outflow,
+            self.get_average_mental_strength(),
+            self.get_finance(),
+            self.get_tax_revenue(),
+            self.get_average_income(),
+            self.count_agent(Status.SUSCEPTABLE),
+            self.count_agent(Status.EXPOSED),
+            self.count_agent(Status.INFECTED),
+            self.count_agent(Status.RECOVERED),
+            self.count_agent(Status.DEATH),
+        )
+
     def get_snap_shot(self) -> pd.DataFrame:
         """ 現時点のスナップショットを取得 """
         pass
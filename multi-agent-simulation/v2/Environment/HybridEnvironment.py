@@ -0,0 +1,594 @@
+"""
+ハイブリッド環境定義
+    感染者が少ない間は都市を確率的な SEIRD コンパートメントモデル（タウリーピング法）
+    で表現し、感染者の割合が閾値を超えた時点でエージェントベースの Environment に
+    切り替える（数百万人規模の都市をエージェントを生成せずに扱うため）
+
+    - 他の環境との移動は、旅行者をコンパートメントからエージェントとして実体化し、
+      帰還時に再びコンパートメントに吸収することで実現する
+    - 来訪者はエージェントのまま保持し、コンパートメントと同じ感染力を受ける
+"""
+import math
+import random
+from collections import deque
+from typing import List, Tuple
+
+import networkx as nx
+import numpy as np
+from loguru import logger
+
+from Agent.Agent import Agent
+from Agent.Status import Status
+from Environment.Environment import Environment
+
+# モード
+COMPARTMENT_MODE = "compartment"
+AGENT_MODE = "agent"
+
+
+class HybridEnvironment(Environment):
+    def __init__(self, *args, abm_threshold: float = 0.001, **kwargs):
+        # エージェントベースに切り替える感染者（E + I）の割合
+        self.abm_threshold = abm_threshold
+
+        # 現在のモード
+        self.mode = COMPARTMENT_MODE
+
+        # コンパートメント（故郷に滞在中の住民の人数）
+        self.susceptable = 0
+        # 潜伏者数（先頭から順に、発症までの残り日数が 1, 2, ... 日の人数）
+        self.exposed = deque()
+        self.infected = 0
+        self.recovered = 0
+        self.death = 0
+        # 本日の状態遷移数 (新規感染, 発症, 回復, 死亡)
+        self.transitions = (0, 0, 0, 0)
+
+        # 旅行者として実体化した住民 {code: Agent}
+        self.materialized = {}
+        # 一度でも実体化した住民 {個体識別番号 (0 〜 人口 - 1): Agent}
+        #   (同じ住民が再び旅行する場合は同じエージェントを再利用し、
+        #   旅行先のグラフのノードが旅行のたびに増えないようにする)
+        self.resident_pool = {}
+        # 来訪者 {code: Agent}（コンパートメントモード時のみ使用）
+        self.visitors = {}
+        # 人口を超えて生成するエージェントに割り当てる個体識別番号
+        self.next_agent_id = 0
+
+        super().__init__(*args, **kwargs)
+
+        # 1人あたりの平均接触人数（バラバシ・アルバートグラフの平均次数）
+        self.contacts = 2 * self.attach
+        # 発症者の1日あたりの死亡率
+        self.death_rate = self._get_death_rate()
+
+    @property
+    def is_compartment_mode(self) -> bool:
+        """ コンパートメントモードかどうか """
+        return self.mode == COMPARTMENT_MODE
+
+    def init_environment(self):
+        """ 環境を初期化（コンパートメントモードで開始） """
+        self.mode = COMPARTMENT_MODE
+        self.graph = nx.Graph()
+        self.node_index = {}
+        self.residents = []
+        self.materialized = {}
+        self.resident_pool = {}
+        self.visitors = {}
+        self.next_agent_id = self.agent_num
+
+        incubation = self.infection_model.incubation_period
+        self.susceptable = self.agent_num - self.init_infection
+        self.exposed = deque([0] * incubation)
+        self.infected = self.init_infection
+        self.recovered = 0
+        self.death = 0
+        self.transitions = (0, 0, 0, 0)
+
+        # 経済パラメータを初期化
+        self.finance = self.economy_setting["init_gdp"]
+        self.tax_rate = self.economy_setting["tax_rate"]
+        self.tmp_tax_revenue = 0
+
+        self.work_counts.clear()
+        self.due_agents = []
+        self.decided_agents = []
+
+        logger.info(
+            'Enviromnent "{}" を初期化しました（コンパートメントモード）。'
+            "人口:{}, 初期感染者:{}".format(
+                self.name.upper(), self.agent_num, self.init_infection
+            )
+        )
+        self._switch_if_needed()
+
+    def import_infection(
+        self, age_range: Tuple[int, int] = None, count: int = 1
+    ) -> int:
+        """ 輸入感染（コンパートメントモードでは年齢を区別せず S から I に移す） """
+        if not self.is_compartment_mode:
+            return super().import_infection(age_range, count)
+        count = min(count, self.susceptable)
+        self.susceptable -= count
+        self.infected += count
+        self._switch_if_needed()
+        return count
+
+    def _get_death_rate(self) -> float:
+        """ 発症者の1日あたりの死亡率を算出
+
+        エージェントベースでは体力がゼロになるまでの日数 T が経過する前に
+        回復しなければ死亡する（死亡確率 q = (1 - 回復確率) ^ T）。
+        人口ピラミッドで重み付けした q と一致するように、回復と競合する
+        1日あたりの死亡率を求める
+        """
+        physical = self.agent_setting["params"]["physical"]
+        impact = self.infection_model.impact
+        recovery_prob = self.infection_model.recovery_prob
+
+        ages = self.population_pyramid["age"]
+        weights = self.population_pyramid["weight"]
+        death_prob = 0
+        for age, weight in zip(ages, weights):
+            immunity = [
+                s["value"]
+                for s in physical["default_immunity"]
+                if min(s["age_range"]) <= age <= max(s["age_range"])
+            ][0]
+            # メンタル値の平均 (0) を仮定した1日あたりのダメージ
+            damage = (
+                impact["max_damage"]
+                - (impact["max_damage"] - impact["min_damage"]) * immunity
+            )
+            days = math.ceil(physical["default_strength"] / damage)
+            death_prob += weight * (1 - recovery_prob) ** days
+        death_prob /= weights.sum()
+        return recovery_prob * death_prob / (1 - death_prob)
+
+    def _count_home(self, status: Status = None) -> int:
+        """ 故郷に滞在中の住民数（コンパートメント）をカウント """
+        counts = {
+            Status.SUSCEPTABLE: self.susceptable,
+            Status.EXPOSED: sum(self.exposed),
+            Status.INFECTED: self.infected,
+            Status.RECOVERED: self.recovered,
+            Status.DEATH: self.death,
+        }
+        if status is None:
+            return sum(counts.values())
+        return counts[status]
+
+    def _get_present_visitors(self) -> List[Agent]:
+        """ 滞在中の来訪者のリストを取得 """
+        return [
+            agent
+            for agent in self.visitors.values()
+            if agent.is_stay_in(self.name)
+        ]
+
+    def get_agents(self) -> List[Agent]:
+        """ Agent のリストを取得 """
+        if self.is_compartment_mode:
+            return list(self.materialized.values())
+        return super().get_agents()
+
+    def get_residents(self) -> List[Agent]:
+        """ この環境を故郷とする Agent のリストを取得 """
+        if self.is_compartment_mode:
+            return list(self.materialized.values())
+        return super().get_residents()
+
+    def get_present_agents(self) -> List[Agent]:
+        """ この環境に滞在中の Agent のリストを取得 """
+        if not self.is_compartment_mode:
+            return super().get_present_agents()
+        return self._get_present_visitors()
+
+    def get_agent(self, code: str) -> Agent:
+        """ コードに対応する Agent を取得（存在しない場合は None） """
+        if not self.is_compartment_mode:
+            return super().get_agent(code)
+        return self.materialized.get(code, self.visitors.get(code))
+
+    def get_departure_agents(self, flow_rate: float) -> List[Agent]:
+        """ 旅行に出発する住民をコンパートメントから実体化して取得 """
+        if not self.is_compartment_mode:
+            return super().get_departure_agents(flow_rate)
+
+        living = self._count_home() - self.death
+        departures = np.random.binomial(living, flow_rate)
+        if departures == 0:
+            return []
+
+        # 出発者の状態を多変量超幾何分布でサンプリング
+        # (潜伏者は発症までの残り日数ごとに別の区分として扱う)
+        groups = [(Status.SUSCEPTABLE, 0, self.susceptable)]
+        groups += [
+            (Status.EXPOSED, days + 1, count)
+            for days, count in enumerate(self.exposed)
+        ]
+        groups += [
+            (Status.INFECTED, 0, self.infected),
+            (Status.RECOVERED, 0, self.recovered),
+        ]
+        remaining = living
+        agents = []
+        for status, incubation_count, count in groups:
+            if departures == 0:
+                break
+            remaining -= count
+            num = np.random.hypergeometric(count, remaining, departures)
+            departures -= num
+            for _ in range(num):
+                agents.append(self._materialize(status, incubation_count))
+        return agents
+
+    def _materialize(self, status: Status, incubation_count: int) -> Agent:
+        """ コンパートメントから住民を1人取り出してエージェントを生成 """
+        if status == Status.SUSCEPTABLE:
+            self.susceptable -= 1
+        elif status == Status.EXPOSED:
+            self.exposed[incubation_count - 1] -= 1
+        elif status == Status.INFECTED:
+            self.infected -= 1
+        elif status == Status.RECOVERED:
+            self.recovered -= 1
+
+        agent = self._get_resident(
+            self._sample_resident_id(), status, incubation_count
+        )
+        self.materialized[agent.code] = agent
+
+        self._update_active_agents(agent)
+        if self.calendar is not None:
+            if status == Status.EXPOSED:
+                self.calendar.schedule(incubation_count, agent)
+            else:
+                self.schedule_transition(agent)
+        return agent
+
+    def _sample_resident_id(self) -> int:
+        """ 故郷に滞在中の住民の個体識別番号を無作為に選ぶ
+
+        旅行中の住民と、死亡した状態で吸収した住民は除く
+        """
+        while True:
+            idx = random.randrange(self.agent_num)
+            agent = self.resident_pool.get(idx)
+            if agent is None or (
+                agent.code not in self.materialized
+                and agent.status != Status.DEATH
+            ):
+                return idx
+
+    def _get_resident(
+        self, idx: int, status: Status, incubation_count: int
+    ) -> Agent:
+        """ 個体識別番号 idx の住民のエージェントを取得
+
+        以前実体化した住民は同じエージェント（年齢・所得などの個体の属性を
+        維持）を再利用し、状態のみコンパートメントから設定する
+        """
+        agent = self.resident_pool.get(idx)
+        if agent is None:
+            agent = Agent(
+                agent_setting=self.agent_setting,
+                id=idx,
+                age=self.get_agent_age(),
+                hometown=self.name,
+                status=status,
+                infection_model=self.infection_model,
+            )
+            self.resident_pool[idx] = agent
+        else:
+            agent.status = status
+            agent.next_status = None
+            agent.physical_strength = self.agent_setting["params"][
+                "physical"
+            ]["default_strength"]
+            agent.current_location = self.name
+            agent.stay_period = 0
+        agent.incubation_count = incubation_count
+        return agent
+
+    def _absorb(self, agent: Agent):
+        """ 帰還した住民のエージェントをコンパートメントに戻す """
+        if agent.status == Status.SUSCEPTABLE:
+            self.susceptable += 1
+        elif agent.status == Status.EXPOSED:
+            days = agent.incubation_count
+            if self.calendar is not None:
+                # イベント方式では incubation_count が減らないため、
+                # 登録済みの発症日までの日数を使用する
+                days = self.calendar.remaining_days(agent)
+            days = min(max(days, 1), len(self.exposed))
+            self.exposed[days - 1] += 1
+        elif agent.status == Status.INFECTED:
+            self.infected += 1
+        elif agent.status == Status.RECOVERED:
+            self.recovered += 1
+        elif agent.status == Status.DEATH:
+            self.death += 1
+
+        del self.materialized[agent.code]
+        if self.active_agents is not None:
+            self.active_agents.pop(agent.code, None)
+        # イベントカレンダーに登録済みの状態遷移を無効化
+        agent.event_token += 1
+
+    def get_outflow_agents(self) -> List[Agent]:
+        """ 滞在期間がゼロになった来訪者のリストを取得 """
+        if not self.is_compartment_mode:
+            return super().get_outflow_agents()
+        return [
+            agent
+            for agent in self._get_present_visitors()
+            if agent.is_living and agent.stay_period == 0
+        ]
+
+    def inflow(self, inflow_agent: Agent, stay_period: int):
+        """ 外部環境からのエージェント流入処理 """
+        if not self.is_compartment_mode:
+            return super().inflow(inflow_agent, stay_period)
+        inflow_agent.current_location = self.name
+        inflow_agent.stay_period = stay_period
+        self.visitors[inflow_agent.code] = inflow_agent
+
+    def outflow(self, outflow_agents: List[Agent]):
+        """ 外部環境から来訪しているエージェントの流出処理 """
+        super().outflow(outflow_agents)
+        if self.is_compartment_mode:
+            for agent in outflow_agents:
+                self.visitors.pop(agent.code, None)
+
+    def after_move(self):
+        """ 帰還した（または出国審査で出発できなかった）住民を吸収 """
+        if not self.is_compartment_mode:
+            return super().after_move()
+        for agent in list(self.materialized.values()):
+            if agent.is_stay_in(self.name):
+                self._absorb(agent)
+
+    def pay_salary_to_public_officials(self):
+        """ 公務員（住民数 x 公務員率）に給料を払う """
+        if not self.is_compartment_mode:
+            return super().pay_salary_to_public_officials()
+        cs_num = math.ceil(
+            self.agent_num * self.economy_setting["civil_servants_rate"]
+        )
+        self.finance -= cs_num * self.economy_setting["civil_servants_salary"]
+
+    def trade(self):
+        """ エージェント間の経済的取引を実行
+
+        コンパートメントモードでは取引をシミュレートしない（税収なし）
+        """
+        if not self.is_compartment_mode:
+            return super().trade()
+
+    def update_agents_params(self):
+        """ エージェント（来訪者）のパラメータを更新 """
+        if not self.is_compartment_mode:
+            return super().update_agents_params()
+        visitors = self._get_present_visitors()
+        for agent in visitors:
+            agent.update_mental_strength()
+            agent.update_physical_strength()
+        self.work_counts["agents_processed"] += len(visitors)
+
+    def decide_agents_next_status(self):
+        """ 次ステータスを決定（コンパートメントはタウリーピング法で遷移数を決定） """
+        if not self.is_compartment_mode:
+            return super().decide_agents_next_status()
+
+        visitors = self._get_present_visitors()
+        living = self._count_home() - self.death + len(
+            [agent for agent in visitors if agent.is_living]
+        )
+        infectious = (
+            self._count_home(Status.EXPOSED)
+            + self._count_home(Status.INFECTED)
+            + len(
+                [
+                    agent
+                    for agent in visitors
+                    if agent.status in [Status.EXPOSED, Status.INFECTED]
+                ]
+            )
+        )
+
+        # 平均接触人数のうち感染力を持つ人数に応じた感染確率
+        infection_prob = 0
+        if living > 0:
+            infection_prob = 1 - (
+                (1 - self.infection_model.infection_prob)
+                ** (self.contacts * infectious / living)
+            )
+
+        # コンパートメントの遷移数
+        new_exposed = np.random.binomial(self.susceptable, infection_prob)
+        onset = self.exposed[0]
+        recovery = np.random.binomial(
+            self.infected, self.infection_model.recovery_prob
+        )
+        death = np.random.binomial(self.infected - recovery, self.death_rate)
+        self.transitions = (new_exposed, onset, recovery, death)
+
+        # 来訪者の遷移
+        scheduled = self.calendar is not None
+        for agent in visitors:
+            agent.decide_next_status([], scheduled)
+            if (
+                agent.status == Status.SUSCEPTABLE
+                and agent.next_status == Status.SUSCEPTABLE
+                and random.random() <= infection_prob
+            ):
+                agent.next_status = Status.EXPOSED
+                agent.incubation_count = self.infection_model.incubation_period
+        for agent in self.due_agents:
+            if agent.next_status == agent.status:
+                agent.fire_scheduled_transition()
+        self.due_agents = []
+        self.decided_agents = visitors
+        self.work_counts["agents_processed"] += len(visitors)
+
+    def update_agents_status(self):
+        """ 状態を更新し、感染者の割合が閾値を超えた場合はエージェントベースに切替 """
+        if not self.is_compartment_mode:
+            return super().update_agents_status()
+
+        new_exposed, onset, recovery, death = self.transitions
+        self.susceptable -= new_exposed
+        self.exposed.popleft()
+        self.exposed.append(new_exposed)
+        self.infected += onset - recovery - death
+        self.recovered += recovery
+        self.death += death
+        self.transitions = (0, 0, 0, 0)
+
+        # 来訪者の状態を更新
+        super().update_agents_status()
+
+        self._switch_if_needed()
+
+    def _switch_if_needed(self):
+        """ 感染者の割合が閾値を超えた場合、エージェントベースに切り替え """
+        if not self.is_compartment_mode:
+            return
+        active = self._count_home(Status.EXPOSED) + self._count_home(
+            Status.INFECTED
+        )
+        if active < self.abm_threshold * self.agent_num:
+            return
+        self._switch_to_agent_mode()
+
+    def _switch_to_agent_mode(self):
+        """ コンパートメントの住民をエージェントとして生成し、グラフを構築 """
+        # 故郷に滞在中の住民（コンパートメント）の状態リスト
+        statuses = [(Status.SUSCEPTABLE, 0)] * self.susceptable
+        for days, count in enumerate(self.exposed):
+            statuses += [(Status.EXPOSED, days + 1)] * count
+        statuses += [(Status.INFECTED, 0)] * self.infected
+        statuses += [(Status.RECOVERED, 0)] * self.recovered
+        statuses += [(Status.DEATH, 0)] * self.death
+        random.shuffle(statuses)
+
+        # 旅行中の住民は実体化済みのエージェントをそのまま使用
+        away_agents = list(self.materialized.values())
+        node_num = len(statuses) + len(away_agents)
+        self.graph = nx.barabasi_albert_graph(n=node_num, m=self.attach)
+
+        # 旅行中の住民以外の個体識別番号を順に割り当てる
+        #   (実体化したことがある住民は同じエージェントを再利用する)
+        away_ids = {agent.id for agent in away_agents}
+        resident_ids = (i for i in range(self.agent_num) if i not in away_ids)
+
+        residents = []
+        for idx, (status, incubation_count) in enumerate(statuses):
+            resident_id = next(resident_ids, None)
+            if resident_id is None:
+                resident_id = self.next_agent_id
+                self.next_agent_id += 1
+            agent = self._get_resident(resident_id, status, incubation_count)
+            self.graph.nodes[idx]["agent"] = agent
+            residents.append(agent)
+
+            self._update_active_agents(agent)
+            if self.calendar is not None:
+                if status == Status.EXPOSED:
+                    self.calendar.schedule(incubation_count, agent)
+                else:
+                    self.schedule_transition(agent)
+        for idx, agent in enumerate(away_agents, start=len(statuses)):
+            self.graph.nodes[idx]["agent"] = agent
+            residents.append(agent)
+
+        self.node_index = {
+            data["agent"].code: idx
+            for idx, data in self.graph.nodes(data=True)
+        }
+        self.residents = residents
+
+        # 公務員を確定
+        cs_num = math.ceil(
+            self.agent_num * self.economy_setting["civil_servants_rate"]
+        )
+        for agent in random.sample(residents, min(cs_num, len(residents))):
+            agent.is_civil_servant = True
+
+        # 来訪者をグラフに追加
+        self.mode = AGENT_MODE
+        for agent in self.visitors.values():
+            self._add_new_node(agent)
+        self.visitors = {}
+        self.materialized = {}
+        self.resident_pool = {}
+        self.update_code_list()
+
+        logger.info(
+            'Enviromnent "{}" をエージェントベースに切り替えました。'
+            "人口:{}, 感染者(E+I):{}".format(
+                self.name.upper(),
+                node_num,
+                sum(
+                    1
+                    for agent in residents
+                    if agent.status in [Status.EXPOSED, Status.INFECTED]
+                ),
+            )
+        )
+
+    def has_active_cases(self) -> bool:
+        """ この環境の住民（旅行中を含む）に EXPOSED / INFECTED がいるか """
+        if not self.is_compartment_mode:
+            return super().has_active_cases()
+        return self._count_home(Status.EXPOSED) + self._count_home(
+            Status.INFECTED
+        ) > 0 or any(
+            agent.status in [Status.EXPOSED, Status.INFECTED]
+            for agent in self.materialized.values()
+        )
+
+    def has_active_agents(self) -> bool:
+        """ 滞在中の EXPOSED / INFECTED が存在するか """
+        if not self.is_compartment_mode:
+            return super().has_active_agents()
+        return self._count_home(Status.EXPOSED) + self._count_home(
+            Status.INFECTED
+        ) > 0 or any(
+            agent.status in [Status.EXPOSED, Status.INFECTED]
+            for agent in self._get_present_visitors()
+        )
+
+    def count_agent(self, status: Status = None) -> int:
+        """ 該当ステータスの滞在者数をカウント """
+        if not self.is_compartment_mode:
+            return super().count_agent(status)
+        visitors = self._get_present_visitors()
+        if status is not None:
+            visitors = [agent for agent in visitors if agent.status == status]
+        return self._count_home(status) + len(visitors)
+
+    def get_average_mental_strength(self) -> float:
+        """ 平均メンタル値を取得（住民はスタビライズポイントの平均値とみなす） """
+        if not self.is_compartment_mode:
+            return super().get_average_mental_strength()
+        loc = self.agent_setting["params"]["mental"][
+            "default_stabilize_point_distribution"
+        ]["loc"]
+        visitors = self._get_present_visitors()
+        total = loc * self._count_home() + sum(
+            agent.mental_strength for agent in visitors
+        )
+        return total / (self._count_home() + len(visitors))
+
+    def get_average_income(self) -> float:
+        """ 平均所得を取得（住民は平均所得の設定値とみなす） """
+        if not self.is_compartment_mode:
+            return super().get_average_income()
+        visitors = self._get_present_visitors()
+        total = self.economy_setting[
+            "agent_avg_income"
+        ] * self._count_home() + sum(agent.income for agent in visitors)
+        return total / (self._count_home() + len(visitors))
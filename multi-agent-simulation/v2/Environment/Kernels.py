@@ -0,0 +1,43 @@
+"""
+エージェントのパラメータ更新のベクトル化カーネル
+    環境に滞在中のエージェントの体力・精神力の更新を NumPy の配列演算で一括して
+    実行する（エージェントごとのメソッド呼び出しを配列演算に置き換える）
+"""
+import numpy as np
+
+
+def update_agent_params(
+    mental: np.ndarray,
+    stabilize_point: np.ndarray,
+    stabilize_scale: np.ndarray,
+    degree_of_freedom: np.ndarray,
+    correction: np.ndarray,
+    physical: np.ndarray,
+    immunity: np.ndarray,
+    infected: np.ndarray,
+    impact: dict,
+    rng=np.random,
+):
+    """ エージェントの精神力・体力を一括して更新
+
+    Agent.update_mental_strength() / Agent.update_physical_strength() を
+    各エージェントに順に適用した場合と同じ分布に従う
+
+    Returns
+    -------
+    (更新後の精神力, 更新後の体力)
+    """
+    # メンタルの更新方向（positive/negative）と更新量（カイ二乗分布）を決定
+    vec = rng.normal(loc=stabilize_point, scale=stabilize_scale)
+    direction = np.where(vec > stabilize_point, 1.0, -1.0)
+    amount = correction * rng.chisquare(df=degree_of_freedom)
+
+    mental = np.clip(mental + direction * amount, -1, 1)
+
+    # 発症者のみ、更新後のメンタルに応じた身体的ダメージを受ける
+    vd_max = impact["max_damage"]
+    vd_min = impact["min_damage"]
+    mf = impact["mental_fluctuation"]
+    damage = -(vd_max - vd_min + mf * mental) * immunity + vd_max
+    physical = np.where(infected, np.maximum(physical - damage, 0), physical)
+    return mental, physical
@@ -0,0 +1,233 @@
+"""
+共有メモリを使用する World 定義
+    エージェントの状態（ステータス・体力・精神力・所得・所在地など）を共有メモリ上の
+    配列に格納し（Agent/SharedAgent.py）、各 Episode の開始時に fork した
+    ワーカープロセスが担当する Environment の1日分のフェーズを並列に実行する
+
+    - エージェントの環境間移動は親プロセスの move_agent() で実行する
+      （所在地・滞在期間は共有メモリ上の値を更新するだけでワーカーに反映される）
+    - 移動処理で追加したグラフのノードのみを差分としてワーカーに送信する
+    - 公務員の給料は所在地をまたいで住民の所得を更新するため親プロセスで実行する
+    - エージェントは同時に1つの環境にのみ滞在するため、各ワーカーが更新する
+      エージェントは重複しない
+
+    fork を使用するため Linux / macOS でのみ動作する
+"""
+import multiprocessing
+import random
+import traceback
+from typing import List
+
+import numpy as np
+from loguru import logger
+
+from Agent.SharedAgent import AgentStateArrays
+from Environment.World import World
+from Simulator.Profiler import Profiler
+
+
+def run_shared_worker(world: World, conn, env_codes: List[int], seed=None):
+    """ ワーカープロセスのメインループ
+
+    fork 時点の World のコピーを保持し、親プロセスから受信した差分を反映して
+    担当する Environment のフェーズを実行する
+    """
+    random.seed(seed)
+    np.random.seed(None if seed is None else seed % 2 ** 32)
+
+    environments = world.get_environments()
+    try:
+        while True:
+            command, payload = conn.recv()
+            if command == "close":
+                break
+            try:
+                result = _step_environments(
+                    world, environments, env_codes, payload
+                )
+            except Exception:
+                conn.send(("error", traceback.format_exc()))
+                raise
+            conn.send(("ok", result))
+    finally:
+        conn.close()
+
+
+def _step_environments(
+    world: World, environments: list, env_codes: List[int], payload: dict
+) -> list:
+    """ 差分を反映し、担当する Environment の1日分のフェーズを実行 """
+    # 移動処理で追加されたノードを反映
+    for code, idx, slot, targets in payload["new_nodes"]:
+        if code in env_codes:
+            agent = world.state.agents[slot]
+            environments[code].add_agent_node(idx, agent, targets)
+
+    results = []
+    for code in env_codes:
+        env = environments[code]
+        env.finance, env.tmp_tax_revenue = payload["finances"][code]
+        env.step(payload["is_waking_up"], pay_salary=False)
+        results.append(
+            (code, env.finance, env.tmp_tax_revenue, env.pop_work_counts())
+        )
+    return results
+
+
+class SharedWorld(World):
+    def __init__(
+        self,
+        infection_model,
+        world_setting: dict,
+        agent_setting: dict,
+        executor_setting: dict,
+    ):
+        env_settings = world_setting["environments"]
+        if world_setting.get("scheduling", "daily") != "daily":
+            raise ValueError(
+                "共有メモリでの並列実行ではイベント方式の状態遷移 "
+                "(scheduling: event) は使用できません"
+            )
+        if world_setting.get("infection_engine", "full") != "full":
+            raise ValueError(
+                "共有メモリでの並列実行ではフロンティア方式の感染判定 "
+                "(infection_engine: frontier) は使用できません"
+            )
+        if any(env.get("model") == "hybrid" for env in env_settings):
+            raise ValueError(
+                "共有メモリでの並列実行ではハイブリッド環境 (model: hybrid) は"
+                "使用できません"
+            )
+
+        self.worker_num = min(
+            executor_setting.get("workers", 2), len(env_settings)
+        )
+        self.seed = executor_setting.get("seed")
+
+        # 全エージェントの状態を格納する共有メモリ
+        self.state = AgentStateArrays(
+            sum(env["population"] for env in env_settings),
+            [env["name"] for env in env_settings],
+        )
+        # ワーカー [(Process, Connection), ...] と担当する Environment
+        self.workers = []
+        self.groups = []
+        # ワーカーを起動した回数（乱数シードの決定に使用）
+        self.generation = 0
+
+        super().__init__(infection_model, world_setting, agent_setting)
+        self._track_new_nodes()
+
+    def get_agent_factory(self):
+        """ 共有メモリ上にエージェントを生成する関数を取得 """
+        return self.state.create_agent
+
+    def _track_new_nodes(self):
+        """ 移動処理で追加したノードの記録を開始 """
+        for env in self.get_environments():
+            env.new_nodes = []
+
+    def reset_environments(self):
+        """ Environment をリセットし、ワーカーを起動し直す """
+        self.stop_workers()
+        self.state.reset()
+        super().reset_environments()
+        self._track_new_nodes()
+        self.start_workers()
+
+    def _split_environments(self) -> List[List[int]]:
+        """ 人口がなるべく均等になるように Environment をワーカーに割り当て """
+        environments = self.get_environments()
+        groups = [[] for _ in range(self.worker_num)]
+        loads = [0] * self.worker_num
+        for code in sorted(
+            range(len(environments)),
+            key=lambda c: environments[c].agent_num,
+            reverse=True,
+        ):
+            idx = loads.index(min(loads))
+            groups[idx].append(code)
+            loads[idx] += environments[code].agent_num
+        return groups
+
+    def start_workers(self):
+        """ 現在の World を fork してワーカーを起動 """
+        context = multiprocessing.get_context("fork")
+        self.groups = self._split_environments()
+        for idx, env_codes in enumerate(self.groups):
+            seed = None
+            if self.seed is not None:
+                seed = self.seed + self.generation * self.worker_num + idx
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=run_shared_worker,
+                args=(self, child_conn, env_codes, seed),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self.workers.append((process, parent_conn))
+        self.generation += 1
+
+    def stop_workers(self):
+        """ ワーカーを終了 """
+        for process, conn in self.workers:
+            try:
+                conn.send(("close", None))
+            except (BrokenPipeError, EOFError):
+                pass
+            conn.close()
+            process.join()
+        self.workers = []
+
+    def step_environments(self, is_waking_up: bool, profiler: Profiler = None):
+        """ 各 Environment の1日分のフェーズをワーカーで並列に実行 """
+        if profiler is None:
+            profiler = Profiler()
+        environments = self.get_environments()
+
+        # 公務員への給料の支給（旅行中の住民の所得も更新するため親で実行）
+        with profiler.phase("salary", self):
+            for env in environments:
+                env.pay_salary_to_public_officials()
+                self.work_counts.update(env.pop_work_counts())
+
+        with profiler.phase("shared_step", self):
+            self._dispatch_step(environments, is_waking_up)
+
+    def _dispatch_step(self, environments: list, is_waking_up: bool):
+        """ ワーカーにフェーズの実行を指示し、結果を反映 """
+        # 移動処理で追加したノードと各環境の経済力を送信
+        new_nodes = []
+        for code, env in enumerate(environments):
+            for idx, agent, targets in env.new_nodes:
+                new_nodes.append((code, idx, agent.slot, targets))
+            env.new_nodes = []
+        payload = {
+            "is_waking_up": is_waking_up,
+            "new_nodes": new_nodes,
+            "finances": [
+                (env.finance, env.tmp_tax_revenue) for env in environments
+            ],
+        }
+        for _, conn in self.workers:
+            conn.send(("step", payload))
+
+        # 各ワーカーの実行結果（経済力・処理件数）を反映
+        for _, conn in self.workers:
+            status, results = conn.recv()
+            if status == "error":
+                raise RuntimeError(
+                    "ワーカーでエラーが発生しました:\n{}".format(results)
+                )
+            for code, finance, tax_revenue, counts in results:
+                environments[code].finance = finance
+                environments[code].tmp_tax_revenue = tax_revenue
+                self.work_counts.update(counts)
+        self.work_counts["nodes_sent"] += len(new_nodes)
+
+    def close(self):
+        """ ワーカーを終了し、共有メモリを解放 """
+        self.stop_workers()
+        self.state.close()
+        logger.info("共有メモリを解放しました。")
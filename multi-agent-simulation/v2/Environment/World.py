@@ -3,6 +3,7 @@ Worldクラス定義
     複数の Environment 間のエージェント移動を実現するためのクラス
 """
 import random
+from collections import Counter
 from typing import List, Tuple
 
 import networkx as nx
@@ -11,6 +12,8 @@ from loguru import logger
 from Agent.Agent import Agent
 from Agent.Status import Status
 from Environment.Environment import Environment
+from Environment.EventCalendar import EventCalendar
+from Environment.HybridEnvironment import HybridEnvironment
 
 
 class World:
@@ -21,6 +24,23 @@ class World:
         self.env_settings = world_setting["environments"]
         self.immigration_settings = world_setting["immigration"]
 
+        # 状態遷移の判定方式
+        #   daily: 全エージェントの遷移を毎日判定
+        #   event: 遷移の発生日をイベントカレンダーで管理
+        self.scheduling = world_setting.get("scheduling", "daily")
+        self.calendar = None
+        if self.scheduling == "event":
+            self.calendar = EventCalendar()
+
+        # 感染判定の対象
+        #   full:     滞在中の全エージェントを毎日判定
+        #   frontier: EXPOSED / INFECTED のエージェントとその隣接ノードのみ判定
+        self.infection_engine = world_setting.get("infection_engine", "full")
+        # World 全体の EXPOSED / INFECTED のエージェント {code: Agent}
+        self.active_agents = None
+        if self.infection_engine == "frontier":
+            self.active_agents = {}
+
         self.agent_setting = agent_setting
 
         # Worldグラフ（各地域をつなぐ完全グラフ）
@@ -28,63 +48,79 @@ class World:
         self.world_graph = nx.complete_graph(self.node_num)
         self.init_world()
 
-        # 全エージェント
-        self.all_agents = 0
-
         # １日あたりの流出者リスト [(流出元の環境名, Agent), ...]
         #   - hometownからの流出者と、hometownへの帰還者の合計値
         #   - move_agent() を実行する度更新される
         self.travelers: List[Tuple[str, Agent]] = []
 
+        # フェーズごとの処理件数（プロファイラが参照する）
+        self.work_counts = Counter()
+
     def init_world(self):
         """ World の初期化 """
         # 各ノードの Environment を初期化
-        self.all_agents = []
         for node in self.world_graph.nodes(data=True):
             idx, data = node
-            env_setting = self.env_settings[idx]
-            data["env"] = Environment(
+            env_setting = dict(self.env_settings[idx])
+            # 環境のモデル
+            #   agent:  エージェントベース
+            #   hybrid: 感染者が閾値を超えるまではコンパートメントモデル
+            model = env_setting.pop("model", "agent")
+            env_class = Environment
+            if model == "hybrid":
+                env_class = HybridEnvironment
+            data["env"] = env_class(
                 infection_model=self.infection_model,
                 agent_setting=self.agent_setting,
+                agent_factory=self.get_agent_factory(),
                 **env_setting
             )
-            agents = data["env"].get_agents()
-            self.all_agents.extend(agents)
+            data["env"].calendar = self.calendar
+            data["env"].active_agents = self.active_agents
         logger.info(
             "Worldクラスを初期化しました。ノード数:{}, 総人口:{}".format(
-                self.node_num, len(self.all_agents)
+                self.node_num,
+                sum(env.agent_num for env in self.get_environments()),
             )
         )
 
+    def get_agent_factory(self):
+        """ Environment がエージェントの生成に使用する関数を取得 """
+        return Agent
+
     def reset_environments(self):
         """ Environment をリセット（各 Episode の最初に実行する想定） """
-        self.all_agents = []
+        if self.calendar is not None:
+            self.calendar.clear()
+        if self.active_agents is not None:
+            self.active_agents.clear()
         for node in self.world_graph.nodes(data=True):
             _, data = node
             data["env"].init_environment()
-            agents = data["env"].get_agents()
-            self.all_agents.extend(agents)
+
+    def get_all_agents(self) -> List[Agent]:
+        """ 全 Environment の住民（旅行中を含む）のリストを取得 """
+        agents = []
+        for env in self.get_environments():
+            agents.extend(env.get_residents())
+        return agents
 
     def forward_time(self):
         """ 時間を進める（滞在期間カウントのデクリメント処理） """
-        for agent in self.all_agents:
+        all_agents = self.get_all_agents()
+        for agent in all_agents:
             agent.stay_period = max(0, agent.stay_period - 1)
+        self.work_counts["agents_processed"] += len(all_agents)
 
     def move_agent(self):
         """ エージェントの Environment 間移動 """
         self.travelers = []
 
         # 流出処理（滞在期間がゼロになったエージェントを帰還させる）
-        for env in self.get_environments():
+        environments = self.get_environments()
+        for env in environments:
             # 滞在日数がゼロになった旅行者を抽出
-            outflow_agents = [
-                data["agent"]
-                for _, data in env.graph.nodes(data=True)
-                if data["agent"].is_stay_in(env.name)
-                and data["agent"].is_living
-                and data["agent"].is_traveler
-                and data["agent"].stay_period == 0
-            ]
+            outflow_agents = env.get_outflow_agents()
             # 帰還可能かを判断（出国審査）
             outflow_agents = self.immigration(
                 [(env.name, agent) for agent in outflow_agents]
@@ -95,14 +131,11 @@ class World:
                 [(env.name, agent) for agent in outflow_agents]
             )
 
-        # 全エージェントからランダムに移動者を決定
-        travelers = [
-            agent
-            for agent in self.all_agents
-            if agent.is_living
-            and not agent.is_traveler
-            and random.random() <= self.flow_rate
-        ]
+        # 各環境の住民からランダムに移動者を決定
+        travelers = []
+        for env in environments:
+            travelers.extend(env.get_departure_agents(self.flow_rate))
+            self.work_counts["agents_processed"] += len(env.get_residents())
 
         # 流出可能なエージェントのみを抽出（出国審査処理）
         travelers = self.immigration(
@@ -115,7 +148,6 @@ class World:
             traveler.current_location = None
 
         # 移動を実行
-        environments = self.get_environments()
         for traveler in travelers:
             # 行先を決定
             destination = random.choice(
@@ -130,12 +162,50 @@ class World:
             # 環境移動を実行
             destination.inflow(traveler, stay_period)
 
-        # 各環境のコードリストを更新
+        # 各環境の移動後の更新処理（コードリストの更新など）
         for env in environments:
-            env.update_code_list()
+            env.after_move()
+
+    def dispatch_events(self):
+        """ 発生日を迎えた状態遷移を、エージェントの滞在先の環境に振り分け
+
+        感染拡大をシミュレートする日に、移動処理の後に実行する想定
+        """
+        if self.calendar is None:
+            return
+        due_agents = self.calendar.advance()
+        environments = {env.name: env for env in self.get_environments()}
+        for agent in due_agents:
+            env = environments.get(agent.current_location)
+            if env is not None:
+                env.due_agents.append(agent)
+        self.work_counts["events_dispatched"] += len(due_agents)
+
+    def step_environments(self, is_waking_up: bool, profiler=None):
+        """ 各 Environment の1日分のフェーズ（経済・感染）を実行 """
+        for env in self.get_environments():
+            env.step(is_waking_up, profiler)
+
+    def import_infections(self, cases: dict):
+        """ 輸入感染者を各 Environment に投入
+
+        cases は {環境名: [(年齢の範囲, 人数), ...]}（CaseSeeder.get_cases()）
+        """
+        for env_name, imports in cases.items():
+            env = self.get_environment(env_name)
+            for age_range, count in imports:
+                imported = env.import_infection(age_range, count)
+                self.work_counts["imported_infections"] += imported
+
+    def is_extinct(self) -> bool:
+        """ World 全体で EXPOSED / INFECTED のエージェントが存在しないか """
+        return not any(
+            env.has_active_cases() for env in self.get_environments()
+        )
 
     def immigration(self, travelers: List[Tuple[str, Agent]]):
         """ 出国時のPCR検査を実施 """
+        self.work_counts["travelers_screened"] += len(travelers)
         travelable_agents = []
         for env_name, agent in travelers:
             env = self.get_environment(env_name)
@@ -187,6 +257,16 @@ class World:
         if level == "infected":
             return agent.status != Status.INFECTED
 
+    def close(self):
+        """ World が使用する資源を解放（シミュレーション終了時に実行する想定） """
+        pass
+
+    def pop_work_counts(self) -> Counter:
+        """ 前回の取得以降の処理件数を取得してリセット """
+        counts = self.work_counts
+        self.work_counts = Counter()
+        return counts
+
     def get_environments(self) -> List[Environment]:
         """ Environment のリストを取得 """
         return [node[1]["env"] for node in self.world_graph.nodes(data=True)]
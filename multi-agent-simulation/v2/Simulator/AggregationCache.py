@@ -0,0 +1,79 @@
+"""
+シミュレーション結果の集計キャッシュ
+    Visualizer の各グラフで共通して使う集計値（都市別・全環境合計・割合）を
+    結果データフレームごとに一度だけ計算して使い回すためのクラス
+"""
+import pandas as pd
+
+# 集計キー
+KEY_COLUMNS = ["episode", "day"]
+
+# 集計対象の数値カラム
+VALUE_COLUMNS = [
+    "outflow",
+    "avg_mental",
+    "finance",
+    "tax_revenue",
+    "avg_income",
+    "susceptable",
+    "exposed",
+    "infected",
+    "recovered",
+    "death",
+    "living",
+    "total",
+]
+
+
+class AggregationCache:
+    # 直近に集計した結果（データフレームの同一性でメモ化）
+    _latest = None
+
+    def __init__(self, dataframe: pd.DataFrame):
+        # 集計元のデータフレーム
+        self.source = dataframe
+
+        value_columns = [c for c in VALUE_COLUMNS if c in dataframe.columns]
+
+        # 都市別の系列（数値カラムの型を揃えた上で派生カラムを追加）
+        cities = dataframe[KEY_COLUMNS + ["city"] + value_columns].copy()
+        cities[value_columns] = cities[value_columns].apply(pd.to_numeric)
+        self.cities = self._add_derived_columns(cities)
+
+        # 全環境の合計値 (episode, day) 単位
+        total = cities.groupby(KEY_COLUMNS)[value_columns].sum().reset_index()
+        self.total = self._add_derived_columns(total)
+
+    @classmethod
+    def of(cls, dataframe: pd.DataFrame) -> "AggregationCache":
+        """ dataframe に対応する集計結果を取得（同一オブジェクトなら再利用） """
+        if cls._latest is None or cls._latest.source is not dataframe:
+            cls._latest = cls(dataframe)
+        return cls._latest
+
+    @classmethod
+    def clear(cls):
+        """ キャッシュを破棄 """
+        cls._latest = None
+
+    def get(self, total=False) -> pd.DataFrame:
+        """ 都市別 または 全環境合計 の集計結果を取得 """
+        return self.total if total else self.cities
+
+    @classmethod
+    def infected_column(cls, exposed=False, percentage=False) -> str:
+        """ 感染者グラフで参照するカラム名を取得 """
+        column = "infected_and_exposed" if exposed else "infected"
+        if percentage:
+            column = "{}_rate".format(column)
+        return column
+
+    @classmethod
+    def _add_derived_columns(cls, data: pd.DataFrame) -> pd.DataFrame:
+        """ 潜伏者の合算値と割合のカラムを追加 """
+        data["infected_and_exposed"] = data["infected"] + data["exposed"]
+        data["infected_rate"] = data["infected"] / data["total"]
+        data["infected_and_exposed_rate"] = (
+            data["infected_and_exposed"] / data["total"]
+        )
+        return data
@@ -0,0 +1,145 @@
+"""
+症例データによる感染者の投入
+    クローラーが出力した症例の CSV (output/<コード>_<都道府県>/patients.csv) を
+    確定日・居住地ごとに集計し、シミュレーションの該当日に対応する環境へ
+    輸入感染者として投入するためのクラス
+"""
+import glob
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+# 年代の上限が無い場合 (90 - など) の年齢の上限
+MAX_AGE = 110
+
+# 1日分の投入数 {環境名: [(年齢の範囲（None は年齢を問わない）, 人数), ...]}
+DailyCases = Dict[str, List[Tuple[Tuple[int, int], int]]]
+
+
+def parse_age_range(age: str) -> Tuple[int, int]:
+    """ 年代の文字列（例: 20 - 29, 90 -）を年齢の範囲に変換
+
+    非公表・NA など年齢の範囲に変換できない場合は None を返す
+    """
+    parts = [part.strip() for part in str(age).split("-")]
+    if len(parts) != 2 or not parts[0].isdigit():
+        return None
+    upper = int(parts[1]) if parts[1].isdigit() else MAX_AGE
+    return int(parts[0]), upper
+
+
+class CaseSeeder:
+    def __init__(
+        self,
+        paths: List[str],
+        start_date: str,
+        environments: Dict[str, str],
+        scale: float = 1.0,
+    ):
+        # シミュレーションの1日目（ウェイクアップ期間後）に対応する日付
+        self.start_date = pd.Timestamp(start_date)
+        # 居住地・都道府県名から環境名への対応 {居住地: 環境名}
+        self.environments = environments
+        # 症例数に掛ける倍率（実際の人口と環境の人口の比率など）
+        self.scale = scale
+
+        # 日ごとの投入数 {日: {環境名: [(年齢の範囲, 人数), ...]}}
+        #   (1日分の投入数を辞書の参照のみで取得できるよう、読み込み時に集計する)
+        self.cases: Dict[int, DailyCases] = {}
+        # 投入数が存在する最後の日
+        self.last_day = 0
+        self.load(paths)
+
+    @classmethod
+    def from_setting(cls, setting: dict) -> "CaseSeeder":
+        """ 設定情報から作成（無効な場合は None） """
+        setting = setting or {}
+        if not setting.get("enabled", False):
+            return None
+        return cls(
+            paths=setting["paths"],
+            start_date=setting["start_date"],
+            environments=setting["environments"],
+            scale=setting.get("scale", 1.0),
+        )
+
+    def load(self, paths: List[str]):
+        """ 症例の CSV を読み込み、日・環境・年代ごとの症例数に集計 """
+        files = sorted(
+            {path for pattern in paths for path in glob.glob(pattern)}
+        )
+        if not files:
+            logger.warning("症例データが見つかりません: {}".format(paths))
+            return
+
+        data = pd.concat(
+            [pd.read_csv(path, dtype=str) for path in files],
+            ignore_index=True,
+        )
+        # 差分の CSV と重複する症例は最新の記録を残す
+        #   (ファイル名順で patients.csv の後に patients_delta_<日時>.csv が並ぶ)
+        data = data.drop_duplicates(
+            subset=["pref_name", "pref_patient_no"], keep="last"
+        )
+
+        # 居住地 → 都道府県名の順に環境名を対応付け
+        env = data["residence"].map(self.environments)
+        env = env.fillna(data["pref_name"].map(self.environments))
+        fixed_date = pd.to_datetime(
+            data["fixed_date"], format="%Y/%m/%d", errors="coerce"
+        )
+        cases = pd.DataFrame(
+            {
+                "day": (fixed_date - self.start_date).dt.days + 1,
+                "env": env,
+                "age": data["age"].fillna("非公表"),
+            }
+        ).dropna(subset=["day", "env"])
+        cases = cases[cases["day"] >= 1]
+
+        counts = cases.groupby(["day", "env", "age"]).size()
+        for (day, env_name, age), count in counts.items():
+            day = int(day)
+            self.cases.setdefault(day, {}).setdefault(env_name, []).append(
+                (parse_age_range(age), int(count))
+            )
+            self.last_day = max(self.last_day, day)
+
+        logger.info(
+            "症例データを読み込みました。"
+            "ファイル数:{}, 症例数:{}, 投入対象:{}".format(
+                len(files), len(data), len(cases)
+            )
+        )
+
+    def get_env_names(self) -> List[str]:
+        """ 投入先の環境名のリストを取得 """
+        return sorted(set(self.environments.values()))
+
+    def get_cases(self, day: int, rng=np.random) -> DailyCases:
+        """ day 日目の投入数を取得
+
+        scale を掛けた人数の端数は確率的に切り上げる
+        """
+        daily = self.cases.get(day)
+        if not daily:
+            return {}
+        if self.scale == 1.0:
+            return daily
+
+        scaled = {}
+        for env_name, imports in daily.items():
+            for age_range, count in imports:
+                expected = count * self.scale
+                count = int(expected)
+                if rng.random() < expected - count:
+                    count += 1
+                if count > 0:
+                    scaled.setdefault(env_name, []).append((age_range, count))
+        return scaled
+
+    def has_cases_after(self, day: int) -> bool:
+        """ day 日目より後に投入数が存在するか """
+        return day < self.last_day
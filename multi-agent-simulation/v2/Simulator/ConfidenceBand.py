@@ -0,0 +1,128 @@
+"""
+信頼区間バンドの推定クラス
+    seaborn のブートストラップ推定の代わりに、x 値ごとの平均値・解析的な信頼区間・
+    分位点をベクトル演算で算出する（エピソード単位の逐次追加にも対応）
+"""
+from statistics import NormalDist
+from typing import List
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+# 中心線に使用できる集計方法
+ESTIMATORS = ["mean", "median"]
+
+
+class ConfidenceBand:
+    def __init__(self, x, ci: float = 95, quantiles: List[float] = None):
+        # x 軸の値（日付など）
+        self.x = np.asarray(x)
+        # 信頼区間 [%]
+        self.ci = ci
+        # 描画する分位点 (例: [0.05, 0.95])
+        self.quantiles = list(quantiles or [])
+        # 分位点の算出用に保持するサンプルが必要かどうか
+        self.keep_samples = bool(self.quantiles)
+
+        # 逐次更新する統計量（エピソード数・平均値・偏差平方和）
+        self.count = 0
+        self._mean = np.zeros(len(self.x))
+        self._m2 = np.zeros(len(self.x))
+        self._samples = []
+
+    @classmethod
+    def from_frame(
+        cls,
+        data: pd.DataFrame,
+        x: str,
+        y: str,
+        units: str,
+        ci: float = 95,
+        quantiles: List[float] = None,
+        keep_samples: bool = False,
+    ) -> "ConfidenceBand":
+        """ ロングフォーマットのデータフレームからバンドを作成 """
+        matrix = data.pivot_table(index=units, columns=x, values=y)
+        band = cls(matrix.columns, ci=ci, quantiles=quantiles)
+        band.keep_samples = band.keep_samples or keep_samples
+        band.update(matrix.to_numpy(dtype=float))
+        return band
+
+    def update(self, values):
+        """ 値を追加（1次元: 1エピソード分、2次元: エピソード x x値） """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        batch_count = values.shape[0]
+        if batch_count == 0:
+            return
+
+        # 並列版 Welford 法でバッチの統計量を合成
+        batch_mean = values.mean(axis=0)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+        count = self.count + batch_count
+        delta = batch_mean - self._mean
+        self._mean = self._mean + delta * (batch_count / count)
+        correction = delta ** 2 * (self.count * batch_count / count)
+        self._m2 = self._m2 + batch_m2 + correction
+        self.count = count
+
+        if self.keep_samples:
+            self._samples.append(values)
+
+    @property
+    def mean(self) -> np.ndarray:
+        """ 平均値 """
+        return self._mean
+
+    @property
+    def std(self) -> np.ndarray:
+        """ 標本標準偏差 """
+        if self.count < 2:
+            return np.zeros(len(self.x))
+        return np.sqrt(self._m2 / (self.count - 1))
+
+    @property
+    def sem(self) -> np.ndarray:
+        """ 平均値の標準誤差 """
+        if self.count == 0:
+            return np.zeros(len(self.x))
+        return self.std / np.sqrt(self.count)
+
+    def interval(self):
+        """ 正規近似による平均値の信頼区間 (lower, upper) を取得 """
+        z = NormalDist().inv_cdf(0.5 + self.ci / 200)
+        width = z * self.sem
+        return self._mean - width, self._mean + width
+
+    def quantile(self, q: float) -> np.ndarray:
+        """ 分位点を取得 """
+        if not self._samples:
+            raise ValueError("分位点の算出にはサンプルの保持が必要です")
+        return np.quantile(np.vstack(self._samples), q, axis=0)
+
+    def plot(self, label: str = None, color=None, estimator: str = "mean"):
+        """ 中心線と信頼区間・分位点のバンドを描画 """
+        if estimator not in ESTIMATORS:
+            raise ValueError(
+                "estimator には {} のいずれかを指定してください: {}".format(
+                    ESTIMATORS, estimator
+                )
+            )
+        ax = plt.gca()
+        center = self._mean
+        if estimator == "median":
+            center = self.quantile(0.5)
+
+        (line,) = ax.plot(self.x, center, label=label, color=color)
+        color = line.get_color()
+
+        lower, upper = self.interval()
+        ax.fill_between(self.x, lower, upper, color=color, alpha=0.2, lw=0)
+
+        if len(self.quantiles) >= 2:
+            q_lower = self.quantile(min(self.quantiles))
+            q_upper = self.quantile(max(self.quantiles))
+            ax.fill_between(
+                self.x, q_lower, q_upper, color=color, alpha=0.1, lw=0
+            )
+        return line
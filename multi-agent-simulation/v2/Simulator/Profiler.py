@@ -0,0 +1,157 @@
+"""
+シミュレーションのフェーズ別プロファイラ
+    one_epoch の各フェーズの実行時間（wall / CPU）・処理件数・メモリ使用量のピークを
+    エピソード単位で集計する（有効化しない場合は何も計測しない）
+"""
+import cProfile
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+class _NullPhase:
+    """ プロファイラ無効時に使用する何もしないコンテキスト """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class Profiler:
+    def __init__(self, enabled=False, trace_memory=False, cprofile=False):
+        # cProfile の出力を行う場合は計測自体も有効化する
+        self.enabled = enabled or trace_memory or cprofile
+        # フェーズごとのメモリ使用量のピークを計測するか
+        self.trace_memory = trace_memory
+        # フェーズごとに cProfile の統計を取るか
+        self.cprofile = cprofile
+
+        # 計測中のエピソード
+        self.episode = None
+        # 計測中のエピソードのフェーズ別集計値 {phase: {項目: 値}}
+        self.stats = OrderedDict()
+        # 全エピソードの集計結果
+        self.records = []
+        # フェーズ別の cProfile (全エピソード分を累積)
+        self.profiles = OrderedDict()
+
+    @classmethod
+    def from_setting(cls, setting: dict) -> "Profiler":
+        """ 設定情報からプロファイラを作成 """
+        setting = setting or {}
+        return cls(
+            enabled=setting.get("enabled", False),
+            trace_memory=setting.get("trace_memory", False),
+            cprofile=setting.get("cprofile", False),
+        )
+
+    def start_episode(self, episode: int):
+        """ エピソードの計測を開始 """
+        if not self.enabled:
+            return
+        self.episode = episode
+        self.stats = OrderedDict()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def end_episode(self):
+        """ エピソードの計測を終了し、集計結果を記録 """
+        if not self.enabled:
+            return
+        for phase, stat in self.stats.items():
+            record = OrderedDict(episode=self.episode, phase=phase)
+            record.update(stat)
+            self.records.append(record)
+        self.stats = OrderedDict()
+
+    def phase(self, name: str, source=None):
+        """ フェーズを計測するコンテキストを取得
+
+        source に pop_work_counts() を持つオブジェクトを渡した場合、
+        フェーズ終了時にその処理件数をフェーズのカウンタに加算する
+        """
+        if not self.enabled:
+            return _NULL_PHASE
+        return self._measure(name, source)
+
+    @contextmanager
+    def _measure(self, name: str, source):
+        stat = self.stats.setdefault(
+            name,
+            OrderedDict(calls=0, wall_sec=0.0, cpu_sec=0.0),
+        )
+
+        if self.trace_memory:
+            self._reset_memory_peak()
+            base_memory, _ = tracemalloc.get_traced_memory()
+
+        profile = None
+        if self.cprofile:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            stat["wall_sec"] += time.perf_counter() - wall_start
+            stat["cpu_sec"] += time.process_time() - cpu_start
+            stat["calls"] += 1
+
+            if profile is not None:
+                profile.disable()
+
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                peak_kb = max(peak - base_memory, 0) / 1024
+                stat["peak_memory_kb"] = max(
+                    stat.get("peak_memory_kb", 0.0), peak_kb
+                )
+
+            if source is not None:
+                self.count(name, source.pop_work_counts())
+
+    def count(self, phase: str, counts: dict):
+        """ フェーズのカウンタ（処理件数など）を加算 """
+        if not self.enabled or not counts:
+            return
+        stat = self.stats.setdefault(
+            phase,
+            OrderedDict(calls=0, wall_sec=0.0, cpu_sec=0.0),
+        )
+        for key, value in counts.items():
+            stat[key] = stat.get(key, 0) + value
+
+    def get_dataframe(self) -> pd.DataFrame:
+        """ 全エピソードの集計結果をデータフレームとして取得 """
+        return pd.DataFrame(self.records)
+
+    def output(self, path: str):
+        """ 集計結果を CSV ファイルに出力 """
+        self.get_dataframe().to_csv(path, index=False)
+
+    def dump_cprofile(self, directory: str):
+        """ フェーズ別の cProfile の統計を directory に出力 """
+        os.makedirs(directory, exist_ok=True)
+        for phase, profile in self.profiles.items():
+            path = os.path.join(directory, "{}.prof".format(phase))
+            profile.dump_stats(path)
+
+    def _reset_memory_peak(self):
+        """ メモリ使用量のピークをリセット """
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        else:
+            # Python 3.8 以前は計測を再開してピークをリセット
+            tracemalloc.stop()
+            tracemalloc.start()
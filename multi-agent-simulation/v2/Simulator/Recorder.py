@@ -1,6 +1,8 @@
 """
 シミュレーションデータの記録クラス
 """
+from typing import Dict, Tuple
+
 import pandas as pd
 
 
@@ -79,6 +81,25 @@ class Recorder:
         }
         self.dataframe = self.dataframe.append(data, ignore_index=True)
 
+    def get_status_counts(
+        self, episode: int, day: int
+    ) -> Dict[str, Tuple[int, int, int, int, int]]:
+        """ episode の day 日目の都市ごとの状態別人数を取得します
+
+        Returns
+        -------
+        {city: (s, e, i, r, d)}
+        """
+        df = self.dataframe
+        last = df[(df["episode"] == episode) & (df["day"] == day)]
+        columns = ["susceptable", "exposed", "infected", "recovered", "death"]
+        return {
+            city: tuple(int(value) for value in values)
+            for city, *values in last[["city"] + columns].itertuples(
+                index=False
+            )
+        }
+
     def get_dataframe(self) -> pd.DataFrame:
         """ データフレームを取得します """
         return self.dataframe
@@ -13,9 +13,13 @@ from loguru import logger
 from tqdm import tqdm
 
 from Agent.Status import Status
+from Environment.DistributedWorld import DistributedWorld
+from Environment.SharedWorld import SharedWorld
 from Environment.World import World
 from Environment.Environment import Environment
+from Simulator.CaseSeeder import CaseSeeder
 from Simulator.InfectionModel import InfectionModel
+from Simulator.Profiler import Profiler
 from Simulator.Recorder import Recorder
 from Simulator.Visualizer import Visualizer
 
@@ -32,17 +36,75 @@ class Simulator:
         infection_setting: dict,
     ):
         self.setting = simulation_setting
-        self.world = World(
-            InfectionModel(**infection_setting), world_setting, agent_setting
-        )
+
+        # 分散実行（Environment をワーカープロセスで実行）するかどうか
+        distributed_setting = simulation_setting.get("distributed") or {}
+        self.is_distributed = distributed_setting.get("enabled", False)
+        # 各 Environment のフェーズの実行方式
+        #   serial:        1プロセスで順に実行
+        #   shared_memory: エージェントの状態を共有メモリに置き、fork した
+        #                  ワーカープロセスで並列に実行
+        executor_setting = simulation_setting.get("executor") or {}
+        executor_type = executor_setting.get("type", "serial")
+        if self.is_distributed:
+            self.world = DistributedWorld(
+                infection_setting,
+                world_setting,
+                agent_setting,
+                distributed_setting,
+            )
+        elif executor_type == "shared_memory":
+            self.world = SharedWorld(
+                InfectionModel(**infection_setting),
+                world_setting,
+                agent_setting,
+                executor_setting,
+            )
+        else:
+            self.world = World(
+                InfectionModel(**infection_setting),
+                world_setting,
+                agent_setting,
+            )
 
         self.recorder = Recorder()
+        self.profiler = Profiler.from_setting(
+            simulation_setting.get("profile")
+        )
+
+        # 症例データによる輸入感染者の投入（無効な場合は None）
+        self.case_seeder = CaseSeeder.from_setting(
+            simulation_setting.get("case_seeding")
+        )
+        if self.case_seeder is not None:
+            if self.is_distributed:
+                raise ValueError(
+                    "分散実行では症例データによる感染者の投入 (case_seeding) は"
+                    "使用できません"
+                )
+            env_names = [env["name"] for env in world_setting["environments"]]
+            unknown = set(self.case_seeder.get_env_names()) - set(env_names)
+            if unknown:
+                raise ValueError(
+                    "case_seeding の投入先の環境が存在しません: {}".format(
+                        sorted(unknown)
+                    )
+                )
 
     def run(self):
         """ シミュレーションを実行 """
         self.clear_output_dirs()
 
-        # シミュレーションを実行
+        try:
+            self.run_episodes()
+        finally:
+            self.world.close()
+
+        # 結果出力
+        self.output_results()
+
+    def run_episodes(self):
+        """ 全エピソードのシミュレーションを実行 """
         for episode in range(self.setting["episode"]):
             logger.info(
                 "Episode {} を開始します。days={} (+ wake up {})".format(
@@ -52,6 +114,7 @@ class Simulator:
                 )
             )
             self.world.reset_environments()
+            self.profiler.start_episode(episode)
 
             days = self.setting["days"] + self.setting["wake_up"]
             with tqdm(range(days)) as pbar:
@@ -64,50 +127,110 @@ class Simulator:
                         pbar.colour = "white"
 
                     # エポック実行
-                    self.one_epoch(is_waking_up=is_waking_up)
+                    record_day = (day - self.setting["wake_up"]) + 1
+                    records = self.one_epoch(
+                        is_waking_up=is_waking_up, day=record_day
+                    )
 
                     # データを記録
                     if self.setting["wake_up_visualize"] or (not is_waking_up):
-                        record_day = (day - self.setting["wake_up"]) + 1
-                        for env in self.world.get_environments():
-                            self.save_record(episode, record_day, env)
+                        with self.profiler.phase("save_record"):
+                            if self.is_distributed:
+                                for record in records:
+                                    self.recorder.add_record(
+                                        episode, record_day, *record
+                                    )
+                            else:
+                                for env in self.world.get_environments():
+                                    self.save_record(episode, record_day, env)
+
+                    # 感染が終息した場合は残りの日数を早送り
+                    if (
+                        self.setting.get("fast_forward_extinction", False)
+                        and not is_waking_up
+                        and self.world.is_extinct()
+                        and not (
+                            self.case_seeder is not None
+                            and self.case_seeder.has_cases_after(record_day)
+                        )
+                    ):
+                        self.fast_forward(episode, record_day, days - day - 1)
+                        break
+            self.profiler.end_episode()
             self.print_agent_status_count()
 
-        # 結果出力
-        self.output_results()
+    def one_epoch(self, is_waking_up=False, day: int = None):
+        """ 1回のエポックを実行
+
+        day はウェイクアップ期間後を1日目とする日（症例データの投入に使用）
+        分散実行時は各環境の記録値 (Environment.get_record() の値) の
+        リストを返す
+        """
+        profiler = self.profiler
+
+        if self.is_distributed:
+            # 移動・各環境のフェーズをワーカーで実行
+            with profiler.phase("distributed_step", self.world):
+                return self.world.step(is_waking_up)
 
-    def one_epoch(self, is_waking_up=False):
-        """ 1回のエポックを実行 """
         # 全環境の時間経過処理
-        self.world.forward_time()
+        with profiler.phase("forward_time", self.world):
+            self.world.forward_time()
 
         # エージェントの環境間移動
-        self.world.move_agent()
-
-        # 感染シミュレート
-        environments = self.world.get_environments()
-        for env in environments:
-            # 公務員エージェントに給料を支給
-            env.pay_salary_to_public_officials()
-            # 前日の税収を env の経済力に反映
-            env.update_finance()
-            # エージェント間の経済取引を実行
-            env.trade()
-
-            # ウェイクアップ時は感染拡大をシミュレートしない
-            if is_waking_up:
-                continue
-
-            # エージェントの体力値を更新
-            env.update_agents_params()
-            # エージェントの次ステータスを決定
-            env.decide_agents_next_status()
-            # エージェントの状態を更新
-            env.update_agents_status()
+        with profiler.phase("move_agent", self.world):
+            self.world.move_agent()
+
+        # 発生日を迎えた状態遷移を各環境に振り分け（イベント方式の場合のみ）
+        if not is_waking_up:
+            with profiler.phase("dispatch_events", self.world):
+                self.world.dispatch_events()
+
+        # 症例データの輸入感染者を投入
+        if self.case_seeder is not None and not is_waking_up and day:
+            with profiler.phase("import_infections", self.world):
+                self.world.import_infections(self.case_seeder.get_cases(day))
+
+        # 経済・感染シミュレート
+        self.world.step_environments(is_waking_up, profiler)
+
+    def fast_forward(self, episode: int, day: int, days: int):
+        """ 感染が終息したエピソードの残り days 日分を早送り
+
+        感染状態はこれ以上変化しないため、ウェイクアップ期間と同様に感染の
+        フェーズ（体力・精神力の更新を含む）を省略し、時間経過・移動・経済の
+        フェーズのみを実行する。状態別の人数は day 日目の値で固定して記録する
+        """
+        if days <= 0:
+            return
+        statuses = self.recorder.get_status_counts(episode, day)
+        for record_day in range(day + 1, day + days + 1):
+            records = self.one_epoch(is_waking_up=True, day=record_day)
+            with self.profiler.phase("save_record"):
+                if not self.is_distributed:
+                    records = [
+                        env.get_record(
+                            len(self.world.get_travelers(env.name))
+                        )
+                        for env in self.world.get_environments()
+                    ]
+                for record in records:
+                    self.recorder.add_record(
+                        episode, record_day, *record[:6], *statuses[record[0]]
+                    )
+        logger.info(
+            "Episode {} は {} 日目に感染が終息したため、"
+            "残り {} 日の感染のフェーズを省略しました。".format(
+                episode, day, days
+            )
+        )
 
     def output_results(self):
         """ シミュレーションの結果出力 """
-        self.output_simulation_result()
+        # 結果とプロファイルのファイル名に共通の実行日時
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.output_simulation_result(timestamp)
+        self.output_profile(timestamp)
         self.output_infected_chart()
         self.output_population_chart()
         self.output_outflow_chart()
@@ -118,36 +241,25 @@ class Simulator:
 
     def save_record(self, episode: int, day: int, env: Environment):
         """ Recorder にデータを記録 """
-        city = env.name
         travelers = len(self.world.get_travelers(env.name))
-        average_ms = self._get_average_mental_strength(env)
-        finance = self._get_finance(env)
-        tax_revenue = self._get_tax_revenue(env)
-        average_income = self._get_average_income(env)
-        seird = self._get_seird_counts(env)
-        self.recorder.add_record(
-            episode,
-            day,
-            city,
-            travelers,
-            average_ms,
-            finance,
-            tax_revenue,
-            average_income,
-            *seird,
-        )
+        self.recorder.add_record(episode, day, *env.get_record(travelers))
 
     def print_agent_status_count(self):
         """ 各 Environment の状態別エージェント数をログに出力 """
-        environments = self.world.get_environments()
-        for env in environments:
-            s, e, i, r, d = self._get_seird_counts(env)
+        if self.is_distributed:
+            counts = self.world.get_status_counts()
+        else:
+            counts = [
+                (env.name,) + self._get_seird_counts(env)
+                for env in self.world.get_environments()
+            ]
+        for name, s, e, i, r, d in counts:
             total = s + e + i + r + d
             living = s + e + i + r
             logger.info(
                 "{}:\tS:{}\tE:{}\tI:{}\tR:{}\tD:{}\t"
                 "TOTAL:{} (living:{}, {:.1f}%)".format(
-                    "%12s" % env.name.upper(),
+                    "%12s" % name.upper(),
                     s,
                     e,
                     i,
@@ -170,28 +282,13 @@ class Simulator:
         d = env.count_agent(Status.DEATH)
         return s, e, i, r, d
 
-    def _get_average_mental_strength(self, env: Environment) -> float:
-        """ 平均メンタル値を取得 """
-        return env.get_average_mental_strength()
-
-    def _get_finance(self, env: Environment) -> float:
-        """ Environment の経済力を取得 """
-        return env.get_finance()
-
-    def _get_tax_revenue(self, env: Environment) -> float:
-        """ Environment の税収を取得 """
-        return env.get_tax_revenue()
-
-    def _get_average_income(self, env: Environment) -> float:
-        """ 平均所得を取得 """
-        return env.get_average_income()
-
     def clear_output_dirs(self):
         """ 出力ディレクトリをクリア """
         targets = [
             "output/*.csv",
             "output/animations/*.mp4",
             "output/images/*.png",
+            "output/profile/*.prof",
         ]
         for target in targets:
             for path in glob.glob(target):
@@ -207,18 +304,29 @@ class Simulator:
         self.recorder.set_dataframe(data)
         logger.info("シミュレーション結果 {} を読み込みました。".format(filename))
 
-    def output_simulation_result(self):
+    def output_simulation_result(self, timestamp: str):
         """ シミュレーション結果の CSV ファイルを出力 """
         data = self.recorder.get_dataframe()
 
-        filename = "simulation_result_{}.csv".format(
-            datetime.now().strftime("%Y%m%d_%H%M%S")
-        )
+        filename = "simulation_result_{}.csv".format(timestamp)
         logger.info("シミュレーション結果 {} を出力しています...".format(filename))
         path = "output/{}".format(filename)
         data.to_csv(path, index=False)
         logger.info("シミュレーション結果 {} を出力しました。".format(filename))
 
+    def output_profile(self, timestamp: str):
+        """ フェーズ別のプロファイル結果を出力（プロファイラ有効時のみ） """
+        if not self.profiler.enabled:
+            return
+
+        filename = "profile_{}.csv".format(timestamp)
+        self.profiler.output("output/{}".format(filename))
+        logger.info("プロファイル結果 {} を出力しました。".format(filename))
+
+        if self.profiler.cprofile:
+            self.profiler.dump_cprofile("output/profile")
+            logger.info("cProfile の統計を output/profile に出力しました。")
+
     def output_world_graph(self):
         """ World のネットワーク図を出力 """
         pass
@@ -244,7 +352,13 @@ class Simulator:
                 " [%]" if percentage else "",
             )
             Visualizer.output_infected_chart(
-                path, data, exposed, total, percentage, title
+                path,
+                data,
+                exposed,
+                total,
+                percentage,
+                title,
+                quantiles=self.setting.get("band_quantiles"),
             )
 
     def output_population_chart(self):
@@ -269,7 +383,13 @@ class Simulator:
 
         path = "output/images/outflow_aggregated.png"
         title = "outflow (all environments)"
-        Visualizer.output_outflow_chart(path, data, total=True, title=title)
+        Visualizer.output_outflow_chart(
+            path,
+            data,
+            total=True,
+            title=title,
+            quantiles=self.setting.get("band_quantiles"),
+        )
 
     def output_mental_strength_chart(self):
         """ 各都市ごとの平均メンタル値推移グラフを出力 """
@@ -2,12 +2,16 @@
 シミュレーション結果の可視化クラス
 """
 import os
+from typing import List
 
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from loguru import logger
 
+from Simulator.AggregationCache import AggregationCache
+from Simulator.ConfidenceBand import ConfidenceBand
+
 
 class Visualizer:
     @classmethod
@@ -19,24 +23,22 @@ class Visualizer:
         total=False,
         percentage=False,
         title: str = None,
+        quantiles: List[float] = None,
     ):
         """ 感染者の推移に関するグラフを出力 """
         filename = os.path.basename(path)
         logger.info("感染者推移グラフ {} を出力しています...".format(filename))
 
-        data = dataframe.copy()
-        if exposed:
-            data = cls._sum_exposed_to_infected(data)
-        if total:
-            data = cls._aggregate_infected(data)
+        data = AggregationCache.of(dataframe).get(total=total)
+        column = AggregationCache.infected_column(exposed, percentage)
         if percentage:
-            data = cls._percentage(data)
             plt.ylim([0.0, 1.0])
 
         if total:
-            sns.lineplot(data=data, x="day", y="infected")
+            cls._plot_band(data, column, quantiles)
         else:
-            sns.lineplot(data=data, x="day", y="infected", hue="city", ci=None)
+            sns.lineplot(data=data, x="day", y=column, hue="city", ci=None)
+        plt.ylabel("infected")
 
         if title is not None:
             plt.title(title)
@@ -45,22 +47,16 @@ class Visualizer:
         logger.info("感染者推移グラフ {} を出力しました。".format(filename))
 
     @classmethod
-    def _sum_exposed_to_infected(cls, data: pd.DataFrame) -> pd.DataFrame:
-        """ 潜伏者を発症者数に合算 """
-        data["infected"] = data["infected"] + data["exposed"]
-        return data
-
-    @classmethod
-    def _aggregate_infected(cls, data: pd.DataFrame) -> pd.DataFrame:
-        """ 感染者数を合計します """
-        grouped = data.groupby(["episode", "day"]).sum().reset_index()
-        return grouped
-
-    @classmethod
-    def _percentage(cls, data: pd.DataFrame) -> pd.DataFrame:
-        """ infected 数をパーセンテージに切り替えます """
-        data["infected"] = data["infected"] / data["total"]
-        return data
+    def _plot_band(
+        cls, data: pd.DataFrame, y: str, quantiles: List[float] = None
+    ):
+        """ エピソード間の平均値と信頼区間（分位点）バンドを描画 """
+        band = ConfidenceBand.from_frame(
+            data, x="day", y=y, units="episode", quantiles=quantiles
+        )
+        band.plot()
+        plt.xlabel("day")
+        plt.ylabel(y)
 
     @classmethod
     def output_population_chart(
@@ -74,14 +70,11 @@ class Visualizer:
         filename = os.path.basename(path)
         logger.info("人口推移グラフ {} を出力しています...".format(filename))
 
-        data = dataframe.copy()
-        data["population"] = data["total"]
-        if mode == "living":
-            data["population"] = data["living"]
-        if mode == "death":
-            data["population"] = data["death"]
+        data = AggregationCache.of(dataframe).get()
+        column = mode if mode in ["living", "death"] else "total"
 
-        sns.lineplot(data=data, x="day", y="population", hue="city", ci=None)
+        sns.lineplot(data=data, x="day", y=column, hue="city", ci=None)
+        plt.ylabel("population")
         if title is not None:
             plt.title(title)
         plt.savefig(path)
@@ -96,15 +89,15 @@ class Visualizer:
         dataframe: pd.DataFrame,
         total=False,
         title: str = None,
+        quantiles: List[float] = None,
     ):
         """ 流出者グラフを出力 """
         filename = os.path.basename(path)
         logger.info("流出者推移グラフ {} を出力しています...".format(filename))
 
-        data = dataframe.copy()
+        data = AggregationCache.of(dataframe).get(total=total)
         if total:
-            grouped = data.groupby(["episode", "day"]).sum().reset_index()
-            sns.lineplot(data=grouped, x="day", y="outflow")
+            cls._plot_band(data, "outflow", quantiles)
         else:
             sns.lineplot(data=data, x="day", y="outflow", hue="city", ci=None)
 
@@ -123,9 +116,8 @@ class Visualizer:
         filename = os.path.basename(path)
         logger.info("平均メンタル値の推移グラフ {} を出力しています...".format(filename))
 
-        sns.lineplot(
-            data=dataframe, x="day", y="avg_mental", hue="city", ci=None
-        )
+        data = AggregationCache.of(dataframe).get()
+        sns.lineplot(data=data, x="day", y="avg_mental", hue="city", ci=None)
         plt.ylim(-1.0, 1.0)
 
         if title is not None:
@@ -143,7 +135,8 @@ class Visualizer:
         filename = os.path.basename(path)
         logger.info("経済力の推移グラフ {} を出力しています...".format(filename))
 
-        sns.lineplot(data=dataframe, x="day", y="finance", hue="city", ci=None)
+        data = AggregationCache.of(dataframe).get()
+        sns.lineplot(data=data, x="day", y="finance", hue="city", ci=None)
 
         if title is not None:
             plt.title(title)
@@ -160,9 +153,8 @@ class Visualizer:
         filename = os.path.basename(path)
         logger.info("税収の推移グラフ {} を出力しています...".format(filename))
 
-        sns.lineplot(
-            data=dataframe, x="day", y="tax_revenue", hue="city", ci=None
-        )
+        data = AggregationCache.of(dataframe).get()
+        sns.lineplot(data=data, x="day", y="tax_revenue", hue="city", ci=None)
 
         if title is not None:
             plt.title(title)
@@ -179,9 +171,8 @@ class Visualizer:
         filename = os.path.basename(path)
         logger.info("平均所得の推移グラフ {} を出力しています...".format(filename))
 
-        sns.lineplot(
-            data=dataframe, x="day", y="avg_income", hue="city", ci=None
-        )
+        data = AggregationCache.of(dataframe).get()
+        sns.lineplot(data=data, x="day", y="avg_income", hue="city", ci=None)
 
         if title is not None:
             plt.title(title)
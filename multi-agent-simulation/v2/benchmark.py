@@ -0,0 +1,276 @@
+"""
+MASシミュレーターのフェーズ別ベンチマーク
+    総人口ごとに Simulator.one_epoch の各フェーズの処理時間を計測し、JSON で出力する
+
+    計測:
+        python benchmark.py --populations 1000 10000 --days 3 -o bench.json
+    比較:
+        python benchmark.py --compare before.json after.json
+"""
+import argparse
+import copy
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
+import numpy as np
+from loguru import logger
+
+from Simulator.Simulator import Simulator
+from main import (
+    AGENT_SETTING,
+    ENVIRONMENT_SETTING,
+    INFECTION_MODEL_SETTING,
+    SIMULATION_SETTING,
+    read_settings,
+)
+
+# 計測する総人口のデフォルト値
+DEFAULT_POPULATIONS = [1000, 10000, 100000, 1000000]
+
+# World の計測対象フェーズ (フェーズ名, メソッド名)
+WORLD_PHASES = [
+    ("forward_time", "forward_time"),
+    ("move_agent", "move_agent"),
+]
+
+# Environment の計測対象フェーズ (フェーズ名, メソッド名)
+ENVIRONMENT_PHASES = [
+    ("salary", "pay_salary_to_public_officials"),
+    ("finance", "update_finance"),
+    ("trade", "trade"),
+    ("update_agents_params", "update_agents_params"),
+    ("decide_agents_next_status", "decide_agents_next_status"),
+    ("update_agents_status", "update_agents_status"),
+]
+
+
+class PhaseTimer:
+    def __init__(self):
+        # フェーズごとの累積時間 [sec] と呼び出し回数
+        self.elapsed = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def wrap(self, obj, method_name, phase):
+        """ obj のメソッドを計測付きのメソッドに差し替え """
+        method = getattr(obj, method_name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.elapsed[phase] += time.perf_counter() - start
+                self.calls[phase] += 1
+
+        setattr(obj, method_name, timed)
+
+    def get_result(self, days):
+        """ フェーズ別の計測結果を取得 """
+        return OrderedDict(
+            (
+                phase,
+                {
+                    "total_sec": self.elapsed[phase],
+                    "calls": self.calls[phase],
+                    "per_day_sec": self.elapsed[phase] / days,
+                },
+            )
+            for phase in self.elapsed
+        )
+
+
+def scale_world_setting(world_setting: dict, population: int) -> dict:
+    """ 各 Environment の人口比を保ったまま総人口を population に変更 """
+    setting = copy.deepcopy(world_setting)
+    environments = setting["environments"]
+    base_total = sum(env["population"] for env in environments)
+    rate = population / base_total
+    for env in environments:
+        env["population"] = max(
+            env["attach"] + 1, round(env["population"] * rate)
+        )
+        env["init_infection"] = round(env["init_infection"] * rate)
+
+    # 少なくとも1人の初期感染者を配置
+    if sum(env["init_infection"] for env in environments) == 0:
+        environments[0]["init_infection"] = 1
+    return setting
+
+
+def run_benchmark(population: int, days: int, seed: int) -> dict:
+    """ 総人口 population のシミュレーションを days 日分実行して計測 """
+    random.seed(seed)
+    np.random.seed(seed)
+
+    simulation_setting = read_settings(SIMULATION_SETTING)
+    world_setting = scale_world_setting(
+        read_settings(ENVIRONMENT_SETTING), population
+    )
+    agent_setting = read_settings(AGENT_SETTING)
+    infection_setting = read_settings(INFECTION_MODEL_SETTING)
+
+    start = time.perf_counter()
+    simulator = Simulator(
+        simulation_setting, world_setting, agent_setting, infection_setting
+    )
+    simulator.world.reset_environments()
+    setup_sec = time.perf_counter() - start
+
+    timer = PhaseTimer()
+    for phase, method_name in WORLD_PHASES:
+        timer.wrap(simulator.world, method_name, phase)
+    for env in simulator.world.get_environments():
+        for phase, method_name in ENVIRONMENT_PHASES:
+            timer.wrap(env, method_name, phase)
+    timer.wrap(simulator, "save_record", "save_record")
+
+    start = time.perf_counter()
+    for day in range(days):
+        simulator.one_epoch(is_waking_up=False)
+        for env in simulator.world.get_environments():
+            simulator.save_record(0, day + 1, env)
+    run_sec = time.perf_counter() - start
+
+    return OrderedDict(
+        population=population,
+        environments=len(world_setting["environments"]),
+        setup_sec=setup_sec,
+        run_sec=run_sec,
+        per_day_sec=run_sec / days,
+        phases=timer.get_result(days),
+    )
+
+
+def get_commit():
+    """ 現在のコミットハッシュを取得 """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(populations, days, seed, max_seconds):
+    """ 総人口ごとのベンチマークを実行 """
+    results = []
+    exceeded = False
+    for population in populations:
+        if exceeded:
+            # 前段の計測が制限時間を超えた場合、より大きな人口はスキップ
+            logger.info("population={} をスキップします".format(population))
+            results.append(OrderedDict(population=population, skipped=True))
+            continue
+
+        logger.info("population={} の計測を開始します".format(population))
+        result = run_benchmark(population, days, seed)
+        logger.info(
+            "population={} setup:{:.2f}s run:{:.2f}s".format(
+                population, result["setup_sec"], result["run_sec"]
+            )
+        )
+        results.append(result)
+        exceeded = result["setup_sec"] + result["run_sec"] > max_seconds
+
+    return OrderedDict(
+        meta=OrderedDict(
+            version="v2",
+            commit=get_commit(),
+            timestamp=datetime.now().isoformat(),
+            python=platform.python_version(),
+            machine=platform.machine(),
+            days=days,
+            seed=seed,
+        ),
+        results=results,
+    )
+
+
+def compare(base_path, target_path, threshold):
+    """ 2つのベンチマーク結果を比較し、劣化したフェーズがあれば False を返す """
+    with open(base_path, mode="r") as f:
+        base = json.load(f)
+    with open(target_path, mode="r") as f:
+        target = json.load(f)
+
+    base_results = {
+        r["population"]: r for r in base["results"] if not r.get("skipped")
+    }
+    passed = True
+    print(
+        "{:>10} {:>26} {:>12} {:>12} {:>8}".format(
+            "population", "phase", "base[s]", "target[s]", "ratio"
+        )
+    )
+    for result in target["results"]:
+        base_result = base_results.get(result["population"])
+        if result.get("skipped") or base_result is None:
+            continue
+        for phase, values in result["phases"].items():
+            if phase not in base_result["phases"]:
+                continue
+            base_sec = base_result["phases"][phase]["per_day_sec"]
+            target_sec = values["per_day_sec"]
+            ratio = target_sec / base_sec if base_sec > 0 else float("inf")
+            mark = ""
+            if ratio > threshold:
+                mark = " <<"
+                passed = False
+            print(
+                "{:>10} {:>26} {:>12.4f} {:>12.4f} {:>8.2f}{}".format(
+                    result["population"],
+                    phase,
+                    base_sec,
+                    target_sec,
+                    ratio,
+                    mark,
+                )
+            )
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フェーズ別ベンチマーク")
+    parser.add_argument(
+        "--populations", type=int, nargs="+", default=DEFAULT_POPULATIONS
+    )
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=600,
+        help="この秒数を超えた場合、以降の人口の計測をスキップ",
+    )
+    parser.add_argument("-o", "--output", default="benchmark_v2.json")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("BASE", "TARGET"), default=None
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="比較時に劣化とみなす処理時間の比率",
+    )
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        passed = compare(*args.compare, args.threshold)
+        sys.exit(0 if passed else 1)
+
+    report = benchmark(
+        args.populations, args.days, args.seed, args.max_seconds
+    )
+    with open(args.output, mode="w") as f:
+        json.dump(report, f, indent=2)
+    logger.info("ベンチマーク結果 {} を出力しました".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
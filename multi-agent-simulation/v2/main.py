@@ -1,9 +1,11 @@
 """
 MASシミュレーションの実行コード
 """
+import argparse
 import pathlib
 import json
 
+from Environment.DistributedWorld import DEFAULT_AUTHKEY, run_worker
 from Simulator.Simulator import Simulator
 
 SIMULATION_SETTING = "./settings/simulation.json"
@@ -13,17 +15,52 @@ INFECTION_MODEL_SETTING = "./settings/infection-model.json"
 
 
 def main():
+    args = parse_args()
+    if args.worker:
+        # 分散実行のワーカーとしてコーディネーターに接続
+        host, port = args.worker.rsplit(":", 1)
+        run_worker((host, int(port)), args.authkey.encode())
+        return
+
     simulation_setting = read_settings(SIMULATION_SETTING)
     world_setting = read_settings(ENVIRONMENT_SETTING)
     agent_setting = read_settings(AGENT_SETTING)
     infection_setting = read_settings(INFECTION_MODEL_SETTING)
 
+    if args.profile:
+        # フェーズ別の計測に加えて cProfile の統計も出力
+        profile_setting = dict(simulation_setting.get("profile") or {})
+        profile_setting.update(enabled=True, cprofile=True)
+        simulation_setting["profile"] = profile_setting
+
     simulator = Simulator(
         simulation_setting, world_setting, agent_setting, infection_setting
     )
     simulator.run()
 
 
+def parse_args() -> argparse.Namespace:
+    """ コマンドライン引数の読み込み """
+    parser = argparse.ArgumentParser(description="MASシミュレーション")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="フェーズ別のプロファイル結果と cProfile の統計を出力",
+    )
+    parser.add_argument(
+        "--worker",
+        metavar="HOST:PORT",
+        default=None,
+        help="分散実行のワーカーとして HOST:PORT のコーディネーターに接続",
+    )
+    parser.add_argument(
+        "--authkey",
+        default=DEFAULT_AUTHKEY,
+        help="分散実行の認証キー",
+    )
+    return parser.parse_args()
+
+
 def read_settings(path: str) -> dict:
     """ 設定情報の読み込み """
     setting_path = pathlib.Path(path).resolve()